@@ -0,0 +1,368 @@
+"""
+Asyncio engine for talking to GitHub, used by ``gitbot console --engine async``.
+
+It offers asynchronous counterparts of :func:`gitbot.github_issues_bot.fetch_issues`,
+:func:`gitbot.github_issues_bot.fetch_comments` and :func:`gitbot.github_issues_bot.apply_labels`. All requests share
+one connection pool and the number of requests in flight is limited, so a single process can poll many repositories
+without a thread per request. Rule matching itself is the same as in the synchronous engine.
+
+The engine needs aiohttp, which is an optional dependency. Install it with ``pip install gitbot[async]``.
+"""
+import asyncio
+import time
+
+import requests.utils
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from gitbot import github_issues_bot, metrics
+from gitbot.scheduler import priority_of, resource_of
+
+logger = github_issues_bot.logger
+
+
+class AsyncGitHubClient:
+    """
+    Asynchronous GitHub client with a shared connection pool and a limit of concurrent requests.
+
+    Use it as an asynchronous context manager, the connection pool is closed when the context is left.
+
+    Args:
+        token(str): Authentication token for GitHub.
+        concurrency(int): Maximal number of requests in flight.
+        cache(:obj:`gitbot.http_cache.ResponseCache`, optional): If supplied, GET requests are conditional and payloads
+            of ``304 Not Modified`` responses are served from it.
+        scheduler(:obj:`gitbot.scheduler.RateLimitScheduler`, optional): If supplied, every request waits for
+            the scheduler and requests refused because of a rate limit are sent again.
+    """
+
+    max_retries_throttled = 3
+
+    def __init__(self, token, concurrency=100, cache=None, scheduler=None):
+        if aiohttp is None:
+            raise RuntimeError("The async engine needs aiohttp. Install it with: pip install gitbot[async]")
+
+        self.token = token
+        self.concurrency = concurrency
+        self.cache = cache
+        self.scheduler = scheduler
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._session = None
+
+    async def __aenter__(self):
+        self._session = aiohttp.ClientSession(headers={'Authorization': 'token ' + self.token,
+                                                       'User-Agent': 'Python'},
+                                              connector=aiohttp.TCPConnector(limit=self.concurrency))
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._session.close()
+
+    async def request(self, method, url, **kwargs):
+        """
+        Send a request through the scheduler and read the whole response.
+
+        Returns:
+            aiohttp.ClientResponse: Response with its body already read.
+        """
+        async with self._semaphore:
+            attempt = 0
+            while True:
+                waiting_since = time.monotonic()
+                if self.scheduler:
+                    await self.scheduler.acquire_async(priority_of(method, url), resource_of(url))
+                sent_at = time.monotonic()
+                metrics.registry.observe('gitbot_rate_limit_wait_seconds', sent_at - waiting_since)
+
+                try:
+                    async with self._session.request(method, url, **kwargs) as response:
+                        body = await response.read()
+                except aiohttp.ClientError:
+                    metrics.record_request(method, url, 'error', time.monotonic() - sent_at)
+                    raise
+                metrics.record_request(method, url, response.status, time.monotonic() - sent_at)
+
+                if not self.scheduler:
+                    return response
+
+                text = body.decode('utf-8', 'replace') if response.status in (403, 429) else ""
+                attempt += 1
+                if not self.scheduler.update(response.status, response.headers, text) \
+                        or attempt > self.max_retries_throttled:
+                    return response
+
+    async def get_json(self, url, compact=None):
+        """
+        Send a GET request and parse the JSON response.
+
+        Args:
+            url(str): URL to request.
+            compact(callable, optional): Function reducing an element of the payload, a JSON array, to the parts the
+                caller reads. Elements are cached in this form, see :func:`gitbot.streaming.iter_response`.
+
+        Returns:
+            tuple: Parsed payload and the URL of the next page (None if there is none).
+
+        Raises:
+            aiohttp.ClientResponseError: If GitHub answered with an error.
+        """
+        headers = {}
+        key = entry = None
+        if self.cache is not None:
+            key = self.cache.key(url, 'token ' + self.token)
+            entry = self.cache.get(key)
+            if entry and entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry and entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        response = await self.request('GET', url, headers=headers)
+        if response.status == 304 and entry:
+            self.cache.hits += 1
+            return entry['payload'], _next_url(entry.get('link'))
+
+        response.raise_for_status()
+        payload = await response.json(content_type=None)
+
+        if self.cache is not None:
+            self.cache.misses += 1
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+            if etag or last_modified:
+                self.cache.put(key, {
+                    'etag': etag,
+                    'last_modified': last_modified,
+                    'link': response.headers.get('Link'),
+                    'status': response.status,
+                    'payload': [compact(element) for element in payload] if compact else payload,
+                })
+
+        return payload, _next_url(response.headers.get('Link'))
+
+    async def fetch_issues(self, repository, state, polling_state=None):
+        """
+        Asynchronous counterpart of :func:`gitbot.github_issues_bot.fetch_issues`, an asynchronous generator of issues.
+        """
+        get_url = github_issues_bot.fetch_issues_url.format(repository, state) + '&per_page={}'.format(
+            github_issues_bot.issues_per_page)
+
+        since = polling_state.get(repository, state) if polling_state else None
+        if since:
+            get_url += '&since={}'.format(since)
+        newest = since
+
+        while get_url:
+            logger.info("Fetching issues: {}".format(get_url))
+
+            try:
+                payload, get_url = await self.get_json(get_url, github_issues_bot.Issue.compact)
+            except aiohttp.ClientResponseError as e:
+                logger.error("A HTTP error occurred when fetching issues. Code: {}\nFull error: {}".format(e.status, e))
+                return
+            except aiohttp.ClientError as e:
+                logger.error("Could not establish connection with GitHub. Full error: {}".format(e))
+                return
+
+            for issue_json in payload:
+                issue = github_issues_bot.Issue.parse(issue_json, repository)
+                if issue and issue.updated_at and (not newest or issue.updated_at > newest):
+                    newest = issue.updated_at
+                yield issue
+
+        if polling_state and newest:
+            polling_state.update(repository, state, newest)
+
+    async def fetch_comments(self, issue):
+        """
+        Asynchronous counterpart of :func:`gitbot.github_issues_bot.fetch_comments`.
+        """
+        try:
+            payload, _ = await self.get_json(issue.comments_url, github_issues_bot.compact_comment)
+            return [comment['body'] for comment in payload]
+        except aiohttp.ClientError as e:
+            logger.error("A HTTP error occurred when fetching comments. Full error: {}".format(e))
+            return []
+
+    async def apply_labels(self, issue, labels):
+        """
+        Asynchronous counterpart of :func:`gitbot.github_issues_bot.apply_labels`.
+        """
+        plan = github_issues_bot.plan_labels(issue, labels)
+        if plan is None:
+            return False
+
+        method, data = plan
+        if method == 'POST':
+            url = github_issues_bot.add_labels_url.format(issue.reponame, issue.number)
+        else:
+            url = github_issues_bot.edit_issue_url.format(issue.reponame, issue.number)
+        logger.info("Applying labels {} to issue {}. ".format(labels, issue))
+
+        try:
+            response = await self.request(method, url, json={'labels': data})
+            response.raise_for_status()
+        except aiohttp.ClientError as e:
+            logger.error("A HTTP error occurred when updating an issue. Full error: {}".format(e))
+            github_issues_bot.record_label_write(method, data, False)
+            return False
+
+        issue.labels = dict.fromkeys(labels)
+        github_issues_bot.record_label_write(method, data, True)
+        return True
+
+    async def flush_labels(self, label_batch):
+        """
+        Asynchronous counterpart of :meth:`gitbot.github_issues_bot.LabelBatch.flush`, writes are sent one by one.
+        """
+        written = 0
+        for issue, labels in label_batch.take():
+            if await self.apply_labels(issue, labels):
+                written += 1
+            else:
+                label_batch.failed.append(issue)
+        return written
+
+    async def _flush_and_forget(self, label_batch, state_store, mark=None):
+        written = await self.flush_labels(label_batch)
+        for issue in label_batch.failed:
+            if state_store is not None:
+                state_store.forget(issue)
+            if mark is not None:
+                mark.fail(issue)
+        label_batch.failed = []
+        return written
+
+    async def process_issue(self, issue, default_label="", process_comments=True, process_title=True,
+                            remove_current=False, dry_run=False, label_batch=None):
+        """
+        Asynchronous counterpart of :func:`gitbot.github_issues_bot.process_issue`. Comments are fetched only if some
+        rule did not fit the body or title yet.
+        """
+        started = time.monotonic()
+        rules_to_check = github_issues_bot.rule_set
+        matched = github_issues_bot.match_issue(issue, rules_to_check, process_title)
+
+        if process_comments and github_issues_bot.needs_comments(rules_to_check, matched):
+            comments = github_issues_bot.comment_store.lookup(issue)
+            if comments is None:
+                comments = await self.fetch_comments(issue)
+                github_issues_bot.comment_store.store(issue, comments)
+
+            matched = github_issues_bot.match_comments(comments, rules_to_check, matched)
+
+        labels, all_labels = github_issues_bot.labels_for(issue, rules_to_check, matched, default_label,
+                                                          remove_current)
+
+        if not dry_run and labels:
+            if label_batch is not None:
+                label_batch.add(issue, all_labels)
+            else:
+                await self.apply_labels(issue, all_labels)
+
+        github_issues_bot.record_issue_processed(time.monotonic() - started)
+        return all_labels
+
+    async def process_issues(self, repository, default_label="", skip_labelled=True, process_comments=True,
+                             process_closed_issues=False, process_title=True, remove_current=False,
+                             polling_state=None, state_store=None):
+        """
+        Asynchronous counterpart of :func:`gitbot.github_issues_bot.process_issues`. Issues are processed concurrently,
+        at most ``concurrency`` of them at a time.
+        """
+        repo_logger = github_issues_bot.RepositoryLogger(logger, {'repository': repository})
+        summary = {'processed': 0, 'skipped': 0, 'writes': 0}
+        pending = set()
+        label_batch = github_issues_bot.LabelBatch(repository)
+        digest = github_issues_bot.rule_set.digest(default_label=default_label, process_comments=process_comments,
+                                                   process_title=process_title, remove_current=remove_current)
+        mark = github_issues_bot.PendingMark(polling_state) if polling_state is not None else None
+
+        async def process(issue):
+            try:
+                labels = await self.process_issue(issue, default_label, process_comments, process_title,
+                                                  remove_current, label_batch=label_batch)
+            except Exception:
+                if mark is not None:
+                    mark.fail(issue)
+                raise
+            if state_store is not None:
+                state_store.record(issue, digest, labels)
+
+        state_param = "all" if process_closed_issues else "open"
+
+        async for issue in self.fetch_issues(repository, state_param, mark):
+            repo_logger.debug("Issue: {}".format(issue))
+
+            if skip_labelled and issue.has_labels():
+                repo_logger.info("  -> Skipping issue {} because it has labels and skip_labelled is True.".format(
+                    issue))
+                summary['skipped'] += 1
+                continue
+
+            if state_store is not None and state_store.is_current(issue, digest):
+                repo_logger.debug("  -> Skipping issue {} because it did not change since it was processed.".format(
+                    issue))
+                summary['skipped'] += 1
+                continue
+
+            summary['processed'] += 1
+            if len(label_batch) >= github_issues_bot.issues_per_page:
+                summary['writes'] += await self._flush_and_forget(label_batch, state_store, mark)
+
+            if len(pending) >= self.concurrency:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                _log_failures(repo_logger, done)
+
+            pending.add(asyncio.ensure_future(process(issue)))
+
+        if pending:
+            done, _ = await asyncio.wait(pending)
+            _log_failures(repo_logger, done)
+        summary['writes'] += await self._flush_and_forget(label_batch, state_store, mark)
+        if state_store is not None:
+            state_store.save()
+        if mark is not None:
+            mark.commit()
+
+        repo_logger.info("Done. Processed issues: {processed}, skipped issues: {skipped}, "
+                         "label writes: {writes}.".format(**summary))
+        return summary
+
+
+def _next_url(link_header):
+    for link in requests.utils.parse_header_links(link_header or ""):
+        if link.get('rel') == 'next':
+            return link['url']
+    return None
+
+
+def _log_failures(repo_logger, tasks):
+    for task in tasks:
+        if task.exception():
+            repo_logger.error("Processing of an issue failed: {}".format(task.exception()))
+
+
+async def process_repositories(token, repositories, concurrency=100, **kwargs):
+    """
+    Asynchronous counterpart of :func:`gitbot.github_issues_bot.process_repositories`. All repositories are processed
+    at the same time on one connection pool, with at most ``concurrency`` requests in flight.
+
+    Returns:
+        dict: Summary of the run for each repository, None if processing of the repository failed.
+    """
+    async with AsyncGitHubClient(token, concurrency, github_issues_bot.response_cache,
+                                 github_issues_bot.request_scheduler) as client:
+        results = await asyncio.gather(*[client.process_issues(repository, **kwargs) for repository in repositories],
+                                       return_exceptions=True)
+
+    summaries = {}
+    for repository, result in zip(repositories, results):
+        if isinstance(result, Exception):
+            github_issues_bot.RepositoryLogger(logger, {'repository': repository}).error(
+                "Processing failed: {}".format(result))
+            result = None
+        summaries[repository] = result
+    return summaries
@@ -0,0 +1,141 @@
+"""
+Offline labelling of exported issues, used by ``gitbot batch``.
+
+Issues are read from a JSONL file, one issue per line, in the format of the GitHub API (see Issues_). Comments of
+an issue can be included as a list of comment objects (see Comments_) in place of the ``comments`` count::
+
+    {"url": "...", "comments_url": "...", "number": 1, "title": "...", "body": "...", "labels": [],
+     "repository_url": "https://api.github.com/repos/owner/name", "comments": [{"body": "..."}]}
+
+Every issue is processed exactly like :func:`gitbot.github_issues_bot.process_issue` with ``dry_run=True`` does,
+nothing is sent to GitHub. Proposed labels are written as JSONL, one line per issue, in the order of the input.
+Issues are spread over a pool of processes a window of lines at a time, so the whole input is never held in
+memory.
+
+.. _Issues: https://developer.github.com/v3/issues/
+.. _Comments: https://developer.github.com/v3/issues/comments/
+"""
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+
+from gitbot import github_issues_bot
+
+logger = github_issues_bot.logger
+
+_options = {}
+
+
+def repository_of(issue_json, default=None):
+    """
+    Return the full name of the repository an exported issue belongs to.
+
+    Args:
+        issue_json(dict): Issue in the format of the GitHub API.
+        default(str, optional): Repository to use if the issue does not say.
+
+    Returns:
+        str: Repository name, e.g. ``owner/name``.
+    """
+    repository_url = issue_json.get('repository_url')
+    if repository_url and '/repos/' in repository_url:
+        return repository_url.split('/repos/', 1)[1]
+    return default
+
+
+def label_line(line):
+    """
+    Compute labels of one exported issue with the options set up by :func:`init_worker`.
+
+    Args:
+        line(str): Line of the input file.
+
+    Returns:
+        str: Line of the output file, or None if the line does not hold an issue.
+    """
+    line = line.strip()
+    if not line:
+        return None
+
+    try:
+        issue_json = json.loads(line)
+    except ValueError as e:
+        logger.error("Skipping a line that is not valid JSON: {}".format(e))
+        return None
+
+    comments = issue_json.get('comments')
+    if isinstance(comments, list):
+        issue_json = dict(issue_json, comments=len(comments))
+        comments = [comment.get('body') or "" for comment in comments]
+    else:
+        comments = []
+
+    issue = github_issues_bot.Issue.parse(issue_json, repository_of(issue_json, _options.get('repository')))
+    if issue is None:
+        logger.error("Skipping a line that does not hold an issue.")
+        return None
+
+    labels = github_issues_bot.process_issue(issue, _options.get('default_label', ""),
+                                             _options.get('process_comments', True),
+                                             _options.get('process_title', True),
+                                             _options.get('remove_current', False),
+                                             predef_comments=comments, dry_run=True)
+
+    return json.dumps({'repository': issue.reponame, 'number': issue.number, 'labels': labels})
+
+
+def init_worker(rules_file, level=logging.WARNING, options=None):
+    """
+    Load rules and options in a worker process. Options are the ones of :func:`label_file`.
+    """
+    logger.level = level
+    _options.clear()
+    _options.update(options or {})
+    github_issues_bot.match_guard = _options.get('match_guard')
+    github_issues_bot.init_rules_logic(rules_file)
+
+
+def label_file(input_file, output_file, rules_file, processes=None, chunk_size=256, **options):
+    """
+    Label all issues of an exported JSONL file.
+
+    Args:
+        input_file(file): Open input file.
+        output_file(file): Open output file.
+        rules_file(str): Path to the rules file.
+        processes(int, optional): Number of worker processes. Defaults to the number of CPUs. With 1, issues are
+            labelled in the current process.
+        chunk_size(int): Number of lines sent to a worker at once.
+        **options: ``repository`` (used for issues that do not name theirs), ``default_label``,
+            ``process_comments``, ``process_title`` and ``remove_current``, see
+            :func:`gitbot.github_issues_bot.process_issues`, and ``match_guard``, see
+            :class:`gitbot.github_issues_bot.MatchGuard`.
+
+    Returns:
+        int: Number of labelled issues.
+    """
+    if processes == 1:
+        init_worker(rules_file, logger.level, options)
+        return _write(map(label_line, input_file), output_file)
+
+    processes = processes or os.cpu_count() or 1
+    window = chunk_size * processes * 4
+    count = 0
+    with multiprocessing.Pool(processes, init_worker, (rules_file, logger.level, options)) as pool:
+        # lines are handed out a window at a time, Pool.imap would read the whole input ahead
+        while True:
+            lines = list(itertools.islice(input_file, window))
+            if not lines:
+                return count
+            count += _write(pool.map(label_line, lines, chunk_size), output_file)
+
+
+def _write(results, output_file):
+    count = 0
+    for result in results:
+        if result is not None:
+            output_file.write(result + "\n")
+            count += 1
+    return count
@@ -1,20 +1,49 @@
+import asyncio
+import collections
+import concurrent.futures
 import configparser
+import functools
+import hashlib
+import json
 import logging
 import re
 import os
+import sys
+import threading
 import time
 
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
 import click
 import requests
 import appdirs
 
+try:
+    import re2
+except ImportError:
+    re2 = None
+
+from gitbot import metrics, streaming
+from gitbot.http_cache import ResponseCache, CachingSession
+from gitbot.scheduler import RateLimitScheduler, ScheduledAdapter
+from gitbot.sessions import SessionManager
+from gitbot.state_store import IssueStateStore, state_digest
+
 logging.basicConfig(format="%(asctime)s: %(levelname)s: %(message)s", level=logging.DEBUG, filename="bot.log")
 logger = logging.getLogger(__file__)
 logger.addHandler(logging.StreamHandler())
 
 fetch_issues_url = 'https://api.github.com/repos/{}/issues?state={}'
 edit_issue_url = 'https://api.github.com/repos/{}/issues/{}'
-github_session = None
+add_labels_url = 'https://api.github.com/repos/{}/issues/{}/labels'
+issues_per_page = 100
+github_token = None
+response_cache = None
+request_scheduler = RateLimitScheduler()
+match_guard = None
 rules = []
 
 init_message = """
@@ -31,6 +60,11 @@ Search in comments: {}
 Process closed issues: {}
 Process issue title: {}
 Remove current labels: {}
+Incremental polling: {}
+Skip unchanged issues: {}
+Workers: {}
+Engine: {}
+Backend: {}
 _____________________________________________
 """
 
@@ -115,13 +149,362 @@ class Rule:
             return None
 
 
+class MatchGuard:
+    """
+    Limits of matching texts against rules, so that a crafted issue cannot stall labelling.
+
+    Python's :mod:`re` engine cannot be interrupted in the middle of a search, and a search of a pattern prone to
+    catastrophic backtracking (see :mod:`gitbot.profiling`) may take very long, even on a text of a few dozen
+    characters. The guard limits the damage:
+
+    - Only the first ``max_text_length`` characters of a text are matched.
+    - With the ``re2`` engine, rules are searched with RE2_, whose searches take linear time. It needs the
+      google-re2 package (``pip install gitbot[re2]``). Rules RE2 cannot compile (e.g. with backreferences or
+      lookarounds) are searched with :mod:`re`.
+    - A rule one of whose searches took longer than ``budget`` seconds is logged and skipped from then on, until the
+      rules are loaded again. The budget is checked once a search finished, it does not stop the search. It needs
+      the ``re2`` engine, so that only the rules searched with :mod:`re` as a fallback can overrun it by much.
+
+    .. _RE2: https://github.com/google/re2
+
+    Args:
+        max_text_length(int): Number of characters of a text that are matched. 0 matches whole texts.
+        budget(float): Seconds after which a search makes its rule skipped. 0 disables the budget.
+        engine(str): ``re`` or ``re2``.
+
+    Raises:
+        ValueError: If a budget is given for the ``re`` engine.
+        RuntimeError: If the ``re2`` engine is used, but google-re2 is not installed.
+    """
+
+    def __init__(self, max_text_length=0, budget=0.0, engine='re'):
+        if budget and engine != 're2':
+            raise ValueError("The match budget needs the re2 engine, searches with re cannot be stopped when they "
+                             "exceed it.")
+        if engine == 're2' and re2 is None:
+            raise RuntimeError("The re2 engine needs google-re2. Install it with: pip install gitbot[re2]")
+
+        self.max_text_length = max_text_length
+        self.budget = budget
+        self.engine = engine
+
+    def options(self):
+        """
+        Return the limits of the guard, which may change the rules a text fits.
+
+        Returns:
+            dict: ``max_text_length``, ``budget`` and ``engine``.
+        """
+        return {'max_text_length': self.max_text_length, 'budget': self.budget, 'engine': self.engine}
+
+    def searcher(self, rule):
+        """
+        Return the function searching texts with the regular expression of a rule, using the engine of the guard.
+        """
+        if self.engine == 're2':
+            try:
+                return re2.compile('(?i)' + rule.regex.pattern).search
+            except re2.error as e:
+                logger.warning("Rule {} cannot be searched with re2, re is used: {}".format(rule, e))
+        return rule.regex.search
+
+
+class RuleSet:
+    """
+    Collection of rules matched together, so that a text is not scanned by the regular expression of every rule.
+
+    For every rule, literal text that any match of the rule must contain is derived from its pattern (e.g. ``help``
+    for ``help``, one of ``how``, ``what`` or ``why`` for ``(how|what|why).*\\?``). The text is lowercased once and
+    a rule is searched for with its regular expression only if its literal occurs in the text. Looking up a literal
+    is much cheaper than a case-insensitive regular expression search, so texts are confirmed only against the few
+    rules that may fit. Rules without such a literal (e.g. ``.*``), and rules whose literals are not plain ASCII, are
+    always searched.
+
+    For every rule, the number of searches with its regular expression, the number of matches and the time spent
+    searching are counted in :attr:`searches`, :attr:`matches` and :attr:`seconds`, and exported as metrics. The
+    longest single search is kept in :attr:`max_seconds` (see :mod:`gitbot.profiling`).
+
+    Texts can be matched within the limits of a :class:`MatchGuard`.
+
+    If the kind of a text (e.g. ``title``, ``body`` or ``comment``) is passed to :meth:`matching`, the statistics are
+    also kept per kind of text. :meth:`plan` uses them to order texts of an issue for every rule, see
+    :func:`match_texts`.
+
+    .. testsetup::
+
+       from gitbot.github_issues_bot import Rule, RuleSet
+
+    Usage example:
+       >>> rule_set = RuleSet([Rule("hello", "welcoming"), Rule("hell", "cursing"), Rule("bye", "leaving")])
+       >>> sorted(rule_set.matching("Hello dev!"))
+       [0, 1]
+       >>> rule_set.labels("Hello dev!")
+       ['welcoming', 'cursing']
+       >>> rule_set.matching("Bye, hello.", candidates={1, 2})
+       {1, 2}
+    """
+
+    # all characters matching an ASCII letter case-insensitively, other than its lower and upper case
+    _case_folding = str.maketrans({'İ': 'i', 'ı': 'i', 'ſ': 's', 'K': 'k'})
+
+    # number of texts of every kind a rule has to be tested on before its statistics are used by plan()
+    min_plan_tests = 20
+
+    def __init__(self, rules, guard=None):
+        self.rules = list(rules)
+        self.guard = guard
+        self._literals = [self._required_literals(rule) for rule in self.rules]
+        # search functions of the rules, None for rules skipped because they exceeded the budget of the guard
+        self._searchers = [guard.searcher(rule) if guard else rule.regex.search for rule in self.rules]
+        self.searches = [0] * len(self.rules)
+        self.matches = [0] * len(self.rules)
+        self.seconds = [0.0] * len(self.rules)
+        self.max_seconds = [0.0] * len(self.rules)
+        # kind of text -> [number of texts matched, texts fit and seconds spent searching for every rule]
+        self._kind_stats = {}
+        # order of kinds of texts by length -> number of texts the plan is based on and the plan, see plan()
+        self._plans = {}
+        self._stats_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.rules)
+
+    def digest(self, **options):
+        """
+        Return the :func:`gitbot.state_store.state_digest` of the rules and processing options. The limits of the
+        guard are part of the digest too, as they may change the labels given to issues.
+        """
+        guard = self.guard if self.guard is not None else MatchGuard()
+        return state_digest(self.rules, match_guard=guard.options(), **options)
+
+    @staticmethod
+    def _required_literals(rule):
+        return _pattern_literals(rule.regex.pattern, rule.regex.flags)
+
+    def matching(self, text, candidates=None, kind=None):
+        """
+        Find rules that fit (apply to) the given text.
+
+        Args:
+            text (str): Text for which to test the rules. None (e.g. an issue without body) fits no rule.
+            candidates (:obj:`set` of :obj:`int`, optional): If set, only rules with these indices are tested.
+            kind (str, optional): Kind of the text, e.g. ``body``. If set, statistics of the kind are updated.
+
+        Returns:
+            :obj:`set` of :obj:`int`: Indices of rules that fit the text.
+        """
+        found = set()
+        if text is None:
+            return found
+
+        budget = 0
+        if self.guard is not None:
+            budget = self.guard.budget
+            if self.guard.max_text_length and len(text) > self.guard.max_text_length:
+                text = text[:self.guard.max_text_length]
+
+        if text.isascii():
+            lowered = text.lower()
+        else:
+            lowered = text.translate(self._case_folding).lower()
+
+        indices = range(len(self.rules)) if candidates is None else sorted(candidates)
+        searched = []
+        for index in indices:
+            search = self._searchers[index]
+            if search is None:
+                continue
+            literals = self._literals[index]
+            if literals is not None and not any(literal in lowered for literal in literals):
+                continue
+            started = time.perf_counter()
+            if search(text):
+                found.add(index)
+            seconds = time.perf_counter() - started
+            searched.append((index, seconds))
+            if budget and seconds > budget:
+                self._skip(index, seconds, len(text))
+
+        with self._stats_lock:
+            for index, seconds in searched:
+                self.searches[index] += 1
+                self.seconds[index] += seconds
+                if seconds > self.max_seconds[index]:
+                    self.max_seconds[index] = seconds
+            for index in found:
+                self.matches[index] += 1
+
+            if kind is not None:
+                kind_stats = self._kind_stats.get(kind)
+                if kind_stats is None:
+                    kind_stats = self._kind_stats[kind] = [0, [0] * len(self.rules), [0.0] * len(self.rules)]
+                kind_stats[0] += 1
+                for index in found:
+                    kind_stats[1][index] += 1
+                for index, seconds in searched:
+                    kind_stats[2][index] += seconds
+
+        return found
+
+    def plan(self, texts):
+        """
+        Plan in which order texts are searched with every rule, cheapest first.
+
+        A rule is not searched any more once it fits one of the texts, so for every rule the texts are ordered by the
+        time it took on average to find a match of the rule in a text of their kind - the time spent searching texts of
+        the kind divided by the number of them the rule fit. Texts of kinds the rule never fit come last. Until
+        :attr:`min_plan_tests` texts of every kind were matched, shorter texts are searched first by all rules. The plan
+        is computed again whenever another :attr:`min_plan_tests` texts were matched.
+
+        Args:
+            texts(dict): Texts by their kind, e.g. ``{'title': ..., 'body': ...}``.
+
+        Returns:
+            :obj:`list` of :obj:`tuple`: Pairs of kinds of texts in the order they should be searched and the set of
+            indices of rules that should search them in this order. None instead of a set stands for all rules.
+        """
+        by_length = tuple(sorted(texts, key=lambda kind: len(texts[kind] or "")))
+
+        with self._stats_lock:
+            stats = [self._kind_stats.get(kind) for kind in by_length]
+            if len(by_length) < 2 or any(kind_stats is None or kind_stats[0] < self.min_plan_tests
+                                         for kind_stats in stats):
+                return [(by_length, None)]
+
+            matched_texts = sum(kind_stats[0] for kind_stats in stats)
+            cached = self._plans.get(by_length)
+            if cached is not None and matched_texts - cached[0] < self.min_plan_tests:
+                return cached[1]
+
+            orders = {}
+            for index in range(len(self.rules)):
+                costs = {kind: seconds_spent[index] / fit[index] if fit[index] else float('inf')
+                         for kind, (_, fit, seconds_spent) in zip(by_length, stats)}
+                orders.setdefault(tuple(sorted(by_length, key=costs.get)), set()).add(index)
+            plan = list(orders.items())
+            self._plans[by_length] = (matched_texts, plan)
+            return plan
+
+    def _skip(self, index, seconds, length):
+        rule = self.rules[index]
+        self._searchers[index] = None
+        metrics.registry.inc('gitbot_rule_budget_exceeded_total', label=rule.label, pattern=rule.regex.pattern)
+        logger.error("Rule {} took {:.3f} s to search a text of {} characters, more than the budget of {} s. "
+                     "It is skipped until the rules are loaded again.".format(rule, seconds, length,
+                                                                              self.guard.budget))
+
+    def skipped(self):
+        """
+        Return indices of rules skipped because they exceeded the budget of the guard.
+        """
+        return [index for index, search in enumerate(self._searchers) if search is None]
+
+    def stats(self):
+        """
+        Return a snapshot of the statistics of searches of every rule.
+
+        Returns:
+            :obj:`list` of :obj:`dict`: ``searches``, ``matches``, total ``seconds`` and ``max_seconds`` of the longest
+            search, for every rule in order.
+        """
+        with self._stats_lock:
+            return [{'searches': searches, 'matches': matches, 'seconds': seconds, 'max_seconds': max_seconds}
+                    for searches, matches, seconds, max_seconds in zip(self.searches, self.matches, self.seconds,
+                                                                       self.max_seconds)]
+
+    def labels(self, text):
+        """
+        Find labels of rules that fit the given text, in the order of rules.
+
+        Args:
+            text (str): Text for which to test the rules.
+
+        Returns:
+            :obj:`list` of :obj:`str`: Labels of fitting rules.
+        """
+        return [self.rules[index].label for index in sorted(self.matching(text))]
+
+
+@functools.lru_cache(maxsize=4096)
+def _pattern_literals(pattern, flags):
+    try:
+        literals = _required_literals(sre_parse.parse(pattern, flags))
+    except (re.error, RecursionError):
+        literals = None
+
+    if not literals:
+        logger.debug("  Pattern {} has no required literal, it will be searched in every text.".format(pattern))
+        return None
+    if not all(literal.isascii() for literal in literals):
+        # Case-insensitive matching of non-ASCII characters does not follow str.lower(), e.g. σ, ς and Σ all match
+        # each other, as do µ and μ. Only ASCII letters are matched by a few other characters, see _case_folding.
+        logger.debug("  Pattern {} has non-ASCII literals, it will be searched in every text.".format(pattern))
+        return None
+    return tuple(sorted(set(literal.lower() for literal in literals)))
+
+
+def _required_literals(parsed):
+    """
+    Find literals one of which occurs in every match of a parsed regular expression.
+
+    Args:
+        parsed: Sequence of ``(opcode, argument)`` pairs, as produced by the parser of the :mod:`re` module.
+
+    Returns:
+        :obj:`list` of :obj:`str`: The literals, or None if there are none. The longest candidates are preferred.
+    """
+    candidates = []
+    run = []
+
+    def end_run():
+        if run:
+            candidates.append([''.join(run)])
+            del run[:]
+
+    for op, argument in parsed:
+        if op is sre_parse.LITERAL:
+            run.append(chr(argument))
+            continue
+
+        end_run()
+        if op is sre_parse.SUBPATTERN:
+            sub = _required_literals(argument[-1])
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and argument[0] >= 1:
+            sub = _required_literals(argument[2])
+        elif op is sre_parse.BRANCH:
+            alternatives = [_required_literals(branch) for branch in argument[1]]
+            sub = None if not all(alternatives) else [literal for literals in alternatives for literal in literals]
+        else:
+            sub = None
+
+        if sub:
+            candidates.append(sub)
+    end_run()
+
+    if not candidates:
+        return None
+    return max(candidates, key=lambda literals: min(len(literal) for literal in literals))
+
+
+rule_set = RuleSet(rules)
+
+
 class Issue:
     """
     Class representing an issue on GitHub. It contains information relevant to labelling of the issue, but not all
     the information that GitHub provides.
+
+    Many issues are held at once during sweeps and batch runs, so issues are kept compact. Attributes are stored in
+    slots, labels as a tuple of interned names (the only part of a label that is ever read), and a body that is not
+    plain ASCII is stored encoded as UTF-8 if that takes less memory than the string, it is decoded whenever
+    :attr:`body` is read.
     """
 
-    def __init__(self, url, comments_url, labels, state_open, title, body, number, reponame):
+    __slots__ = ('url', 'comments_url', '_label_names', 'state_open', 'title', '_body', 'number', 'reponame',
+                 'comments_count', 'updated_at')
+
+    def __init__(self, url, comments_url, labels, state_open, title, body, number, reponame, comments_count=None,
+                 updated_at=None):
         self.url = url
         self.comments_url = comments_url
         self.labels = labels
@@ -130,6 +513,34 @@ class Issue:
         self.body = body
         self.number = number
         self.reponame = reponame
+        self.comments_count = comments_count
+        self.updated_at = updated_at
+
+    @property
+    def labels(self):
+        """
+        Labels of the issue as ``{'name': ...}`` dicts, like in GitHub API responses. Labels can be set as such dicts
+        or as names.
+        """
+        return [{'name': name} for name in self._label_names]
+
+    @labels.setter
+    def labels(self, labels):
+        self._label_names = tuple(sys.intern(label['name'] if isinstance(label, dict) else label)
+                                  for label in labels or ())
+
+    @property
+    def body(self):
+        body = self._body
+        return body.decode('utf-8', 'surrogatepass') if isinstance(body, bytes) else body
+
+    @body.setter
+    def body(self, body):
+        if body and not body.isascii():
+            encoded = body.encode('utf-8', 'surrogatepass')
+            if sys.getsizeof(encoded) < sys.getsizeof(body):
+                body = encoded
+        self._body = body
 
     def __str__(self):
         return 'Number #{}, Title: [{}], Body: [{}], URL: {}'.format(self.number,
@@ -138,7 +549,10 @@ class Issue:
                                                                      self.url)
 
     def has_labels(self):
-        return len(self.labels) > 0
+        return len(self._label_names) > 0
+
+    def label_names(self):
+        return list(self._label_names)
 
     @staticmethod
     def parse(json_response, repository):
@@ -165,7 +579,9 @@ class Issue:
            ...    ],
            ...    "body": "This is a body of the issue.",
            ...    "title": "This is a title.",
-           ...    "number": 666
+           ...    "number": 666,
+           ...    "comments": 2,
+           ...    "updated_at": "2016-10-31T17:07:55Z"
            ... }''')
            >>> issue  = Issue.parse(issue_json, "somethingsomething")
            >>> issue.body
@@ -180,6 +596,10 @@ class Issue:
            'https://api.github.com/repos/somethingsomething'
            >>> issue.comments_url
            'https://api.github.com/repos/somethingsomething/comments'
+           >>> issue.comments_count
+           2
+           >>> issue.updated_at
+           '2016-10-31T17:07:55Z'
 
            >>> issue_json = json.loads('''{
            ...    "url": "https://api.github.com/repos/somethingsomething",
@@ -207,6 +627,8 @@ class Issue:
         body = json_response.get("body")
         title = json_response.get("title")
         number = json_response.get("number")
+        comments_count = json_response.get("comments")
+        updated_at = json_response.get("updated_at")
 
         if not url or not comments_url or not title or not number:
             return None
@@ -216,9 +638,272 @@ class Issue:
         else:
             state_open = False
 
-        issue = Issue(url, comments_url, labels, state_open, title, body, number, repository)
+        issue = Issue(url, comments_url, labels, state_open, title, body, number, repository, comments_count,
+                      updated_at)
         return issue
 
+    # fields of an issue in GitHub API responses read by parse()
+    fields = ('url', 'labels', 'comments_url', 'body', 'title', 'number', 'comments', 'updated_at', 'state')
+
+    @staticmethod
+    def compact(json_response):
+        """
+        Reduce an issue from GitHub API response to the fields :meth:`parse` reads, and its labels to their names.
+        Pages of issues are kept in the response cache in this form.
+
+        Args:
+            json_response (json): GitHub API response encoded in a json object, a single issue.
+
+        Returns:
+            dict: The reduced issue, accepted by :meth:`parse`.
+        """
+        compact = {field: json_response.get(field) for field in Issue.fields if field in json_response}
+        if compact.get('labels'):
+            compact['labels'] = [{'name': sys.intern(label['name'])} for label in compact['labels']]
+        return compact
+
+
+def compact_comment(json_response):
+    """
+    Reduce a comment from GitHub API response to its text, the only part of it that is read. Pages of comments are
+    kept in the response cache in this form.
+    """
+    return {'body': json_response['body']}
+
+
+class CommentStore:
+    """
+    Store of issue comments, so that comments of an issue are fetched from GitHub at most once.
+
+    Comments are kept between polling iterations and reused as long as the comment count and the time of the last
+    update of the issue stay the same. If either is unknown, the stored comments are never considered fresh.
+
+    The store holds comments of at most ``max_entries`` issues and evicts those least recently used. It can be shared
+    by threads.
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._comments = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._comments)
+
+    def get(self, issue, session=None):
+        """
+        Return comments of the given issue, fetching them from GitHub only if they are not stored yet or are stale.
+
+        Args:
+            issue(Issue): Issue for which to return comments.
+            session(:obj:`requests.Session`, optional): If supplied, use this session object instead of the internal.
+
+        Returns:
+            :obj:`list` of :obj:`str`: Returns list of strings - contents of comments.
+        """
+        comments = self.lookup(issue)
+        if comments is None:
+            comments = fetch_comments(issue, session)
+            self.store(issue, comments)
+        return comments
+
+    def lookup(self, issue):
+        """
+        Return stored comments of the given issue if they are still fresh, None otherwise. Nothing is fetched.
+        """
+        version = (issue.comments_count, issue.updated_at)
+        with self._lock:
+            stored = self._comments.get(issue.comments_url)
+            if stored and None not in version and stored[0] == version:
+                self._comments.move_to_end(issue.comments_url)
+                self.hits += 1
+                comments = stored[1]
+            else:
+                self.misses += 1
+                comments = None
+
+        if comments is not None:
+            logger.debug("  Using stored comments of issue {}".format(issue.number))
+        return comments
+
+    def store(self, issue, comments):
+        with self._lock:
+            self._comments[issue.comments_url] = ((issue.comments_count, issue.updated_at), comments)
+            self._comments.move_to_end(issue.comments_url)
+            while len(self._comments) > self.max_entries:
+                self._comments.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._comments.clear()
+
+
+comment_store = CommentStore()
+
+
+def hit_ratio(hits, misses):
+    return hits / (hits + misses) if hits + misses else 0.0
+
+
+def collect_metrics():
+    """
+    Collect metrics kept by the rate limit scheduler, the caches and the rule set, see :mod:`gitbot.metrics`.
+    """
+    for resource, rate_limit in sorted(request_scheduler.rate_limits().items()):
+        labels = {'resource': resource}
+        if rate_limit.remaining is not None:
+            yield 'gitbot_rate_limit_remaining', labels, rate_limit.remaining
+        if rate_limit.limit is not None:
+            yield 'gitbot_rate_limit_limit', labels, rate_limit.limit
+        if rate_limit.reset is not None:
+            yield 'gitbot_rate_limit_reset_timestamp_seconds', labels, rate_limit.reset
+
+    if response_cache is not None:
+        yield 'gitbot_response_cache_hits_total', {}, response_cache.hits
+        yield 'gitbot_response_cache_misses_total', {}, response_cache.misses
+        yield 'gitbot_response_cache_hit_ratio', {}, response_cache.hit_ratio()
+
+    yield 'gitbot_comment_store_hits_total', {}, comment_store.hits
+    yield 'gitbot_comment_store_misses_total', {}, comment_store.misses
+    yield 'gitbot_comment_store_hit_ratio', {}, hit_ratio(comment_store.hits, comment_store.misses)
+
+    current = rule_set
+    for index, (rule, stats) in enumerate(zip(current.rules, current.stats())):
+        labels = {'rule': str(index), 'label': rule.label, 'pattern': rule.regex.pattern}
+        yield 'gitbot_rule_searches_total', labels, stats['searches']
+        yield 'gitbot_rule_matches_total', labels, stats['matches']
+        yield 'gitbot_rule_seconds_total', labels, stats['seconds']
+
+
+metrics.registry.add_collector(collect_metrics)
+
+
+class PollingState:
+    """
+    High-water marks of polled repositories - the newest ``updated_at`` of an issue seen in each repository.
+
+    Polling a repository with a known mark only requests issues updated since then. Marks are saved to a small JSON
+    file (if given), so that polling stays incremental even after a restart.
+    """
+
+    def __init__(self, filename=None):
+        self.filename = filename
+        self.marks = {}
+        self._lock = threading.Lock()
+
+        if filename and os.path.exists(filename):
+            try:
+                with open(filename) as f:
+                    self.marks = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning("Could not read polling state file {}, starting from scratch: {}".format(filename, e))
+
+    @staticmethod
+    def _key(repository, state):
+        return "{}?state={}".format(repository, state)
+
+    def get(self, repository, state):
+        """
+        Return the mark of the given repository, or None if it was not polled yet.
+
+        Args:
+            repository(str): Name of the repository.
+            state(str): Issue state the repository is polled for, marks of different states are independent.
+
+        Returns:
+            str: Timestamp in the format used by GitHub, or None.
+        """
+        return self.marks.get(self._key(repository, state))
+
+    def update(self, repository, state, updated_at):
+        """
+        Move the mark of the given repository forward (never back) and save it.
+
+        Args:
+            repository(str): Name of the repository.
+            state(str): Issue state the repository is polled for.
+            updated_at(str): Timestamp in the format used by GitHub, e.g. ``2016-10-31T17:07:55Z``.
+
+        Returns:
+            None
+        """
+        key = self._key(repository, state)
+        with self._lock:
+            if self.marks.get(key) and self.marks[key] >= updated_at:
+                return
+
+            self.marks[key] = updated_at
+            self._save()
+
+    def clear(self):
+        """
+        Forget all marks, so that all issues are fetched again.
+        """
+        with self._lock:
+            self.marks = {}
+            self._save()
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        if not self.filename:
+            return
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.filename)), exist_ok=True)
+        tmp_filename = self.filename + ".tmp"
+        with open(tmp_filename, "w") as f:
+            json.dump(self.marks, f)
+        os.replace(tmp_filename, self.filename)
+
+
+class PendingMark:
+    """
+    Stand-in for a :class:`PollingState` handed to issue fetchers while the fetched issues are processed
+    concurrently. The mark a fetcher moves to is held back until :meth:`commit`, and it is never moved past an issue
+    whose processing failed - GitHub returns issues updated at the mark itself again, so such issues are fetched and
+    processed again in the next poll.
+
+    Args:
+        polling_state(PollingState): The polling state marks are committed to.
+    """
+
+    def __init__(self, polling_state):
+        self.polling_state = polling_state
+        self.failed_at = None
+        self._mark = None
+        self._lock = threading.Lock()
+
+    def get(self, repository, state):
+        return self.polling_state.get(repository, state)
+
+    def update(self, repository, state, updated_at):
+        self._mark = (repository, state, updated_at)
+
+    def fail(self, issue):
+        """
+        Record that processing of an issue failed.
+        """
+        with self._lock:
+            if issue.updated_at and (self.failed_at is None or issue.updated_at < self.failed_at):
+                self.failed_at = issue.updated_at
+
+    def commit(self):
+        """
+        Move the mark of the polling state forward, to the newest issue fetched or to the oldest failed one, whichever
+        is older.
+        """
+        if self._mark is None:
+            return
+
+        repository, state, updated_at = self._mark
+        if self.failed_at is not None:
+            updated_at = min(updated_at, self.failed_at)
+        self.polling_state.update(repository, state, updated_at)
+
 
 def get_config_dir():
     return appdirs.user_config_dir("gitbot", "melkamar")
@@ -232,38 +917,102 @@ def get_pkg_dir():
     return os.path.abspath(os.path.join(os.path.dirname(__file__)))
 
 
-def init_session(token, session=None):
+class RepositoryLogger(logging.LoggerAdapter):
+    """
+    Logger prefixing messages with the name of the repository being processed, so that output of repositories
+    processed concurrently can be told apart.
+    """
+
+    def process(self, msg, kwargs):
+        return "[{}] {}".format(self.extra['repository'], msg), kwargs
+
+
+def create_session(token, pool_size=None):
     """
-    Create an authorized session object for GitHub.
+    Create a new authorized session object for GitHub.
+
+    If the response cache is set up, the session sends conditional requests using it. All requests of the session go
+    through the rate limit scheduler.
 
     Args:
         token(str): Authentication token for GitHub. See Tokens_.
-        session(requests.Session, optional): A session object to be used, if supplied, this method simply
+        pool_size(int, optional): Number of connections kept open by the session. Should be at least the number of
+            threads sharing the session.
+
+    .. _Tokens: https://help.github.com/articles/creating-an-access-token-for-command-line-use/
+
+    Returns:
+        requests.Session: The new session.
+    """
+    if response_cache is not None:
+        session = CachingSession(response_cache)
+    else:
+        session = requests.Session()
+
+    pool_size = pool_size or requests.adapters.DEFAULT_POOLSIZE
+    adapter = ScheduledAdapter(request_scheduler, pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({'Authorization': 'token ' + token, 'User-Agent': 'Python'})
+    return session
+
+
+sessions = SessionManager(create_session)
+
+
+def init_session(token, session=None, pool_size=None):
+    """
+    Select the token used for GitHub requests that are not given a session explicitly.
+
+    Sessions are shared - there is a single session with a pool of keep-alive connections for each token, so calling
+    this method again with the same token is cheap and reuses the existing connections.
+
+    Args:
+        token(str): Authentication token for GitHub. See Tokens_.
+        session(requests.Session, optional): A session object to be used for the token, if supplied, this method simply
             sets the internal session object to the one passed in this parameter (instead of creating a new one).
+        pool_size(int, optional): Number of connections kept open by the session. Should be at least the number of
+            threads sharing the session.
 
     .. _Tokens: https://help.github.com/articles/creating-an-access-token-for-command-line-use/
 
-    Returns: None, the session is set internally via a member variable.
+    Returns: None, the token is set internally via a member variable.
     """
-    global github_session
+    global github_token
 
-    if not session:
-        github_session = requests.Session()
+    if session:
+        session.headers.update({'Authorization': 'token ' + token, 'User-Agent': 'Python'})
+        sessions.register(token, session)
     else:
-        github_session = session
+        sessions.get(token, pool_size)
 
-    github_session.headers.update({'Authorization': 'token ' + token, 'User-Agent': 'Python'})
+    github_token = token
+
+
+def current_session():
+    """
+    Return the shared session of the token selected by :func:`init_session()`.
+    """
+    return sessions.get(github_token)
 
 
 def init_rules(filename):
+    """
+    Initialize global rules from a file, falling back to the rules file in the user config dir.
+
+    Returns:
+        str: Path to the file the rules were loaded from.
+    """
     try:
         init_rules_logic(filename)
+        return filename
     except FileNotFoundError as err:
         fn = os.path.join(get_config_dir(), "rules.cfg")
         logger.warn("Rules file {} not found. Will try file in user config dir: {}".format(filename, fn))
         try:
             init_rules_logic(fn)
             logger.warn("... user rules config file found. OK.")
+            return fn
         except FileNotFoundError as err:
             logger.error(
                 "Rules file {} not found either. You need to supply it. "
@@ -273,7 +1022,7 @@ def init_rules(filename):
 
 def init_rules_logic(filename):
     """
-    Initialize global rules store with rules defined in a file. This method does not handle file existence, permissions
+    Initialize global rules store (and the compiled rule set) with rules defined in a file. This method does not handle file existence, permissions
     etc. That is the responsibility of its caller.
 
     Args:
@@ -283,28 +1032,154 @@ def init_rules_logic(filename):
         None.
 
     """
-    global rules
-    rules = []
+    with open(filename) as f:
+        new_rules = parse_rules(f)
+
+    swap_rules(new_rules, RuleSet(new_rules, match_guard))
+
+
+def parse_rules(lines):
+    """
+    Parse rules from lines of a rules file.
+
+    Args:
+        lines(iterable of str): Lines of the rules file.
+
+    Returns:
+        :obj:`list` of :obj:`Rule`: The rules.
+
+    Raises:
+        re.error: If a regular expression of a rule is invalid.
+    """
+    parsed = []
 
     line_cnt = 0
-    with open(filename) as f:
-        for line in f:
-            line_cnt += 1
+    for line in lines:
+        line_cnt += 1
 
-            if line.startswith("#;"):
-                continue
+        if line.startswith("#;"):
+            continue
 
-            if "=>" not in line:
-                logger.warning(
-                    "Skipping rules config line #{} because it does not contain [=>]:\n    [{}]".format(line_cnt,
-                                                                                                        line.strip()))
-                continue
+        if "=>" not in line:
+            logger.warning(
+                "Skipping rules config line #{} because it does not contain [=>]:\n    [{}]".format(line_cnt,
+                                                                                                    line.strip()))
+            continue
+
+        parsed.append(Rule.parse(line))
+
+    return parsed
 
-            rules.append(Rule.parse(line))
+
+def swap_rules(new_rules, new_rule_set):
+    """
+    Replace the global rules and rule set. Issues being processed keep the rule set they started with.
+    """
+    global rules, rule_set
+    rules, rule_set = new_rules, new_rule_set
+
+
+class RulesManager:
+    """
+    Keeps the global rules in sync with a rules file.
+
+    :meth:`check` compares the modification time and size of the file with the ones seen last time, so checking
+    an unchanged file costs a single ``stat`` call. A changed file is parsed and compiled into a new :class:`RuleSet`
+    aside, and only the finished rule set is swapped in, so issues are never matched against a half-built one. If
+    the new file cannot be parsed, the current rules stay in use.
+
+    The file can be checked on demand (console mode checks it before every iteration) or periodically by a background
+    thread started with :meth:`start` (web mode).
+
+    Args:
+        filename(str): Path to the rules file.
+        loaded(bool): True if the rules of the file are already in use (e.g. loaded by :func:`init_rules`). The file
+            is then parsed again only once it changes.
+    """
+
+    def __init__(self, filename, loaded=False):
+        self.filename = filename
+        self.reloads = 0
+        self._signature = None
+        self._digest = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+        if loaded:
+            self._signature = self._stat()
+            try:
+                with open(self.filename, 'rb') as f:
+                    self._digest = hashlib.sha1(f.read()).hexdigest()
+            except OSError:
+                self._signature = None
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.filename)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def check(self):
+        """
+        Reload the rules if the file changed since the last check.
+
+        Returns:
+            bool: True if new rules were swapped in.
+        """
+        with self._lock:
+            signature = self._stat()
+            if signature is None or signature == self._signature:
+                return False
+
+            try:
+                with open(self.filename, 'rb') as f:
+                    content = f.read()
+            except OSError as e:
+                logger.error("Could not read rules file {}: {}".format(self.filename, e))
+                return False
+
+            self._signature = signature
+            digest = hashlib.sha1(content).hexdigest()
+            if digest == self._digest:
+                return False
+
+            try:
+                new_rules = parse_rules(content.decode('utf-8').splitlines(True))
+                new_rule_set = RuleSet(new_rules, match_guard)
+            except (re.error, UnicodeDecodeError) as e:
+                logger.error("Rules file {} is not valid, keeping the current rules: {}".format(self.filename, e))
+                return False
+
+            swap_rules(new_rules, new_rule_set)
+            if self._digest is not None:
+                logger.warning("Rules file {} changed, {} rules loaded.".format(self.filename, len(new_rules)))
+            self._digest = digest
+            self.reloads += 1
+            return True
+
+    def start(self, interval=1.0):
+        """
+        Check the file every ``interval`` seconds in a background thread. Calling it again does nothing.
+        """
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._watch, args=(interval,), name="rules-manager", daemon=True)
+            self._thread.start()
+
+    def _watch(self, interval):
+        while True:
+            try:
+                self.check()
+            except Exception:
+                logger.exception("Checking the rules file failed.")
+            time.sleep(interval)
 
 
 def process_issues(token, repository, default_label="", skip_labelled=True, process_comments=True,
-                   process_closed_issues=False, process_title=True, remove_current=False):
+                   process_closed_issues=False, process_title=True, remove_current=False, polling_state=None,
+                   executor=None, state_store=None, backend='rest'):
     """
     Main handling logic of app. Processes issues in a given repository with the given settings.
     Parameters correspond to command-line arguments.
@@ -320,65 +1195,308 @@ def process_issues(token, repository, default_label="", skip_labelled=True, proc
         process_closed_issues(bool): If true, issues that are marked as closed will be processed as well as open ones.
         process_title(bool): If true, title of the issue will be processed as well as its body.
         remove_current(bool): If true, all current labels on issues will be removed and replaced by newly added ones.
+        polling_state(PollingState, optional): If set, only issues updated since the last poll of the repository are
+            fetched and processed. The mark of the repository is moved forward once all issues are processed, but not
+            past an issue whose processing or label write failed (see :class:`PendingMark`).
+        executor(:obj:`concurrent.futures.Executor`, optional): If set, issues are processed concurrently on it. At most
+            one page of issues is waiting for processing at a time.
+        state_store(:obj:`gitbot.state_store.IssueStateStore`, optional): If set, issues that did not change since they
+            were processed with the same rules and options are skipped, and processed issues are recorded in it.
+        backend(str): API issues are fetched with, ``rest`` or ``graphql`` (see :mod:`gitbot.graphql`).
+
+    Labels are written in batches (see :class:`LabelBatch`), and only to issues whose labels actually change.
 
     Returns:
-        None.
+        dict: Summary of the run - numbers of ``processed`` and ``skipped`` issues and of label ``writes``.
 
     .. _Issues: https://developer.github.com/v3/issues/
     """
     init_session(token)
 
+    repo_logger = RepositoryLogger(logger, {'repository': repository})
+    summary = {'processed': 0, 'skipped': 0, 'writes': 0}
+    pending = set()
+    label_batch = LabelBatch(repository)
+    digest = rule_set.digest(default_label=default_label, process_comments=process_comments,
+                             process_title=process_title, remove_current=remove_current)
+    mark = PendingMark(polling_state) if polling_state is not None else None
+
+    def process(issue):
+        try:
+            labels = process_issue(issue, default_label, process_comments, process_title, remove_current,
+                                   label_batch=label_batch)
+        except Exception:
+            if mark is not None:
+                mark.fail(issue)
+            raise
+        if state_store is not None:
+            state_store.record(issue, digest, labels)
+
     if process_closed_issues:
         state_param = "all"
     else:
         state_param = "open"
 
-    issues = fetch_issues(repository, state_param)
+    if backend == 'graphql':
+        from gitbot import graphql
+        issues = graphql.fetch_issues(repository, state_param, polling_state=mark,
+                                      comments=graphql.comments_per_issue if process_comments else 0)
+    else:
+        issues = fetch_issues(repository, state_param, polling_state=mark)
 
     for issue in issues:
-        logger.debug("Issue: {}".format(issue))
+        repo_logger.debug("Issue: {}".format(issue))
 
         if skip_labelled and issue.has_labels():
-            logger.info("  -> Skipping issue {} because it has labels and skip_labelled is True.".format(issue))
+            repo_logger.info("  -> Skipping issue {} because it has labels and skip_labelled is True.".format(issue))
+            summary['skipped'] += 1
+            continue
+
+        if state_store is not None and state_store.is_current(issue, digest):
+            repo_logger.debug("  -> Skipping issue {} because it did not change since it was processed.".format(issue))
+            summary['skipped'] += 1
+            continue
+
+        summary['processed'] += 1
+        if len(label_batch) >= issues_per_page:
+            summary['writes'] += _flush_labels(label_batch, state_store, mark)
+
+        if not executor:
+            process(issue)
             continue
 
-        process_issue(issue, default_label, process_comments, process_title, remove_current)
+        if len(pending) >= issues_per_page:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            _log_failures(repo_logger, done)
+
+        pending.add(executor.submit(process, issue))
+
+    _log_failures(repo_logger, concurrent.futures.wait(pending).done)
+    summary['writes'] += _flush_labels(label_batch, state_store, mark)
+    if state_store is not None:
+        state_store.save()
+    if mark is not None:
+        mark.commit()
+
+    repo_logger.info("Done. Processed issues: {processed}, skipped issues: {skipped}, "
+                     "label writes: {writes}.".format(**summary))
+    return summary
+
+
+def _flush_labels(label_batch, state_store, mark=None):
+    written = label_batch.flush()
+    for issue in label_batch.failed:
+        if state_store is not None:
+            state_store.forget(issue)
+        if mark is not None:
+            mark.fail(issue)
+    label_batch.failed = []
+    return written
 
 
-def apply_labels(issue, labels):
+def _log_failures(repo_logger, futures):
+    for future in futures:
+        if future.exception():
+            repo_logger.error("Processing of an issue failed: {}".format(future.exception()))
+
+
+def process_repositories(token, repositories, workers=1, **kwargs):
     """
-    Apply given labels to an issue on GitHub.
+    Process issues in the given repositories. Keyword arguments are passed to :func:`process_issues()`.
+
+    If more than one worker is requested, repositories, as well as issues inside each of them, are processed
+    concurrently on bounded thread pools. All threads share a single session with a connection pool.
 
     Args:
-        issue(Issue): Issue object to which to apply labels.
-        labels(:obj:`list` of :obj:`str`): List of labels to apply.
+        token(str): GitHub authentication token.
+        repositories(:obj:`list` of :obj:`str`): Names of the repositories to process.
+        workers(int): Maximal number of repositories and of issues processed at the same time.
+
+    Returns:
+        dict: Summary of the run (see :func:`process_issues()`) for each repository. If processing of a repository
+        failed, its summary is None.
+    """
+    init_session(token, pool_size=2 * workers if workers > 1 else None)
+
+    if workers <= 1:
+        return {repository: process_issues(token, repository, **kwargs) for repository in repositories}
+
+    results = {}
+    with concurrent.futures.ThreadPoolExecutor(workers, thread_name_prefix="issues") as issue_executor, \
+            concurrent.futures.ThreadPoolExecutor(min(workers, len(repositories)),
+                                                  thread_name_prefix="repositories") as repo_executor:
+        futures = {repository: repo_executor.submit(process_issues, token, repository, executor=issue_executor,
+                                                    **kwargs)
+                   for repository in repositories}
+
+        for repository, future in futures.items():
+            try:
+                results[repository] = future.result()
+            except Exception as e:
+                RepositoryLogger(logger, {'repository': repository}).error("Processing failed: {}".format(e))
+                results[repository] = None
+
+    return results
+
+
+def plan_labels(issue, labels):
+    """
+    Find the smallest write that gives an issue the desired labels.
+
+    Args:
+        issue(Issue): Issue to be labelled, with its current labels.
+        labels(:obj:`list` of :obj:`str`): All labels the issue should end up with.
 
     Returns:
-        None
+        tuple: ``('POST', added_labels)`` if labels only need to be added (see `Add labels`_), ``('PATCH', labels)``
+        if some current labels need to be removed, or None if the issue already has exactly the desired labels.
 
+    .. _Add labels: https://developer.github.com/v3/issues/labels/#add-labels-to-an-issue
     """
+    current = issue.label_names()
+    desired = list(collections.OrderedDict.fromkeys(labels))
 
-    if not labels:
-        return
+    if set(desired) == set(current):
+        return None
 
-    patchurl = edit_issue_url.format(issue.reponame, issue.number)
+    if set(current) <= set(desired):
+        return 'POST', [label for label in desired if label not in current]
 
-    logger.info("Applying labels {} to issue {}. ".format(labels, issue))
+    return 'PATCH', desired
 
-    logger.debug("  Sending PATCH to {}. Data: {}".format(patchurl, labels))
 
-    data = {'labels': labels}
+def apply_labels(issue, labels, session=None):
+    """
+    Apply given labels to an issue on GitHub. Only the difference to the current labels of the issue is sent, and
+    nothing at all if there is none.
 
+    Args:
+        issue(Issue): Issue object to which to apply labels.
+        labels(:obj:`list` of :obj:`str`): List of all labels the issue should end up with.
+        session(requests.Session, optional): Session to use. If not supplied, the session of the current token is used.
+
+    Returns:
+        bool: True if a request was sent and succeeded.
+    """
+    plan = plan_labels(issue, labels)
+    if plan is None:
+        logger.debug("Issue {} already has labels {}, nothing to write.".format(issue, labels))
+        return False
+
+    method, data = plan
+    if method == 'POST':
+        url = add_labels_url.format(issue.reponame, issue.number)
+    else:
+        url = edit_issue_url.format(issue.reponame, issue.number)
+
+    logger.info("Applying labels {} to issue {}. ".format(labels, issue))
+    logger.debug("  Sending {} to {}. Data: {}".format(method, url, data))
+
+    res = None
     try:
-        res = github_session.patch(patchurl, json=data, headers={"Content-Type": "text/plain"})
+        res = (session or current_session()).request(method, url, json={'labels': data})
         res.raise_for_status()
     except requests.HTTPError:
         logger.error("A HTTP error occurred when updating an issue. Code: {}\nFull error: {}".format(res.status_code,
                                                                                                      res.content))
+        record_label_write(method, data, False)
+        return False
+    except requests.ConnectionError as e:
+        logger.error("Could not establish connection with GitHub. Full error: {}".format(e))
+        record_label_write(method, data, False)
+        return False
+
+    issue.labels = collections.OrderedDict.fromkeys(labels)
+    record_label_write(method, data, True)
+    return True
+
+
+def record_label_write(method, data, succeeded):
+    """
+    Count a label write (see :func:`plan_labels`) in the metrics.
+    """
+    metrics.registry.inc('gitbot_label_writes_total', method=method, result='ok' if succeeded else 'failed')
+    if succeeded:
+        metrics.registry.inc('gitbot_labels_applied_total', len(data))
+
+
+class LabelBatch:
+    """
+    Label writes of one repository, collected while its issues are processed and sent together afterwards.
+
+    Issues whose labels would not change are left out right away. The collected writes are sent one after another
+    from a single thread, as GitHub asks clients to do with writes (see `Secondary limits`_), and they go through
+    the rate limit scheduler of the session with a priority over reads. A later write of the same issue replaces
+    an earlier one that was not sent yet.
+
+    .. _Secondary limits: https://docs.github.com/en/rest/guides/best-practices-for-integrators#dealing-with-secondary-rate-limits
+
+    Args:
+        repository(str): Name of the repository.
+    """
+
+    def __init__(self, repository):
+        self.repository = repository
+        self.failed = []
+        self._writes = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._writes)
+
+    def add(self, issue, labels):
+        """
+        Add a write of the labels of an issue.
+
+        Args:
+            issue(Issue): Issue to be labelled.
+            labels(:obj:`list` of :obj:`str`): All labels the issue should end up with.
+
+        Returns:
+            bool: True if the write was added, False if the labels of the issue would not change.
+        """
+        if plan_labels(issue, labels) is None:
+            return False
+
+        with self._lock:
+            self._writes[issue.number] = (issue, labels)
+        return True
+
+    def take(self):
+        """
+        Remove and return all collected writes.
+
+        Returns:
+            :obj:`list` of :obj:`tuple`: Issues and the labels they should end up with.
+        """
+        with self._lock:
+            writes = list(self._writes.values())
+            self._writes.clear()
+        return writes
+
+    def flush(self, session=None):
+        """
+        Send all collected writes. Issues whose write failed are added to :attr:`failed`.
+
+        Returns:
+            int: Number of writes that were sent successfully.
+        """
+        written = 0
+        for issue, labels in self.take():
+            if apply_labels(issue, labels, session):
+                written += 1
+            else:
+                self.failed.append(issue)
+        return written
+
+
+def _unmatched(rule_set, matched):
+    return set(range(len(rule_set))) - matched
 
 
 def process_issue(issue, default_label="", process_comments=True, process_title=True, remove_current=False,
-                  predef_comments=None, predef_rules=None, dry_run=False):
+                  predef_comments=None, predef_rules=None, dry_run=False, label_batch=None):
     """
     Handle logic of rule matching and labelling of a given issue, including sending a request to GitHub.
 
@@ -417,113 +1535,227 @@ def process_issue(issue, default_label="", process_comments=True, process_title=
         process_comments(bool):
         process_title(bool):
         remove_current(bool):
-        predef_comments(:obj:`list` of :obj:`str`, optional): If set, comments are not fetched from the issue, but instead the ones
-            supplied through this parameter are used. Useful for testing, not much else.
+        predef_comments(:obj:`list` of :obj:`str`, optional): If set (even to an empty list), comments are not fetched
+            from the issue, but instead the ones supplied through this parameter are used. Otherwise comments are taken
+            from the comment store, so that they are fetched at most once per issue.
         predef_rules(:obj:`list` of :obj:`Rule`, optional): If set, rules are not loaded from the rules file, but instead the ones
             supplied through this parameter are used. Useful for testing, not much else.
         dry_run(bool, optional): If true, issue is processed, but nothing is actually pushed to GitHub.
+        label_batch(LabelBatch, optional): If set, labels are not written right away, but added to the batch.
 
     Returns:
         :obj:`list` of :obj:`str`: Returns list of labels newly associated with the issue.
     """
-    labels = []
-
+    started = time.monotonic()
     if predef_rules:
-        rules_list = predef_rules
+        rules_to_check = RuleSet(predef_rules, match_guard)
     else:
-        rules_list = rules
+        rules_to_check = rule_set
 
-    for rule in rules_list:
-        logger.debug("  Checking rule {}".format(rule))
-        new_label = rule.check_fits(issue.body)
+    # title and body are matched first, comments need to be fetched and that should be avoided if possible
+    matched = match_issue(issue, rules_to_check, process_title)
 
-        if not new_label and process_title:
-            new_label = rule.check_fits(issue.title)
+    if process_comments and needs_comments(rules_to_check, matched):
+        # comments are fetched lazily at most once and shared by all rules
+        comments = predef_comments
+        if comments is None:
+            comments = comment_store.get(issue)
+
+        matched = match_comments(comments, rules_to_check, matched)
+
+    labels, all_labels = labels_for(issue, rules_to_check, matched, default_label, remove_current)
+
+    if not dry_run and labels:
+        if label_batch is not None:
+            label_batch.add(issue, all_labels)
+        else:
+            apply_labels(issue, all_labels)
 
-        # try to match anything beside comments first,
-        # comments need to be fetched and that should be avoided if possible
-        if not new_label and process_comments:
-            if not predef_comments:
-                comments = fetch_comments(issue)
+    record_issue_processed(time.monotonic() - started)
+    return all_labels
+
+
+def record_issue_processed(seconds):
+    metrics.registry.inc('gitbot_issues_processed_total')
+    metrics.registry.observe('gitbot_issue_processing_seconds', seconds)
+
+
+def match_issue(issue, rules_to_check, process_title=True):
+    """
+    Find rules that fit the body or (optionally) the title of an issue.
+
+    Args:
+        issue(Issue): Issue to be matched.
+        rules_to_check(RuleSet): Rules to match.
+        process_title(bool): If true, the title is matched as well as the body.
+
+    Returns:
+        :obj:`set` of :obj:`int`: Indices of the fitting rules.
+    """
+    texts = {'body': issue.body}
+    if process_title:
+        texts['title'] = issue.title
+
+    return match_texts(texts, rules_to_check)
+
+
+def match_texts(texts, rules_to_check, matched=()):
+    """
+    Find rules that fit any of the texts. Every rule searches the texts in the order planned by
+    :meth:`RuleSet.plan`, and does not search the remaining texts once it fits one. The result does not depend on
+    the order.
+
+    Args:
+        texts(dict): Texts by their kind, e.g. ``{'title': ..., 'body': ...}``.
+        rules_to_check(RuleSet): Rules to match.
+        matched(:obj:`set` of :obj:`int`): Indices of rules that already matched, they are not checked again.
+
+    Returns:
+        :obj:`set` of :obj:`int`: Indices of all the fitting rules.
+    """
+    matched = set(matched)
+    for kinds, indices in rules_to_check.plan(texts):
+        for kind in kinds:
+            if indices is None:
+                candidates = _unmatched(rules_to_check, matched)
             else:
-                comments = predef_comments
+                candidates = indices - matched
+            if candidates:
+                matched |= rules_to_check.matching(texts[kind], candidates, kind)
 
-            for comment in comments:
-                new_label = rule.check_fits(comment)
-                if new_label:
-                    break
+    return matched
 
-        if new_label:
-            logger.debug("    -> rule matches.")
-            labels.append(new_label)
+
+def needs_comments(rules_to_check, matched):
+    """
+    Check whether comments may change the result, i.e. whether some rules have not matched yet.
+    """
+    return len(matched) < len(rules_to_check)
+
+
+def match_comments(comments, rules_to_check, matched):
+    """
+    Find rules that fit any of the comments, in addition to the already matched ones. Shorter comments are matched
+    first, so that longer ones are searched with as few rules as possible.
+
+    Args:
+        comments(:obj:`list` of :obj:`str`): Texts of comments.
+        rules_to_check(RuleSet): Rules to match.
+        matched(:obj:`set` of :obj:`int`): Indices of rules that already matched, they are not checked again.
+
+    Returns:
+        :obj:`set` of :obj:`int`: Indices of all the fitting rules.
+    """
+    matched = set(matched)
+    for comment in sorted(comments, key=lambda comment: len(comment or "")):
+        if not needs_comments(rules_to_check, matched):
+            break
+        matched |= rules_to_check.matching(comment, _unmatched(rules_to_check, matched), 'comment')
+
+    return matched
+
+
+def labels_for(issue, rules_to_check, matched, default_label="", remove_current=False):
+    """
+    Turn matched rules into labels of an issue.
+
+    Args:
+        issue(Issue): Issue being labelled.
+        rules_to_check(RuleSet): Rules that were matched.
+        matched(:obj:`set` of :obj:`int`): Indices of the fitting rules.
+        default_label(str): Label to use if no rule fits. If empty, no label is used.
+        remove_current(bool): If true, the current labels of the issue are not kept.
+
+    Returns:
+        tuple: List of the new labels and list of all labels the issue should end up with.
+    """
+    labels = []
+    for index in sorted(matched):
+        rule = rules_to_check.rules[index]
+        logger.debug("  Rule {} matches.".format(rule))
+        labels.append(rule.label)
 
     if default_label and not labels:
         logger.warning("No rule matches. Applying default label: {}".format(default_label))
         labels.append(default_label)
 
-    labels_added = len(labels) > 0
     # Init data with the current labels
-    data = {
-        "labels": list(labels)
-    }
+    all_labels = list(labels)
 
     if not remove_current:
-        for label in issue.labels:
-            data['labels'].append(label['name'])
+        all_labels.extend(issue.label_names())
     else:
         logger.warn("Removing original labels from issue {} (Original labels: {})".format(issue, issue.labels))
 
-    if not dry_run and labels_added:
-        apply_labels(issue, labels)
-
-    return data.get('labels')
+    return labels, all_labels
 
 
-def fetch_issues(repository, state, session=None):
+def fetch_issues(repository, state, session=None, polling_state=None):
     """
     Fetches all issues in a repository with the given state.
-    :param repository:
-    :param state:
-    :return: List of Issue objects.
+
+    Issues are fetched page by page, following the ``next`` links sent by GitHub (see Pagination_). The next page is
+    requested only after all issues of the current one were consumed, so only a single page is held in memory and the
+    caller can start processing issues before the last page arrives. Pages are parsed while they are downloaded (see
+    :mod:`gitbot.streaming`), every issue is yielded as soon as it arrives.
+
+    If a polling state is given, only issues updated since its mark are requested. The mark is moved to the newest
+    ``updated_at`` seen only once the last page was fetched without error and all its issues were consumed.
 
     Args:
         repository(str): Name of the repository to fetch.
         state(str): Issues in which states to fetch. Allowed string values: all, open, closed.
         session(:obj:`requests.Session`, optional): If supplied, use this session object instead of the internal.
+        polling_state(PollingState, optional): If supplied, fetch only issues updated since the last poll.
+
+    .. _Pagination: https://developer.github.com/v3/#pagination
 
     Returns:
-        :obj:`list` of :obj:`Issue`: Returns list of Issue objects parsed from the given repository.
+        generator of :obj:`Issue`: Yields Issue objects parsed from the given repository.
 
     """
-    get_url = fetch_issues_url.format(repository, state)
-    logger.info("Fetching issues: {}".format(get_url))
+    if not session:
+        session = current_session()
 
-    try:
-        if not session:
-            response = github_session.get(get_url)
-        else:
-            response = session.get(get_url)
-        response.raise_for_status()
-    except requests.HTTPError:
-        logger.error(
-            "A HTTP error occurred when fetching issues. Code: {}\nFull error: {}".format(response.status_code,
-                                                                                          response.content))
-        return []
-    except requests.ConnectionError as e:
-        logger.error("Could not establish connection with GitHub. Full error: {}".format(e))
-        return []
+    get_url = fetch_issues_url.format(repository, state) + '&per_page={}'.format(issues_per_page)
 
-    issues = []
-    json_res = response.json()
-    for issue in json_res:
-        issues.append(Issue.parse(issue, repository))
+    since = polling_state.get(repository, state) if polling_state else None
+    if since:
+        get_url += '&since={}'.format(since)
+    newest = since
 
-    return issues
+    while get_url:
+        logger.info("Fetching issues: {}".format(get_url))
+
+        try:
+            response = session.get(get_url, stream=True)
+            response.raise_for_status()
+        except requests.HTTPError:
+            logger.error(
+                "A HTTP error occurred when fetching issues. Code: {}\nFull error: {}".format(response.status_code,
+                                                                                              response.content))
+            return
+        except requests.ConnectionError as e:
+            logger.error("Could not establish connection with GitHub. Full error: {}".format(e))
+            return
+
+        with response:
+            for issue_json in streaming.iter_response(response, compact=Issue.compact):
+                issue = Issue.parse(issue_json, repository)
+                if issue and issue.updated_at and (not newest or issue.updated_at > newest):
+                    newest = issue.updated_at
+                yield issue
+
+        get_url = response.links.get('next', {}).get('url')
+
+    if polling_state and newest:
+        polling_state.update(repository, state, newest)
 
 
 def fetch_comments(issue, session=None):
     """
-    Fetches text of all comments of the given issue.
+    Fetches text of all comments of the given issue. Comments are parsed while they are downloaded and only their
+    texts are kept (see :mod:`gitbot.streaming`).
 
     Args:
         issue(Issue): Issue for which to fetch comments.
@@ -534,11 +1766,12 @@ def fetch_comments(issue, session=None):
     """
     try:
         if not session:
-            response = github_session.get(issue.comments_url)
+            response = current_session().get(issue.comments_url, stream=True)
         else:
-            response = session.get(issue.comments_url)
+            response = session.get(issue.comments_url, stream=True)
         response.raise_for_status()
-        return [comment['body'] for comment in response.json()]
+        with response:
+            return [comment['body'] for comment in streaming.iter_response(response, compact=compact_comment)]
     except requests.HTTPError:
         logger.error(
             "A HTTP error occurred when fetching comments. Code: {}\nFull error: {}".format(response.status_code,
@@ -587,6 +1820,44 @@ def log_num_to_level(value):
     }.get(value, logging.WARNING)
 
 
+def init_match_guard(max_text_length=0, budget=0.0, engine='re'):
+    """
+    Set up the guard of rules loaded from now on, see :class:`MatchGuard`. Without any limit, no guard is used.
+
+    Returns:
+        MatchGuard: The guard, or None.
+
+    Raises:
+        click.UsageError: If the limits cannot be combined.
+    """
+    global match_guard
+    if max_text_length or budget or engine != 're':
+        try:
+            match_guard = MatchGuard(max_text_length, budget, engine)
+        except ValueError as e:
+            raise click.UsageError(str(e))
+    else:
+        match_guard = None
+    return match_guard
+
+
+def match_guard_options(command):
+    """
+    Add options of :class:`MatchGuard` to a command.
+    """
+    command = click.option('--regex-engine', 'regex_engine', type=click.Choice(['re', 're2']), default='re',
+                           help="Engine searching texts with rules. re2 takes linear time, but needs google-re2 "
+                                "installed. Defaults to re.")(command)
+    command = click.option('--match-budget', 'match_budget', default=0.0,
+                           help="Seconds after which a search makes its rule logged and skipped until the rules are "
+                                "reloaded. It does not stop the search itself. Needs --regex-engine re2. 0 disables "
+                                "the budget. Defaults to 0.")(command)
+    command = click.option('--max-text-length', 'max_text_length', default=0,
+                           help="Number of characters of a text that are matched against rules. 0 matches whole "
+                                "texts. Defaults to 0.")(command)
+    return command
+
+
 @click.group()
 def main():
     pass
@@ -611,38 +1882,210 @@ def main():
               help="Should issues that are labelled already be skipped? Defaults to true.")
 @click.option('--remove-current/--no-remove-current', 'remove_current', default=False,
               help="Should the current labels on an issue be removed if a rule matches? Defaults to false.")
+@click.option('--incremental/--no-incremental', 'incremental', default=True,
+              help="Should only issues updated since the last check be fetched? Defaults to true.")
+@click.option('--skip-unchanged/--no-skip-unchanged', 'skip_unchanged', default=True,
+              help="Should issues that did not change since they were processed with the same rules be skipped? "
+                   "Defaults to true.")
+@click.option('--cache-size', 'cache_size', default=1000,
+              help="Number of GitHub responses kept for conditional requests. 0 disables the cache. Defaults to 1000.")
+@click.option('--cache-file', 'cache_file', default="",
+              help="File to persist cached GitHub responses to. If empty, the cache is kept in memory only.")
+@click.option('--comment-store-size', 'comment_store_size', default=10000,
+              help="Number of issues whose comments are kept between iterations. Defaults to 10000.")
+@click.option('-w', '--workers', default=1,
+              help="Number of repositories and issues processed concurrently. Defaults to 1.")
+@click.option('--engine', type=click.Choice(['sync', 'async']), default='sync',
+              help="Engine used to talk to GitHub. The async engine needs aiohttp installed. Defaults to sync.")
+@click.option('--concurrency', default=100,
+              help="Maximal number of requests in flight when using the async engine. Defaults to 100.")
+@click.option('--backend', type=click.Choice(['rest', 'graphql']), default='rest',
+              help="API issues are fetched with. The graphql backend fetches issues with their labels and first "
+                   "comments in one request per page, it needs the sync engine. Defaults to rest.")
+@click.option('--metrics-port', 'metrics_port', default=0,
+              help="Port to serve metrics on at /metrics in the Prometheus format. 0 disables it. Defaults to 0.")
+@click.option('--profile-rules', 'profile_file', default="",
+              help="File to write a report of time spent in every rule to after each iteration. If empty, no report "
+                   "is written.")
+@match_guard_options
 def console(repositories, auth, verbose, rules_file, interval, default_label, skip_labelled, process_comments,
-            process_closed_issues, process_title, remove_current):
+            process_closed_issues, process_title, remove_current, incremental, skip_unchanged, cache_size, cache_file,
+            comment_store_size, workers, engine, concurrency, backend, metrics_port, profile_file, max_text_length, match_budget,
+            regex_engine):
+    global response_cache
     logger.level = log_num_to_level(verbose)
+    if backend == 'graphql' and engine == 'async':
+        raise click.UsageError("The graphql backend needs the sync engine.")
+    init_match_guard(max_text_length, match_budget, regex_engine)
+
+    if metrics_port:
+        metrics.start_http_server(metrics_port)
+
+    if cache_size > 0:
+        response_cache = ResponseCache(cache_size, cache_file or None)
+    comment_store.max_entries = comment_store_size
+
+    if incremental:
+        polling_state = PollingState(os.path.join(get_config_dir(), "polling_state.json"))
+    else:
+        polling_state = None
+
+    if skip_unchanged:
+        state_store = IssueStateStore(os.path.join(get_config_dir(), "issue_state.sqlite"))
+    else:
+        state_store = None
+
+    rules_manager = RulesManager(init_rules(rules_file), loaded=True)
+
     while True:
         logger.warning(init_message.format(repositories, logger.level, auth, rules_file, interval,
                                            default_label,
                                            skip_labelled,
                                            process_comments, process_closed_issues, process_title,
-                                           remove_current))
+                                           remove_current, incremental, skip_unchanged, workers, engine, backend))
 
-        init_rules(rules_file)
+        if rules_manager.check():
+            for rule in rules:
+                logger.debug(rule)
         token = read_auth(auth, "auth", "gittoken")
 
-        for rule in rules:
-            logger.debug(rule)
+        if state_store is not None and polling_state is not None and state_store.rules_changed(
+                rule_set.digest(default_label=default_label, process_comments=process_comments,
+                                process_title=process_title, remove_current=remove_current)):
+            logger.warning("Rules or options changed since the last check, all issues will be checked again.")
+            polling_state.clear()
+
+        options = dict(default_label=default_label, skip_labelled=skip_labelled, process_comments=process_comments,
+                       process_closed_issues=process_closed_issues, process_title=process_title,
+                       remove_current=remove_current, polling_state=polling_state, state_store=state_store)
+
+        if engine == 'async':
+            from gitbot import async_client
+            asyncio.run(async_client.process_repositories(token, repositories, concurrency, **options))
+        else:
+            process_repositories(token, repositories, workers, backend=backend, **options)
+
+        if response_cache is not None:
+            response_cache.save()
+            logger.info("Response cache hit ratio: {:.2f}".format(response_cache.hit_ratio()))
 
-        for repository in repositories:
-            process_issues(token, repository, default_label, skip_labelled, process_comments,
-                           process_closed_issues,
-                           process_title, remove_current)
+        if profile_file:
+            from gitbot import profiling
+            with open(profile_file, "w") as f:
+                profiling.write_report(profiling.rule_report(rule_set), f)
 
         logger.info("Iteration done. Another will start in {} seconds.\n".format(interval))
         time.sleep(interval)
 
 
 @main.command()
-def web():
+@click.option('-w', '--workers', default=4, help="Number of threads processing received issues. Defaults to 4.")
+@click.option('-q', '--queue-size', 'queue_size', default=1000,
+              help="Maximal number of received issues waiting for processing. Defaults to 1000.")
+@click.option('-c', '--coalesce-window', 'coalesce_window', default=2.0,
+              help="Events of the same issue arriving within this many seconds are processed once. "
+                   "0 disables coalescing. Defaults to 2 seconds.")
+@click.option('--pool-size', 'pool_size', default=0,
+              help="Number of keep-alive connections to GitHub. Defaults to the number of workers.")
+@click.option('--idle-timeout', 'idle_timeout', default=600,
+              help="Seconds after which unused connections to GitHub are closed. Defaults to 600.")
+@click.option('--server', type=click.Choice(['flask', 'waitress', 'gunicorn']), default='flask',
+              help="Server to run the app with. flask is the development server, waitress and gunicorn are "
+                   "production WSGI servers. Defaults to flask.")
+@click.option('--host', default="0.0.0.0", help="Address to listen on. Defaults to 0.0.0.0.")
+@click.option('--port', default=5000, help="Port to listen on. Defaults to 5000.")
+@click.option('-p', '--processes', default=1,
+              help="Number of worker processes, more than 1 needs the gunicorn server. Defaults to 1.")
+@click.option('-t', '--threads', default=8,
+              help="Number of threads answering webhooks in every process. Defaults to 8.")
+@click.option('--state-file', 'state_file', default="",
+              help="Database of seen deliveries and cached GitHub responses shared by the processes. Defaults to "
+                   "web_state.sqlite in the config directory with more than 1 process, to memory otherwise.")
+@click.option('--cache-size', 'cache_size', default=1000,
+              help="Number of GitHub responses kept for conditional requests. 0 disables the cache. Defaults to 1000.")
+@match_guard_options
+def web(workers, queue_size, coalesce_window, pool_size, idle_timeout, server, host, port, processes, threads,
+        state_file, cache_size, max_text_length, match_budget, regex_engine):
     """Running in web mode will automatically label all issues that are posted to the app at endpoint /callback.
     You will need the GitHub webhook secret set up both at GitHub and in the auth.cfg file for it to work."""
-    from gitbot import web_listener
-    web_listener.app.run(debug=True, host="0.0.0.0")
-    # print("not")
+    if processes > 1 and server != 'gunicorn':
+        raise click.UsageError("Running more than 1 process needs the gunicorn server.")
+    if processes > 1 and not state_file:
+        state_file = os.path.join(get_config_dir(), "web_state.sqlite")
+
+    # the listener loads the rules when imported, worker processes inherit them
+    init_match_guard(max_text_length, match_budget, regex_engine)
+    from gitbot import serving, web_listener
+    web_listener.app.config['WORKERS'] = workers
+    web_listener.app.config['QUEUE_SIZE'] = queue_size
+    web_listener.app.config['COALESCE_WINDOW'] = coalesce_window
+    web_listener.app.config['SESSION_POOL_SIZE'] = pool_size or None
+    web_listener.app.config['SESSION_IDLE_TIMEOUT'] = idle_timeout
+    web_listener.init_state(state_file or None, cache_size)
+
+    logger.info("Serving with {}, {} process(es) of {} thread(s). Shared state: {}".format(
+        server, processes, threads, state_file or "none"))
+    serving.serve(web_listener.app, server, host, port, processes, threads, web_listener.init_worker)
+
+
+@main.command()
+@click.argument('input_file', type=click.File('r'))
+@click.argument('output_file', type=click.File('w'), default='-')
+@click.option('-v', '--verbose', count=True,
+              help="Much verbosity. May be repeated multiple times. More v's, more info!")
+@click.option('-r', '--rules-file', 'rules_file', default="rules.cfg", help="File containing tagging rules.")
+@click.option('-d', '--default-label', 'default_label', default="",
+              help="Label to apply to an issue if no other rule applies. If empty, no label is applied. Defaults to no label.")
+@click.option('--process-title/--no-process-title', 'process_title', default=True,
+              help="Should the title of the issue be matched against the rules as well? Defaults to true.")
+@click.option('--comments/--no-comments', 'process_comments', default=True,
+              help="Should comments be also matched against the rules? Defaults to true.")
+@click.option('--remove-current/--no-remove-current', 'remove_current', default=False,
+              help="Should the current labels on an issue be removed if a rule matches? Defaults to false.")
+@click.option('--repository', default="",
+              help="Repository of issues that do not name theirs in repository_url.")
+@click.option('-p', '--processes', default=0,
+              help="Number of worker processes. Defaults to the number of CPUs.")
+@match_guard_options
+def batch(input_file, output_file, verbose, rules_file, default_label, process_title, process_comments,
+          remove_current, repository, processes, max_text_length, match_budget, regex_engine):
+    """Labels issues exported to a JSONL file (one GitHub API issue per line) without talking to GitHub.
+    Proposed labels are written to OUTPUT_FILE (standard output by default) as JSONL."""
+    from gitbot import batch as batch_labelling
+    logger.level = log_num_to_level(verbose)
+    guard = init_match_guard(max_text_length, match_budget, regex_engine)
+
+    count = batch_labelling.label_file(input_file, output_file, init_rules(rules_file), processes or None,
+                                       repository=repository or None, default_label=default_label,
+                                       process_comments=process_comments, process_title=process_title,
+                                       remove_current=remove_current, match_guard=guard)
+    logger.info("Labelled {} issues.".format(count))
+
+
+@main.command()
+@click.argument('corpus_file', type=click.File('r'))
+@click.argument('output_file', type=click.File('w'), default='-')
+@click.option('-r', '--rules-file', 'rules_file', default="rules.cfg", help="File containing tagging rules.")
+@click.option('-t', '--threshold', default=0.005,
+              help="Rules whose slowest search takes longer than this many seconds are flagged. Defaults to 0.005.")
+@click.option('--probe/--no-probe', 'probe', default=True,
+              help="Should rules be probed for catastrophic backtracking with long texts? Defaults to true.")
+@click.option('--json', 'as_json', is_flag=True, help="Write the report as JSON instead of a table.")
+def profile(corpus_file, output_file, rules_file, threshold, probe, as_json):
+    """Profiles rules on issues exported to a JSONL file (as read by the batch command). Time spent in every rule
+    is written to OUTPUT_FILE (standard output by default), slowest rules first. Rules that are slow or show
+    catastrophic backtracking are flagged and the command fails."""
+    from gitbot import profiling
+    init_rules(rules_file)
+
+    rows = profiling.profile_corpus(rules, profiling.corpus_texts(corpus_file), threshold, probe)
+    profiling.write_report(rows, output_file, as_json)
+
+    flagged = [row for row in rows if profiling.flags_of(row)]
+    for row in flagged:
+        logger.warning("Rule {} ({}) is {}.".format(row['pattern'], row['label'], " and ".join(profiling.flags_of(row))))
+    if flagged:
+        raise SystemExit(1)
 
 
 auth_sample = """[auth]
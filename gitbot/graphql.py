@@ -0,0 +1,148 @@
+"""
+GraphQL backend fetching issues from GitHub, used by ``gitbot console --backend graphql``.
+
+With the REST API, every page of issues takes a request and comments of every issue take another one. The
+`GraphQL API`_ returns a page of issues together with their labels and first comments in a single request, so e.g.
+5000 issues take 50 requests instead of more than 5000.
+
+Issues are mapped to :class:`gitbot.github_issues_bot.Issue` with the URLs the REST API uses, so labels are still
+written with the REST API. Comments returned with an issue are put into :data:`gitbot.github_issues_bot.comment_store`,
+where :func:`gitbot.github_issues_bot.process_issue` finds them. Comments of issues with more comments than were
+requested are fetched with the REST API as before, so issues are labelled the same with both backends.
+
+Unlike the REST API, the GraphQL API does not list pull requests among issues.
+
+.. _GraphQL API: https://docs.github.com/en/graphql
+"""
+import requests
+
+from gitbot import github_issues_bot
+
+logger = github_issues_bot.logger
+
+graphql_url = 'https://api.github.com/graphql'
+comments_per_issue = 10
+
+issues_query = """
+query($owner: String!, $name: String!, $states: [IssueState!], $since: DateTime, $first: Int!, $after: String) {
+  repository(owner: $owner, name: $name) {
+    issues(first: $first, after: $after, states: $states, filterBy: {since: $since},
+           orderBy: {field: UPDATED_AT, direction: ASC}) {
+      pageInfo { hasNextPage endCursor }
+      nodes {
+        number title body state updatedAt
+        labels(first: 100) { nodes { name } }
+        %(comments)s
+      }
+    }
+  }
+}
+"""
+
+states = {'open': ['OPEN'], 'closed': ['CLOSED'], 'all': ['OPEN', 'CLOSED']}
+
+
+def build_query(comments=comments_per_issue):
+    """
+    Build the query of a page of issues.
+
+    Args:
+        comments(int): Number of the first comments of every issue to fetch. 0 fetches only their count.
+
+    Returns:
+        str: The query.
+    """
+    if comments:
+        field = "comments(first: {}) {{ totalCount nodes {{ body }} }}".format(comments)
+    else:
+        field = "comments { totalCount }"
+    return issues_query % {'comments': field}
+
+
+def parse_issue(node, repository):
+    """
+    Create an issue from an issue node of a GraphQL response.
+
+    Args:
+        node(dict): The issue node, as requested by :func:`build_query`.
+        repository(str): Name of the repository the issue belongs to, e.g. ``username/somerepo``.
+
+    Returns:
+        tuple: The :class:`gitbot.github_issues_bot.Issue`, and texts of its comments - or None if the node does not
+        hold all of them.
+    """
+    url = github_issues_bot.edit_issue_url.format(repository, node['number'])
+    comments_count = node['comments']['totalCount']
+    comments = [comment['body'] for comment in node['comments'].get('nodes', [])]
+
+    issue = github_issues_bot.Issue(url, url + '/comments', [label['name'] for label in node['labels']['nodes']],
+                                    node['state'] == 'OPEN', node['title'], node['body'], node['number'],
+                                    repository, comments_count, node['updatedAt'])
+    return issue, comments if len(comments) == comments_count else None
+
+
+def fetch_issues(repository, state, session=None, polling_state=None, comments=comments_per_issue):
+    """
+    GraphQL counterpart of :func:`gitbot.github_issues_bot.fetch_issues`, a generator of issues.
+
+    Pages of issues are requested one by one, each only after all issues of the previous one were consumed. Comments
+    of every issue that were all fetched with it are put into :data:`gitbot.github_issues_bot.comment_store`.
+
+    Args:
+        repository(str): Name of the repository to fetch.
+        state(str): Issues in which states to fetch. Allowed string values: all, open, closed.
+        session(:obj:`requests.Session`, optional): If supplied, use this session object instead of the internal.
+        polling_state(PollingState, optional): If supplied, fetch only issues updated since the last poll.
+        comments(int): Number of the first comments of every issue to fetch. 0 fetches none.
+
+    Returns:
+        generator of :obj:`gitbot.github_issues_bot.Issue`: Yields issues of the given repository.
+    """
+    if not session:
+        session = github_issues_bot.current_session()
+
+    owner, name = repository.split('/', 1)
+    since = polling_state.get(repository, state) if polling_state else None
+    variables = {'owner': owner, 'name': name, 'states': states[state], 'since': since,
+                 'first': github_issues_bot.issues_per_page}
+    query = build_query(comments)
+    after = None
+    newest = since
+
+    while True:
+        logger.info("Fetching issues of {} with GraphQL, after: {}".format(repository, after))
+
+        try:
+            response = session.post(graphql_url, json={'query': query, 'variables': dict(variables, after=after)})
+            response.raise_for_status()
+        except requests.HTTPError:
+            logger.error(
+                "A HTTP error occurred when fetching issues. Code: {}\nFull error: {}".format(response.status_code,
+                                                                                              response.content))
+            return
+        except requests.ConnectionError as e:
+            logger.error("Could not establish connection with GitHub. Full error: {}".format(e))
+            return
+
+        payload = response.json()
+        data = payload.get('data') or {}
+        if payload.get('errors') or not data.get('repository'):
+            logger.error("GitHub could not answer the query of issues of {}: {}".format(repository,
+                                                                                      payload.get('errors')))
+            return
+
+        connection = data['repository']['issues']
+        for node in connection['nodes']:
+            issue, issue_comments = parse_issue(node, repository)
+            if issue_comments is not None:
+                github_issues_bot.comment_store.store(issue, issue_comments)
+            if issue.updated_at and (not newest or issue.updated_at > newest):
+                newest = issue.updated_at
+            yield issue
+
+        if not connection['pageInfo']['hasNextPage']:
+            break
+        after = connection['pageInfo']['endCursor']
+
+    if polling_state and newest:
+        polling_state.update(repository, state, newest)
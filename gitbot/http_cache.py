@@ -0,0 +1,214 @@
+import collections
+import hashlib
+import json
+import logging
+import os
+import threading
+
+import requests
+
+logger = logging.getLogger(__file__)
+
+
+class ResponseCache:
+    """
+    Cache of parsed GitHub API responses, used to make conditional requests (see `Conditional requests`_).
+
+    For every cached URL it keeps the ``ETag`` and ``Last-Modified`` headers together with the parsed JSON payload.
+    When GitHub answers a conditional request with ``304 Not Modified``, the stored payload is served instead - such
+    responses do not count against the rate limit.
+
+    The cache holds at most ``max_entries`` URLs and evicts the least recently used ones. If a file name is given,
+    the cache is loaded from it on creation and written to it by :meth:`save`.
+
+    .. _Conditional requests: https://developer.github.com/v3/#conditional-requests
+    """
+
+    def __init__(self, max_entries=1000, filename=None):
+        self.max_entries = max_entries
+        self.filename = filename
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+        if filename and os.path.exists(filename):
+            try:
+                with open(filename) as f:
+                    self._entries.update(json.load(f))
+                self._evict()
+            except (OSError, ValueError) as e:
+                logger.warning("Could not read response cache file {}, starting empty: {}".format(filename, e))
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def key(url, authorization):
+        """
+        Build a cache key. Responses depend on the credentials used, so a digest of them is a part of the key.
+
+        Args:
+            url(str): Requested URL.
+            authorization(str): Value of the ``Authorization`` header, may be None.
+
+        Returns:
+            str: Cache key.
+        """
+        digest = hashlib.sha1((authorization or "").encode("utf-8")).hexdigest()[:16]
+        return "{} {}".format(digest, url)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def hit_ratio(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def save(self):
+        """
+        Write the cache to its file, if it has one.
+
+        Returns:
+            None
+        """
+        if not self.filename:
+            return
+
+        with self._lock:
+            entries = dict(self._entries)
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.filename)), exist_ok=True)
+        tmp_filename = self.filename + ".tmp"
+        with open(tmp_filename, "w") as f:
+            json.dump(entries, f)
+        os.replace(tmp_filename, self.filename)
+
+
+class CachedResponse(requests.Response):
+    """
+    Response whose :meth:`json` returns an already parsed payload.
+
+    It is returned both for fresh responses that were just stored in the cache and for ``304 Not Modified`` responses
+    served from the cache. In the latter case ``from_cache`` is true and the status code is the cached one.
+    """
+
+    def __init__(self, response, payload, from_cache=False):
+        super().__init__()
+        self.__dict__.update(response.__dict__)
+        self._payload = payload
+        self.from_cache = from_cache
+
+    @property
+    def content(self):
+        if self.from_cache:
+            return json.dumps(self._payload).encode("utf-8")
+        return super().content
+
+    def json(self, **kwargs):
+        return self._payload
+
+
+class StreamedResponse(requests.Response):
+    """
+    Fresh response requested with ``stream=True``, cached once its payload is parsed while it is downloaded (see
+    :func:`gitbot.streaming.iter_response`) instead of being read whole first.
+    """
+
+    def __init__(self, response, store):
+        super().__init__()
+        self.__dict__.update(response.__dict__)
+        self._store = store
+
+    def record(self, elements, compact=None):
+        """
+        Pass on parsed elements of the payload, and cache the payload once all of them were parsed.
+
+        Args:
+            elements(iterable): Elements of the payload, a JSON array.
+            compact(callable, optional): Function reducing an element to the form it is cached in, so that the cache
+                does not keep parts of the payload nobody reads.
+
+        Returns:
+            generator: Yields the elements.
+        """
+        payload = []
+        for element in elements:
+            payload.append(compact(element) if compact else element)
+            yield element
+        self._store(payload)
+
+
+class CachingSession(requests.Session):
+    """
+    Session that sends conditional GET requests and serves cached payloads on ``304 Not Modified``.
+
+    Other methods are passed through untouched. Responses requested with ``stream=True`` are returned unread as
+    :class:`StreamedResponse`, and cached only once they are parsed.
+    """
+
+    def __init__(self, cache):
+        super().__init__()
+        self.cache = cache
+
+    def request(self, method, url, *args, **kwargs):
+        if method.upper() != 'GET' or kwargs.get('params'):
+            return super().request(method, url, *args, **kwargs)
+
+        headers = dict(kwargs.pop('headers', None) or {})
+        key = self.cache.key(url, headers.get('Authorization', self.headers.get('Authorization')))
+
+        entry = self.cache.get(key)
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        response = super().request(method, url, *args, headers=headers, **kwargs)
+
+        if response.status_code == 304 and entry:
+            logger.debug("Not modified, serving cached response: {}".format(url))
+            self.cache.hits += 1
+            if entry.get('link'):
+                response.headers['Link'] = entry['link']
+            response.status_code = entry['status']
+            return CachedResponse(response, entry['payload'], from_cache=True)
+
+        self.cache.misses += 1
+
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if response.status_code != 200 or not (etag or last_modified):
+            return response
+
+        entry = {
+            'etag': etag,
+            'last_modified': last_modified,
+            'link': response.headers.get('Link'),
+            'status': response.status_code,
+        }
+        if kwargs.get('stream'):
+            return StreamedResponse(response, lambda payload: self.cache.put(key, dict(entry, payload=payload)))
+
+        try:
+            payload = response.json()
+        except ValueError:
+            return response
+
+        self.cache.put(key, dict(entry, payload=payload))
+        return CachedResponse(response, payload)
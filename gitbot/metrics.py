@@ -0,0 +1,254 @@
+"""
+Metrics of the bot in the Prometheus text format (see `Exposition formats`_).
+
+Counters and histograms are updated while issues are processed and GitHub is talked to, values that are already
+kept elsewhere (e.g. the rate limit budget of :class:`gitbot.scheduler.RateLimitScheduler` or the depth of the work
+queue) are read by collectors only when the metrics are rendered. The web listener serves the metrics at
+``/metrics``, console mode serves them with :func:`start_http_server` if ``--metrics-port`` is given.
+
+.. _Exposition formats: https://prometheus.io/docs/instrumenting/exposition_formats/
+"""
+import bisect
+import logging
+import re
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__file__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Registry:
+    """
+    Thread-safe store of metrics.
+
+    Every metric has to be described first with :meth:`describe`. Samples of a metric are told apart by their labels,
+    passed to :meth:`inc` and :meth:`observe` as keyword arguments.
+
+    Collectors added with :meth:`add_collector` are called by :meth:`render` and return samples as
+    ``(name, labels, value)`` tuples, their metrics have to be described as well.
+    """
+
+    def __init__(self):
+        self._descriptions = {}
+        self._values = {}
+        self._histograms = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def describe(self, name, kind, text, buckets=DEFAULT_BUCKETS):
+        """
+        Describe a metric.
+
+        Args:
+            name(str): Name of the metric, e.g. ``gitbot_issues_processed_total``.
+            kind(str): ``counter``, ``gauge`` or ``histogram``.
+            text(str): Help text.
+            buckets(:obj:`tuple` of :obj:`float`): Upper bounds of histogram buckets.
+        """
+        self._descriptions[name] = (kind, text, tuple(buckets))
+
+    def inc(self, name, value=1, **labels):
+        """
+        Increase a counter.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """
+        Add an observation (e.g. a duration in seconds) to a histogram.
+        """
+        buckets = self._descriptions[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * (len(buckets) + 1), 0.0]
+            histogram[0][bisect.bisect_left(buckets, value)] += 1
+            histogram[1] += value
+
+    def value(self, name, **labels):
+        """
+        Return the current value of a counter, or the number of observations of a histogram. Mostly for tests.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key in self._histograms:
+                return sum(self._histograms[key][0])
+            return self._values.get(key, 0)
+
+    def add_collector(self, collector):
+        """
+        Add a function called on every :meth:`render`, returning an iterable of ``(name, labels, value)`` samples.
+        """
+        self._collectors.append(collector)
+
+    def clear(self):
+        """
+        Reset all counters and histograms. Descriptions and collectors are kept.
+        """
+        with self._lock:
+            self._values.clear()
+            self._histograms.clear()
+
+    def render(self):
+        """
+        Render all metrics in the Prometheus text format.
+
+        Returns:
+            str: The metrics.
+        """
+        samples = {}
+        with self._lock:
+            for (name, labels), value in self._values.items():
+                samples.setdefault(name, []).append((name, labels, value))
+            for (name, labels), (counts, total) in self._histograms.items():
+                samples.setdefault(name, []).extend(self._histogram_samples(name, labels, counts, total))
+
+        for collector in self._collectors:
+            try:
+                for name, labels, value in collector():
+                    samples.setdefault(name, []).append((name, tuple(sorted(labels.items())), value))
+            except Exception:
+                logger.exception("Collecting metrics failed.")
+
+        lines = []
+        for name in sorted(samples):
+            kind, text, _ = self._descriptions.get(name, ('untyped', '', ()))
+            lines.append("# HELP {} {}".format(name, _escape(text, help_text=True)))
+            lines.append("# TYPE {} {}".format(name, kind))
+            for sample_name, labels, value in samples[name]:
+                lines.append("{}{} {}".format(sample_name, _format_labels(labels), _format_value(value)))
+        return "\n".join(lines) + "\n"
+
+    def _histogram_samples(self, name, labels, counts, total):
+        buckets = self._descriptions[name][2]
+        cumulative = 0
+        for bound, count in zip(buckets + (float('inf'),), counts):
+            cumulative += count
+            yield name + '_bucket', labels + (('le', _format_value(bound)),), cumulative
+        yield name + '_sum', labels, total
+        yield name + '_count', labels, cumulative
+
+
+def _escape(value, help_text=False):
+    value = str(value).replace('\\', '\\\\').replace('\n', '\\n')
+    return value if help_text else value.replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(name, _escape(value)) for name, value in labels) + "}"
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def endpoint_of(url):
+    """
+    Return the GitHub endpoint of a URL with repository names and numbers left out, so that metrics of requests to
+    many issues add up.
+
+    Usage example:
+       >>> endpoint_of("https://api.github.com/repos/foo/bar/issues/42/comments?page=2")
+       '/repos/:repo/issues/:number/comments'
+       >>> endpoint_of("https://api.github.com/repos/foo/bar/issues?state=open")
+       '/repos/:repo/issues'
+    """
+    path = urllib.parse.urlsplit(url).path
+    path = re.sub(r'^/repos/[^/]+/[^/]+', '/repos/:repo', path)
+    return re.sub(r'/\d+(?=/|$)', '/:number', path)
+
+
+registry = Registry()
+
+registry.describe('gitbot_github_requests_total', 'counter', "Requests sent to GitHub.")
+registry.describe('gitbot_github_request_seconds', 'histogram', "Time GitHub took to answer a request.")
+registry.describe('gitbot_rate_limit_wait_seconds', 'histogram',
+                  "Time requests waited for the rate limit scheduler before they were sent.")
+registry.describe('gitbot_rate_limit_remaining', 'gauge', "Requests left in the current rate limit window.")
+registry.describe('gitbot_rate_limit_limit', 'gauge', "Requests allowed per rate limit window.")
+registry.describe('gitbot_rate_limit_reset_timestamp_seconds', 'gauge', "Time the rate limit window resets.")
+registry.describe('gitbot_issues_processed_total', 'counter', "Issues matched against the rules.")
+registry.describe('gitbot_issue_processing_seconds', 'histogram',
+                  "Time processing of an issue took, including fetching of its comments.")
+registry.describe('gitbot_label_writes_total', 'counter', "Label writes sent to GitHub.")
+registry.describe('gitbot_labels_applied_total', 'counter', "Labels added to issues by successful writes.")
+registry.describe('gitbot_rule_searches_total', 'counter',
+                  "Texts searched with the regular expression of a rule (since the rules were last loaded).")
+registry.describe('gitbot_rule_matches_total', 'counter', "Texts a rule fit (since the rules were last loaded).")
+registry.describe('gitbot_rule_seconds_total', 'counter',
+                  "Time spent searching texts with a rule (since the rules were last loaded).")
+registry.describe('gitbot_rule_budget_exceeded_total', 'counter',
+                  "Rules skipped because a search took longer than the budget of the match guard.")
+registry.describe('gitbot_response_cache_hits_total', 'counter', "GitHub responses served from the response cache.")
+registry.describe('gitbot_response_cache_misses_total', 'counter', "GitHub responses not in the response cache.")
+registry.describe('gitbot_response_cache_hit_ratio', 'gauge', "Share of GitHub responses served from the cache.")
+registry.describe('gitbot_comment_store_hits_total', 'counter', "Comments of issues reused from the comment store.")
+registry.describe('gitbot_comment_store_misses_total', 'counter', "Comments of issues fetched from GitHub.")
+registry.describe('gitbot_comment_store_hit_ratio', 'gauge', "Share of comments reused from the comment store.")
+registry.describe('gitbot_queue_depth', 'gauge', "Issues waiting in the work queue of the web listener.")
+registry.describe('gitbot_queue_coalescing', 'gauge', "Issues waiting for their coalescing window to close.")
+registry.describe('gitbot_queue_items_total', 'counter', "Issues passed through the work queue, by outcome.")
+registry.describe('gitbot_queue_wait_seconds_total', 'counter', "Time issues waited in the work queue.")
+
+
+def record_request(method, url, status, seconds):
+    """
+    Record a request sent to GitHub.
+
+    Args:
+        method(str): HTTP method.
+        url(str): Requested URL.
+        status: HTTP status of the response, or ``error`` if none arrived.
+        seconds(float): Time it took to get the response.
+    """
+    endpoint = endpoint_of(url)
+    registry.inc('gitbot_github_requests_total', method=method, endpoint=endpoint, status=str(status))
+    registry.observe('gitbot_github_request_seconds', seconds, method=method, endpoint=endpoint)
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        logger.debug("Metrics request: " + format % args)
+
+    def do_GET(self):
+        if urllib.parse.urlsplit(self.path).path != '/metrics':
+            self.send_error(404)
+            return
+
+        data = registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def start_http_server(port, address=''):
+    """
+    Serve the metrics at ``/metrics`` from a background thread.
+
+    Args:
+        port(int): Port to listen on. 0 picks a free one.
+        address(str): Address to listen on. Defaults to all addresses.
+
+    Returns:
+        http.server.ThreadingHTTPServer: The running server, its ``server_address`` holds the actual port.
+    """
+    server = ThreadingHTTPServer((address, port), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logger.info("Serving metrics on port {}.".format(server.server_address[1]))
+    return server
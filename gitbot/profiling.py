@@ -0,0 +1,184 @@
+"""
+Profiling of rules, used to find the rules that slow labelling down.
+
+Every :class:`gitbot.github_issues_bot.RuleSet` counts searches, matches and the time spent searching for each of its
+rules. :func:`rule_report` turns these counters into a report sorted by the total time, flagging rules whose slowest
+search took longer than a threshold.
+
+A rule can also be slow only on some texts. :func:`probe_backtracking` searches texts of growing length with a rule
+and flags it if the search time grows much faster than the length of the text - a sign of catastrophic backtracking.
+E.g. ``(how|what|why).*\\?`` scans the rest of the line from every ``how``, so a long line with many of them and no
+``?`` takes quadratic time. :func:`profile_corpus` does both on a sample corpus, it is used by ``gitbot profile``.
+"""
+import json
+import math
+import time
+
+from gitbot import github_issues_bot
+
+logger = github_issues_bot.logger
+
+DEFAULT_THRESHOLD = 0.005
+PROBE_SIZES = (1000, 8000)
+PROBE_SAMPLES = 5
+BACKTRACKING_GROWTH = 1.5
+MIN_PROBE_SECONDS = 0.001
+
+
+def rule_report(rule_set, threshold=DEFAULT_THRESHOLD):
+    """
+    Build a report of the time spent in each rule of a rule set.
+
+    Args:
+        rule_set(:obj:`gitbot.github_issues_bot.RuleSet`): Rule set that was used for matching.
+        threshold(float): Rules whose slowest search took longer than this many seconds are flagged as ``slow``.
+
+    Returns:
+        :obj:`list` of :obj:`dict`: One row per rule, the slowest rules first.
+    """
+    rows = []
+    for index, (rule, stats) in enumerate(zip(rule_set.rules, rule_set.stats())):
+        searches = stats['searches']
+        rows.append(dict(stats, rule=index, label=rule.label, pattern=rule.regex.pattern,
+                         avg_seconds=stats['seconds'] / searches if searches else 0.0,
+                         slow=stats['max_seconds'] > threshold))
+    return sorted(rows, key=lambda row: row['seconds'], reverse=True)
+
+
+def _repeat(text, size):
+    return ((text + " ") * (size // (len(text) + 1) + 1))[:size]
+
+
+def probe_texts(rule, samples, size):
+    """
+    Build texts of ``size`` characters to probe a rule with - every sample repeated, and the literal text every match
+    of the rule contains (see :class:`gitbot.github_issues_bot.RuleSet`) repeated on a single line.
+    """
+    texts = [_repeat(sample, size) for sample in samples if sample]
+    literals = github_issues_bot.RuleSet._required_literals(rule)
+    if literals:
+        texts.append(_repeat(" ".join(literals), size))
+    return texts
+
+
+def _time_search(regex, text, repeat=3):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        regex.search(text)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def probe_backtracking(rule, samples=(), sizes=PROBE_SIZES):
+    """
+    Search texts of two lengths with a rule and estimate how its search time grows with the length of the text.
+
+    Args:
+        rule(:obj:`gitbot.github_issues_bot.Rule`): Rule to probe.
+        samples(:obj:`list` of :obj:`str`): Sample texts, e.g. issue bodies.
+        sizes(tuple): Lengths of the short and of the long texts.
+
+    Returns:
+        dict: ``probe_seconds`` of the slowest search of a long text, ``growth`` - the exponent of the growth of its
+        search time (1 is linear, 2 quadratic), and ``backtracking`` - True if the growth is at least
+        :data:`BACKTRACKING_GROWTH` and the search took at least :data:`MIN_PROBE_SECONDS`.
+    """
+    short, long = sizes
+    worst = {'probe_seconds': 0.0, 'growth': 0.0}
+    for short_text, long_text in zip(probe_texts(rule, samples, short), probe_texts(rule, samples, long)):
+        short_seconds = _time_search(rule.regex, short_text)
+        long_seconds = _time_search(rule.regex, long_text)
+        if long_seconds > worst['probe_seconds']:
+            growth = math.log(max(long_seconds, 1e-9) / max(short_seconds, 1e-9)) / math.log(long / short)
+            worst = {'probe_seconds': long_seconds, 'growth': growth}
+
+    worst['backtracking'] = worst['probe_seconds'] >= MIN_PROBE_SECONDS and worst['growth'] >= BACKTRACKING_GROWTH
+    return worst
+
+
+def corpus_texts(lines):
+    """
+    Read texts (titles, bodies and comments) of issues exported to JSONL, in the format read by ``gitbot batch``.
+
+    Args:
+        lines(iterable of str): Lines of the corpus file.
+
+    Returns:
+        generator of :obj:`str`: The texts.
+    """
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+
+        try:
+            issue_json = json.loads(line)
+        except ValueError as e:
+            logger.error("Skipping a line that is not valid JSON: {}".format(e))
+            continue
+
+        for key in ('title', 'body'):
+            if issue_json.get(key):
+                yield issue_json[key]
+        comments = issue_json.get('comments')
+        if isinstance(comments, list):
+            for comment in comments:
+                if comment.get('body'):
+                    yield comment['body']
+
+
+def profile_corpus(rules, texts, threshold=DEFAULT_THRESHOLD, probe=True, sizes=PROBE_SIZES):
+    """
+    Match all texts of a corpus against the rules and report the time spent in each rule.
+
+    Args:
+        rules(:obj:`list` of :obj:`gitbot.github_issues_bot.Rule`): Rules to profile.
+        texts(iterable of str): Texts of the corpus.
+        threshold(float): Rules whose slowest search took longer than this many seconds are flagged as ``slow``.
+        probe(bool): If true, every rule is also probed for catastrophic backtracking with the longest texts of the
+            corpus, see :func:`probe_backtracking`.
+        sizes(tuple): Lengths of texts the rules are probed with.
+
+    Returns:
+        :obj:`list` of :obj:`dict`: One row per rule (see :func:`rule_report`), the slowest rules first.
+    """
+    rule_set = github_issues_bot.RuleSet(rules)
+    samples = []
+    for text in texts:
+        rule_set.matching(text)
+        samples = sorted(samples + [text], key=len, reverse=True)[:PROBE_SAMPLES]
+
+    rows = rule_report(rule_set, threshold)
+    if probe:
+        for row in rows:
+            row.update(probe_backtracking(rule_set.rules[row['rule']], samples, sizes))
+    return rows
+
+
+def flags_of(row):
+    return [flag for flag in ('slow', 'backtracking') if row.get(flag)]
+
+
+def write_report(rows, output_file, as_json=False):
+    """
+    Write a report as a table, or as JSON.
+
+    Args:
+        rows(:obj:`list` of :obj:`dict`): Rows of the report, see :func:`rule_report` and :func:`profile_corpus`.
+        output_file(file): Open output file.
+        as_json(bool): If true, the rows are written as a JSON list.
+    """
+    if as_json:
+        json.dump(rows, output_file, indent=2)
+        output_file.write("\n")
+        return
+
+    output_file.write("{:>10} {:>10} {:>10} {:>9} {:>8} {:>7}  {:<14} {:<20} {}\n".format(
+        "total ms", "avg ms", "max ms", "searches", "matches", "growth", "flags", "label", "pattern"))
+    for row in rows:
+        growth = "{:.2f}".format(row['growth']) if 'growth' in row else "-"
+        output_file.write("{:>10.3f} {:>10.4f} {:>10.4f} {:>9} {:>8} {:>7}  {:<14} {:<20} {}\n".format(
+            row['seconds'] * 1000, row['avg_seconds'] * 1000, row['max_seconds'] * 1000, row['searches'],
+            row['matches'], growth, ",".join(flags_of(row)) or "-", row['label'], row['pattern']))
@@ -0,0 +1,303 @@
+"""
+Scheduling of GitHub requests according to the rate limit (see `Rate limiting`_).
+
+Every response from GitHub carries ``X-RateLimit-Remaining`` and ``X-RateLimit-Reset`` headers, for the resource
+named in ``X-RateLimit-Resource``. :class:`RateLimitScheduler` keeps track of them and decides when the next request
+may be sent, so that the budget of the token is used up, but never exceeded.
+:class:`ScheduledAdapter` plugs the scheduler into a ``requests`` session.
+
+.. _Rate limiting: https://developer.github.com/v3/#rate-limiting
+"""
+import asyncio
+import logging
+import threading
+import time
+from urllib.parse import urlsplit
+
+from requests.adapters import HTTPAdapter
+
+from gitbot import metrics
+
+logger = logging.getLogger(__file__)
+
+WRITE = 0
+READ = 1
+
+CORE = 'core'
+GRAPHQL = 'graphql'
+
+
+def resource_of(url):
+    """
+    Return the rate limit resource a request counts against, named like in the ``X-RateLimit-Resource`` header.
+    GraphQL queries have a budget of their own, all other requests count against the ``core`` budget.
+    """
+    return GRAPHQL if urlsplit(url or "").path.rstrip('/').endswith('/graphql') else CORE
+
+
+def priority_of(method, url=None):
+    """
+    Return the priority of a request - writes (label changes) go before reads. GraphQL queries are sent with POST,
+    but they only read.
+    """
+    if method.upper() in ('GET', 'HEAD') or resource_of(url) == GRAPHQL:
+        return READ
+    return WRITE
+
+
+class RateLimit:
+    """
+    Budget of one rate limit resource, as last reported by GitHub.
+    """
+
+    def __init__(self):
+        self.limit = None
+        self.remaining = None
+        self.reset = None
+        self.next_slot = 0.0
+
+
+class RateLimitScheduler:
+    """
+    Scheduler deciding when a GitHub request may be sent.
+
+    - When the remaining budget is known and falls below ``pace_below`` (a fraction of the limit), requests are spread
+      evenly over the time left until the budget is reset, instead of being sent in a burst.
+    - The last ``reserve`` requests of the budget are kept for writes, reads wait for the reset.
+    - Writes waiting to be sent hold back all reads.
+    - After a secondary rate limit (403 or 429 response, see `Secondary limits`_), all requests are paused for the time
+      GitHub asks for in ``Retry-After``, or for an exponentially growing back-off if it does not say.
+
+    GitHub keeps separate budgets for resources such as the REST API (``core``) and GraphQL queries (``graphql``), so
+    a budget is kept for every resource named by ``X-RateLimit-Resource`` (see :func:`resource_of`).
+    :attr:`limit`, :attr:`remaining` and :attr:`reset` are those of the ``core`` budget.
+
+    The scheduler is thread-safe and can be shared by threads and asyncio tasks.
+
+    .. _Secondary limits: https://docs.github.com/en/rest/overview/resources-in-the-rest-api#secondary-rate-limits
+
+    Args:
+        reserve(int): Number of requests of the budget reserved for writes.
+        pace_below(float): Fraction of the limit below which requests are paced.
+        clock(callable): Function returning the current time in seconds since the epoch.
+    """
+
+    min_backoff = 60
+    max_backoff = 900
+
+    def __init__(self, reserve=50, pace_below=0.5, clock=time.time):
+        self.reserve = reserve
+        self.pace_below = pace_below
+        self.clock = clock
+        self.paused_until = 0.0
+        self._rate_limits = {CORE: RateLimit()}
+        self._backoff = 0
+        self._waiting = [0, 0]
+        self._condition = threading.Condition()
+
+    @property
+    def limit(self):
+        return self._rate_limits[CORE].limit
+
+    @property
+    def remaining(self):
+        return self._rate_limits[CORE].remaining
+
+    @property
+    def reset(self):
+        return self._rate_limits[CORE].reset
+
+    def rate_limits(self):
+        """
+        Return budgets of all resources GitHub reported so far.
+
+        Returns:
+            dict: :class:`RateLimit` of every resource, by its name.
+        """
+        with self._condition:
+            return dict(self._rate_limits)
+
+    def _rate_limit(self, resource):
+        rate_limit = self._rate_limits.get(resource)
+        if rate_limit is None:
+            rate_limit = self._rate_limits[resource] = RateLimit()
+        return rate_limit
+
+    def _delay(self, priority, now, resource):
+        if now < self.paused_until:
+            return self.paused_until - now
+
+        if any(self._waiting[p] for p in range(priority)):
+            return None
+
+        rate_limit = self._rate_limit(resource)
+        if rate_limit.remaining is None or rate_limit.reset is None or now >= rate_limit.reset:
+            return 0
+
+        floor = 0 if priority == WRITE else self.reserve
+        if rate_limit.remaining <= floor:
+            return rate_limit.reset - now
+
+        if rate_limit.limit and rate_limit.remaining < rate_limit.limit * self.pace_below \
+                and now < rate_limit.next_slot:
+            return rate_limit.next_slot - now
+
+        return 0
+
+    def try_acquire(self, priority, resource=CORE):
+        """
+        Take a slot for a request if one is available right now.
+
+        Args:
+            priority(int): :data:`WRITE` or :data:`READ`.
+            resource(str): Rate limit resource the request counts against, see :func:`resource_of`.
+
+        Returns:
+            float: 0 if the request may be sent. Otherwise the number of seconds to wait before trying again, or None
+            if the request waits for requests of a higher priority.
+        """
+        with self._condition:
+            now = self.clock()
+            delay = self._delay(priority, now, resource)
+            if delay == 0:
+                self._take_slot(now, resource)
+            return delay
+
+    def _take_slot(self, now, resource):
+        rate_limit = self._rate_limit(resource)
+        if rate_limit.remaining is None or rate_limit.reset is None or now >= rate_limit.reset:
+            return
+
+        rate_limit.remaining -= 1
+        rate_limit.next_slot = now + max(rate_limit.reset - now, 0) / max(rate_limit.remaining, 1)
+
+    def acquire(self, priority, resource=CORE):
+        """
+        Block until a request of the given priority may be sent.
+        """
+        with self._condition:
+            self._waiting[priority] += 1
+            try:
+                while True:
+                    now = self.clock()
+                    delay = self._delay(priority, now, resource)
+                    if delay == 0:
+                        self._take_slot(now, resource)
+                        return
+                    logger.debug("Waiting {} s for a request slot.".format(delay))
+                    self._condition.wait(delay)
+            finally:
+                self._waiting[priority] -= 1
+                self._condition.notify_all()
+
+    async def acquire_async(self, priority, resource=CORE):
+        """
+        Asynchronous counterpart of :meth:`acquire`, waits without blocking the event loop.
+        """
+        with self._condition:
+            self._waiting[priority] += 1
+        try:
+            while True:
+                with self._condition:
+                    now = self.clock()
+                    delay = self._delay(priority, now, resource)
+                    if delay == 0:
+                        self._take_slot(now, resource)
+                        return
+                await asyncio.sleep(delay if delay is not None else 0.1)
+        finally:
+            with self._condition:
+                self._waiting[priority] -= 1
+                self._condition.notify_all()
+
+    def update(self, status_code, headers, text=""):
+        """
+        Update the state of the scheduler from a GitHub response.
+
+        Args:
+            status_code(int): HTTP status of the response.
+            headers(dict): Response headers.
+            text(str): Response body, used to recognize secondary rate limits.
+
+        Returns:
+            bool: True if the request was refused because of a rate limit and should be sent again later.
+        """
+        with self._condition:
+            now = self.clock()
+            rate_limit = self._rate_limit(headers.get('X-RateLimit-Resource') or CORE)
+            limit = headers.get('X-RateLimit-Limit')
+            remaining = headers.get('X-RateLimit-Remaining')
+            reset = headers.get('X-RateLimit-Reset')
+
+            if remaining is not None:
+                remaining = int(remaining)
+            if remaining is not None and reset is not None:
+                reset = float(reset)
+                if rate_limit.reset == reset and rate_limit.remaining is not None:
+                    # responses may arrive out of order, the lowest number is the most recent one
+                    rate_limit.remaining = min(rate_limit.remaining, remaining)
+                else:
+                    rate_limit.remaining = remaining
+                    rate_limit.reset = reset
+            if limit is not None:
+                rate_limit.limit = int(limit)
+
+            throttled = False
+            if status_code in (403, 429):
+                retry_after = headers.get('Retry-After')
+                if retry_after is not None:
+                    self.paused_until = max(self.paused_until, now + float(retry_after))
+                    throttled = True
+                elif remaining == 0 and rate_limit.reset:
+                    # only requests counting against the exhausted budget wait for its reset, see _delay()
+                    rate_limit.remaining = 0
+                    throttled = True
+                elif 'secondary rate limit' in text.lower() or 'abuse' in text.lower():
+                    self._backoff = min(max(self._backoff * 2, self.min_backoff), self.max_backoff)
+                    self.paused_until = max(self.paused_until, now + self._backoff)
+                    throttled = True
+
+                if throttled:
+                    logger.warning("Rate limited by GitHub, pausing requests for {:.0f} s.".format(
+                        max(self.paused_until, rate_limit.reset or 0) - now))
+            else:
+                self._backoff = 0
+
+            self._condition.notify_all()
+            return throttled
+
+
+class ScheduledAdapter(HTTPAdapter):
+    """
+    Transport adapter sending every request through a :class:`RateLimitScheduler`. Requests refused because of
+    a rate limit are sent again once the scheduler allows it, at most ``max_retries_throttled`` times.
+    """
+
+    def __init__(self, scheduler, max_retries_throttled=3, **kwargs):
+        super().__init__(**kwargs)
+        self.scheduler = scheduler
+        self.max_retries_throttled = max_retries_throttled
+
+    def send(self, request, **kwargs):
+        priority = priority_of(request.method, request.url)
+        resource = resource_of(request.url)
+        attempt = 0
+        while True:
+            waiting_since = time.monotonic()
+            self.scheduler.acquire(priority, resource)
+            sent_at = time.monotonic()
+            metrics.registry.observe('gitbot_rate_limit_wait_seconds', sent_at - waiting_since)
+            try:
+                response = super().send(request, **kwargs)
+            except Exception:
+                metrics.record_request(request.method, request.url, 'error', time.monotonic() - sent_at)
+                raise
+            metrics.record_request(request.method, request.url, response.status_code, time.monotonic() - sent_at)
+
+            text = response.text if response.status_code in (403, 429) else ""
+            if not self.scheduler.update(response.status_code, response.headers, text):
+                return response
+
+            attempt += 1
+            if attempt > self.max_retries_throttled:
+                return response
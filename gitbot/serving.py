@@ -0,0 +1,111 @@
+"""
+Servers running the web listener, used by ``gitbot web --server``.
+
+``flask`` is the development server of Flask, a single process with the debugger on. For production, the listener is
+run by a WSGI server:
+
+- ``waitress`` - one process answering webhooks with a pool of threads. Works on every platform.
+- ``gunicorn`` - a number of worker processes, each answering webhooks with a pool of threads. Unix only.
+
+The app is imported (and the rules loaded) by the parent process, worker processes are forked from it. Every worker
+then calls ``init_worker`` once, before the first webhook, to start its own work queue, rules watcher and sessions -
+threads and connections are never inherited over ``fork()``. State which has to be shared by the workers is kept in
+:mod:`gitbot.shared_state`.
+"""
+try:
+    import gunicorn.app.base
+except ImportError:
+    gunicorn = None
+
+try:
+    import waitress
+except ImportError:
+    waitress = None
+
+servers = ['flask', 'waitress', 'gunicorn']
+
+
+def gunicorn_options(host, port, processes, threads, init_worker=None):
+    """
+    Build the settings of gunicorn.
+
+    Args:
+        host(str): Address to listen on.
+        port(int): Port to listen on.
+        processes(int): Number of worker processes.
+        threads(int): Number of threads answering webhooks in every process.
+        init_worker(callable, optional): Function called in every worker process before it answers the first webhook.
+
+    Returns:
+        dict: The settings.
+    """
+    options = {
+        'bind': '{}:{}'.format(host, port),
+        'workers': processes,
+        'threads': threads,
+        'worker_class': 'gthread',
+        'preload_app': False,
+    }
+    if init_worker is not None:
+        options['post_worker_init'] = lambda worker: init_worker()
+    return options
+
+
+if gunicorn is not None:
+    class GunicornApplication(gunicorn.app.base.BaseApplication):
+        """
+        Gunicorn application serving an already imported WSGI app.
+        """
+
+        def __init__(self, app, options):
+            self.application = app
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return self.application
+
+
+def serve(app, server='flask', host='0.0.0.0', port=5000, processes=1, threads=8, init_worker=None):
+    """
+    Run the app until the server is stopped.
+
+    Args:
+        app(:obj:`flask.Flask`): The app.
+        server(str): One of :data:`servers`.
+        host(str): Address to listen on.
+        port(int): Port to listen on.
+        processes(int): Number of worker processes, more than one is supported by gunicorn only.
+        threads(int): Number of threads answering webhooks in every process. Not used by the flask server.
+        init_worker(callable, optional): Function called in every worker process before it answers the first webhook.
+            Not used by the flask server.
+
+    Raises:
+        ValueError: If the server is not known or does not support the number of processes.
+        RuntimeError: If the server is not installed.
+    """
+    if server not in servers:
+        raise ValueError("Unknown server: {}. Use one of: {}.".format(server, ", ".join(servers)))
+    if processes > 1 and server != 'gunicorn':
+        raise ValueError("The {} server runs a single process, use gunicorn to run {}.".format(server, processes))
+
+    if server == 'gunicorn':
+        if gunicorn is None:
+            raise RuntimeError("The gunicorn server needs gunicorn. Install it with: pip install gitbot[server]")
+        GunicornApplication(app, gunicorn_options(host, port, processes, threads, init_worker)).run()
+        return
+
+    if server == 'waitress':
+        if waitress is None:
+            raise RuntimeError("The waitress server needs waitress. Install it with: pip install gitbot[server]")
+        if init_worker is not None:
+            init_worker()
+        waitress.serve(app, host=host, port=port, threads=threads)
+        return
+
+    # The reloader of the development server runs the app in a child process, the worker is initialized lazily there
+    app.run(debug=True, host=host, port=port)
@@ -0,0 +1,91 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__file__)
+
+
+class SessionManager:
+    """
+    Thread-safe registry of authenticated sessions, one per token.
+
+    Every session keeps a pool of keep-alive connections, so requests made with the same token reuse connections
+    (and TLS handshakes) no matter which thread or webhook makes them. Sessions that were not used for
+    ``idle_timeout`` seconds are closed and forgotten.
+
+    Args:
+        factory(callable): Function creating a new session, called with the token and the size of its connection pool.
+        pool_size(int): Default number of connections kept by each session.
+        idle_timeout(float): Number of seconds after which an unused session is closed. None keeps sessions forever.
+        clock(callable): Function returning the current time in seconds.
+    """
+
+    def __init__(self, factory, pool_size=10, idle_timeout=600, clock=time.monotonic):
+        self.factory = factory
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        self.clock = clock
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get(self, token, pool_size=None):
+        """
+        Return the session of the given token, create it if there is none yet.
+
+        Args:
+            token(str): Authentication token for GitHub.
+            pool_size(int, optional): Required size of the connection pool. If the existing session has a smaller one,
+                it is replaced by a new session. If not given, an existing session is returned as it is, and a new
+                one gets the default size.
+
+        Returns:
+            requests.Session: The session.
+        """
+        with self._lock:
+            now = self.clock()
+            self._evict_idle(now)
+
+            entry = self._sessions.get(token)
+            if entry is None or (pool_size and entry['pool_size'] is not None and entry['pool_size'] < pool_size):
+                if entry is not None:
+                    entry['session'].close()
+                pool_size = pool_size or self.pool_size
+                logger.debug("Creating a new session with a pool of {} connections.".format(pool_size))
+                entry = {'session': self.factory(token, pool_size), 'pool_size': pool_size}
+                self._sessions[token] = entry
+
+            entry['last_used'] = now
+            return entry['session']
+
+    def register(self, token, session):
+        """
+        Use the given session for the token instead of creating one. The session is never replaced nor evicted.
+
+        Args:
+            token(str): Authentication token for GitHub.
+            session(requests.Session): The session.
+        """
+        with self._lock:
+            self._sessions[token] = {'session': session, 'pool_size': None, 'last_used': None}
+
+    def _evict_idle(self, now):
+        if self.idle_timeout is None:
+            return
+
+        for token, entry in list(self._sessions.items()):
+            if entry['last_used'] is not None and now - entry['last_used'] > self.idle_timeout:
+                logger.debug("Closing a session unused for {:.0f} s.".format(now - entry['last_used']))
+                entry['session'].close()
+                del self._sessions[token]
+
+    def close(self):
+        """
+        Close all sessions.
+        """
+        with self._lock:
+            for entry in self._sessions.values():
+                entry['session'].close()
+            self._sessions.clear()
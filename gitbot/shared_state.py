@@ -0,0 +1,182 @@
+"""
+State of the web listener shared by all its worker processes, kept in a local SQLite database.
+
+When ``gitbot web`` runs several worker processes (see :mod:`gitbot.serving`), a webhook and its redelivery may be
+received by different processes, and every process would keep its own copy of cached GitHub responses.
+:class:`SharedDeliveryLog` and :class:`SharedResponseCache` keep delivery ids and cached responses in one database
+file instead, so ids seen by any process are dropped by all of them and a response cached by one process is used
+for conditional requests by the others.
+
+The database is opened in WAL mode, so readers do not block the writer, and every process opens its own connection
+the first time it uses a store - connections are never inherited over ``fork()``.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from gitbot.http_cache import ResponseCache
+
+BUSY_TIMEOUT = 5.0
+
+
+class SharedDatabase:
+    """
+    Connection to a SQLite database usable from threads of several processes.
+
+    Statements are executed in autocommit mode, so a change is visible to other processes as soon as it is made.
+
+    Args:
+        filename(str): Database file.
+        schema(str): Statements creating the tables, run when the database is opened by a process.
+    """
+
+    def __init__(self, filename, schema):
+        self.filename = filename
+        self.schema = schema
+        self._db = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+
+    def _connect(self):
+        db = sqlite3.connect(self.filename, timeout=BUSY_TIMEOUT, isolation_level=None, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.executescript(self.schema)
+        return db
+
+    def _connection(self):
+        if self._pid != os.getpid():
+            # A connection opened by the parent process must not be used after fork()
+            self._db = self._connect()
+            self._pid = os.getpid()
+        return self._db
+
+    def execute(self, sql, parameters=()):
+        """
+        Execute a statement changing the database.
+
+        Returns:
+            :obj:`sqlite3.Cursor`: The cursor, with ``rowcount`` and ``lastrowid`` of the statement.
+        """
+        with self._lock:
+            return self._connection().execute(sql, parameters)
+
+    def query(self, sql, parameters=()):
+        """
+        Execute a query.
+
+        Returns:
+            list: All rows of the result.
+        """
+        with self._lock:
+            return self._connection().execute(sql, parameters).fetchall()
+
+    def close(self):
+        with self._lock:
+            if self._db is not None and self._pid == os.getpid():
+                self._db.close()
+            self._db = None
+            self._pid = None
+
+
+class SharedDeliveryLog:
+    """
+    Counterpart of :class:`gitbot.work_queue.DeliveryLog` shared by processes. Only the last ``max_size`` ids are
+    kept.
+
+    Args:
+        filename(str): Database file.
+        max_size(int): Number of delivery ids kept.
+    """
+
+    def __init__(self, filename, max_size=10000):
+        self.max_size = max_size
+        self.db = SharedDatabase(filename, """
+            CREATE TABLE IF NOT EXISTS deliveries (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                id TEXT NOT NULL UNIQUE
+            );
+        """)
+
+    def seen(self, delivery_id):
+        """
+        Record a delivery id.
+
+        Args:
+            delivery_id(str): Id of the delivery (``X-GitHub-Delivery`` header).
+
+        Returns:
+            bool: True if the id was seen before, by any process.
+        """
+        cursor = self.db.execute("INSERT OR IGNORE INTO deliveries (id) VALUES (?)", (delivery_id,))
+        if cursor.rowcount == 0:
+            return True
+
+        # Trimming is only done now and then, the log may exceed its size by a few ids in between
+        if cursor.lastrowid % 100 == 0:
+            self.db.execute("DELETE FROM deliveries WHERE seq <= ?", (cursor.lastrowid - self.max_size,))
+        return False
+
+    def forget(self, delivery_id):
+        """
+        Remove a delivery id, so that the delivery is accepted when it arrives again.
+        """
+        self.db.execute("DELETE FROM deliveries WHERE id = ?", (delivery_id,))
+
+    def __len__(self):
+        return self.db.query("SELECT COUNT(*) FROM deliveries")[0][0]
+
+    def close(self):
+        self.db.close()
+
+
+class SharedResponseCache(ResponseCache):
+    """
+    :class:`gitbot.http_cache.ResponseCache` kept in a database shared by processes, used by
+    :class:`gitbot.http_cache.CachingSession` the same way.
+
+    The cache holds at most ``max_entries`` URLs and evicts the least recently used ones. Entries are written to the
+    database as they are put, so :meth:`save` has nothing to do. Hits and misses are counted by every process
+    separately.
+
+    Args:
+        filename(str): Database file.
+        max_entries(int): Number of cached URLs.
+    """
+
+    def __init__(self, filename, max_entries=1000):
+        super().__init__(max_entries)
+        self.db = SharedDatabase(filename, """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                entry TEXT NOT NULL,
+                used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS responses_used ON responses (used);
+        """)
+
+    def __len__(self):
+        return self.db.query("SELECT COUNT(*) FROM responses")[0][0]
+
+    def get(self, key):
+        cursor = self.db.execute("UPDATE responses SET used = ? WHERE key = ?", (time.time(), key))
+        if cursor.rowcount == 0:
+            return None
+
+        rows = self.db.query("SELECT entry FROM responses WHERE key = ?", (key,))
+        return json.loads(rows[0][0]) if rows else None
+
+    def put(self, key, entry):
+        self.db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?)", (key, json.dumps(entry), time.time()))
+        self.db.execute("DELETE FROM responses WHERE key IN "
+                        "(SELECT key FROM responses ORDER BY used DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+
+    def save(self):
+        pass
+
+    def close(self):
+        self.db.close()
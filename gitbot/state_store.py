@@ -0,0 +1,147 @@
+"""
+Persistent state of processed issues, used to skip issues that did not change since they were last labelled.
+
+For every processed issue, :class:`IssueStateStore` records the ``updated_at`` timestamp the issue had, a digest of
+the rules and options it was processed with (see :func:`state_digest`) and the labels it was given. An issue is
+processed again only when GitHub reports a newer ``updated_at`` or when the rules or options change.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+logger = logging.getLogger(__file__)
+
+
+def state_digest(rules, **options):
+    """
+    Return a digest of rules and processing options. Issues processed with a different digest are processed again.
+
+    Args:
+        rules(:obj:`list` of :obj:`gitbot.github_issues_bot.Rule`): Rules the issues are matched against.
+        **options: Options changing the labels given to issues, e.g. ``default_label``.
+
+    Returns:
+        str: Hexadecimal SHA-1 digest.
+    """
+    data = json.dumps({'rules': [[rule.regex.pattern, rule.label] for rule in rules], 'options': options},
+                      sort_keys=True)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+class IssueStateStore:
+    """
+    SQLite database of processed issues, keyed by repository name and issue number.
+
+    The store can be shared by threads. Changes are written to the database file by :meth:`save`.
+
+    Args:
+        filename(str): Database file. By default, the state is kept in memory only.
+    """
+
+    def __init__(self, filename=":memory:"):
+        self.filename = filename
+        self._lock = threading.Lock()
+
+        if filename != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+        self._db = sqlite3.connect(filename, check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS issues (
+                repository TEXT NOT NULL,
+                number INTEGER NOT NULL,
+                updated_at TEXT,
+                digest TEXT NOT NULL,
+                labels TEXT NOT NULL,
+                PRIMARY KEY (repository, number)
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+        """)
+
+    def get(self, issue):
+        """
+        Return the recorded state of an issue.
+
+        Args:
+            issue(Issue): The issue.
+
+        Returns:
+            dict: ``updated_at``, ``digest`` and ``labels`` of the issue when it was last processed, or None if it
+            was not processed yet.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT updated_at, digest, labels FROM issues WHERE repository = ? AND number = ?",
+                                   (issue.reponame, issue.number)).fetchone()
+        if row is None:
+            return None
+        return {'updated_at': row[0], 'digest': row[1], 'labels': json.loads(row[2])}
+
+    def is_current(self, issue, digest):
+        """
+        Check whether an issue was already processed in its current version with the given rules and options.
+
+        Args:
+            issue(Issue): The issue.
+            digest(str): Digest of the current rules and options, see :func:`state_digest`.
+
+        Returns:
+            bool: True if the issue does not need to be processed again.
+        """
+        if not issue.updated_at:
+            return False
+
+        state = self.get(issue)
+        return state is not None and state['updated_at'] == issue.updated_at and state['digest'] == digest
+
+    def record(self, issue, digest, labels):
+        """
+        Record that an issue was processed.
+
+        Args:
+            issue(Issue): The processed issue.
+            digest(str): Digest of the rules and options it was processed with.
+            labels(:obj:`list` of :obj:`str`): Labels the issue was given.
+        """
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO issues VALUES (?, ?, ?, ?, ?)",
+                             (issue.reponame, issue.number, issue.updated_at, digest, json.dumps(labels or [])))
+
+    def forget(self, issue):
+        """
+        Remove the record of an issue, so that it is processed again next time, e.g. because writing its labels failed.
+        """
+        with self._lock:
+            self._db.execute("DELETE FROM issues WHERE repository = ? AND number = ?", (issue.reponame, issue.number))
+
+    def rules_changed(self, digest):
+        """
+        Remember the digest of the current rules and options and tell whether it differs from the previous one.
+
+        Args:
+            digest(str): Digest of the current rules and options.
+
+        Returns:
+            bool: True if a different digest was remembered before.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT value FROM meta WHERE key = 'digest'").fetchone()
+            self._db.execute("INSERT OR REPLACE INTO meta VALUES ('digest', ?)", (digest,))
+        return row is not None and row[0] != digest
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM issues").fetchone()[0]
+
+    def save(self):
+        with self._lock:
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.commit()
+            self._db.close()
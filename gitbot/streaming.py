@@ -0,0 +1,173 @@
+"""
+Incremental parsing of JSON arrays, used to read lists of issues and comments from GitHub as they arrive.
+
+``response.json()`` needs the whole page in memory, both as raw text and as parsed objects, before the first issue
+can be processed. :class:`ArrayParser` is fed the response in chunks instead and returns every element of the array
+as soon as its text is complete, so only the text of the element being received is buffered. Elements are decoded
+by the C scanner of :mod:`json`. An element that is not complete yet and longer than a chunk is tried again only once
+the text buffered for it doubled, so even elements spanning many chunks (e.g. issues with enormous bodies) are decoded
+in linear time.
+"""
+import codecs
+import json
+import re
+
+from gitbot.http_cache import CachedResponse, StreamedResponse
+
+CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_decoder = json.JSONDecoder()
+
+
+class ArrayParser:
+    """
+    Push parser of a JSON array, fed text in pieces of any size.
+
+    Usage example:
+       >>> parser = ArrayParser()
+       >>> parser.feed('[{"title": "a, [b"}, {"ti')
+       [{'title': 'a, [b'}]
+       >>> parser.feed('tle": "c"}, 4')
+       [{'title': 'c'}]
+       >>> parser.feed('2]')
+       [42]
+       >>> parser.close()
+       []
+    """
+
+    def __init__(self):
+        self.done = False
+        self._expect = 'array'
+        self._buffer = ""
+        self._pending = []
+        self._length = 0
+        self._retry_length = 0
+
+    def feed(self, text, final=False):
+        """
+        Feed the next piece of text.
+
+        Args:
+            text(str): Next piece of the JSON text.
+            final(bool): If true, no more text follows.
+
+        Returns:
+            list: Elements of the array completed by this piece, decoded.
+
+        Raises:
+            ValueError: If the text is not a JSON array.
+        """
+        if self.done:
+            return []
+
+        self._pending.append(text)
+        self._length += len(text)
+        if self._length < self._retry_length and not final:
+            return []
+
+        buffer = self._buffer + "".join(self._pending)
+        self._pending = []
+        self._retry_length = 0
+        elements = []
+        pos = 0
+
+        while not self.done:
+            pos = _WHITESPACE.match(buffer, pos).end()
+            if pos == len(buffer):
+                break
+            char = buffer[pos]
+
+            if self._expect == 'array':
+                if char != '[':
+                    raise ValueError("Expected a JSON array.")
+                self._expect = 'first'
+                pos += 1
+            elif self._expect == 'separator':
+                if char == ']':
+                    self.done = True
+                elif char == ',':
+                    self._expect = 'element'
+                else:
+                    raise ValueError("Expected ',' or ']' in a JSON array, found {!r}.".format(char))
+                pos += 1
+            elif char == ']' and self._expect == 'first':
+                self.done = True
+                pos += 1
+            else:
+                try:
+                    element, end = _decoder.raw_decode(buffer, pos)
+                except ValueError:
+                    if final:
+                        raise
+                    if len(buffer) - pos > CHUNK_SIZE:
+                        self._retry_length = 2 * (len(buffer) - pos)
+                    break
+                if end == len(buffer) and not final and not isinstance(element, (dict, list, str)):
+                    # A number or a literal may continue in the next piece
+                    self._retry_length = len(buffer) - pos + 1
+                    break
+                elements.append(element)
+                self._expect = 'separator'
+                pos = end
+
+        self._buffer = buffer[pos:]
+        self._length = len(self._buffer)
+        return elements
+
+    def close(self):
+        """
+        Finish parsing, no more text follows.
+
+        Returns:
+            list: Elements of the array that were not returned yet.
+
+        Raises:
+            ValueError: If the array is incomplete.
+        """
+        elements = self.feed("", final=True)
+        if not self.done:
+            raise ValueError("Expected a JSON array." if self._expect == 'array' else "Incomplete JSON array.")
+        return elements
+
+
+def iter_array(chunks, encoding='utf-8'):
+    """
+    Parse a JSON array from chunks of its encoded text.
+
+    Args:
+        chunks(iterable of bytes): The encoded text, e.g. ``response.iter_content()``.
+        encoding(str): Encoding of the text.
+
+    Returns:
+        generator: Yields the elements of the array, each as soon as it is complete.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+    parser = ArrayParser()
+    for chunk in chunks:
+        yield from parser.feed(decoder.decode(chunk))
+    yield from parser.feed(decoder.decode(b"", final=True))
+    yield from parser.close()
+
+
+def iter_response(response, chunk_size=CHUNK_SIZE, compact=None):
+    """
+    Parse a JSON array from a GitHub response, while it is being downloaded if it was requested with
+    ``stream=True``. Payloads of :class:`gitbot.http_cache.CachingSession` served from its cache are used as they
+    are, fresh streamed payloads are put into the cache once they are parsed whole.
+
+    Args:
+        response(:obj:`requests.Response`): Response to parse.
+        chunk_size(int): Number of bytes read at once.
+        compact(callable, optional): Function reducing an element to the parts the caller reads. Elements are
+            cached in this form, so elements served from the cache are reduced too.
+
+    Returns:
+        iterator: The elements of the array.
+    """
+    if isinstance(response, CachedResponse):
+        return iter(response.json())
+    elements = iter_array(response.iter_content(chunk_size))
+    if isinstance(response, StreamedResponse):
+        return response.record(elements, compact)
+    return elements
@@ -2,19 +2,33 @@ import json
 import hashlib
 import hmac
 import os
+import queue
 import textwrap
 
 import jinja2
 import markdown
 from flask import Flask, request, render_template
 
-from gitbot import github_issues_bot
+from gitbot import github_issues_bot, metrics
+from gitbot.http_cache import ResponseCache
+from gitbot.shared_state import SharedDeliveryLog, SharedResponseCache
+from gitbot.work_queue import WorkQueue, Coalescer, DeliveryLog
 
 app = Flask(__name__)
+app.config.setdefault('WORKERS', 4)
+app.config.setdefault('QUEUE_SIZE', 1000)
+app.config.setdefault('COALESCE_WINDOW', 2.0)
+app.config.setdefault('SESSION_POOL_SIZE', None)
+app.config.setdefault('SESSION_IDLE_TIMEOUT', 600)
+app.config.setdefault('RULES_RELOAD_INTERVAL', 1.0)
 
 actions_to_process = ['opened', 'edited']
+work_queue = None
+coalescer = None
+delivery_log = DeliveryLog()
 
-github_issues_bot.init_rules(os.path.join(github_issues_bot.get_app_dir(), "rules.cfg"))
+rules_manager = github_issues_bot.RulesManager(
+    github_issues_bot.init_rules(os.path.join(github_issues_bot.get_app_dir(), "rules.cfg")), loaded=True)
 
 
 def read_github_secret():
@@ -75,6 +89,120 @@ def check_secret_integrity():
     return str(mac.hexdigest()) == str(signature)
 
 
+def process_queued_issue(issue):
+    """
+    Label an issue received through a webhook. Called by worker threads of the work queue, which all share one
+    session (and its keep-alive connections) to GitHub.
+    :param issue:
+    :return:
+    """
+    github_issues_bot.process_issue(issue)
+
+
+def get_work_queue():
+    """
+    Return the queue of issues waiting for processing, create it (sized according to the app config) if needed.
+    Creating the queue also starts watching the rules file, so that changed rules are used without a restart.
+    :return:
+    """
+    global work_queue
+    if work_queue is None:
+        if app.config['RULES_RELOAD_INTERVAL']:
+            rules_manager.start(app.config['RULES_RELOAD_INTERVAL'])
+        github_issues_bot.sessions.idle_timeout = app.config['SESSION_IDLE_TIMEOUT']
+        github_issues_bot.init_session(web_token, pool_size=app.config['SESSION_POOL_SIZE'] or app.config['WORKERS'])
+        work_queue = WorkQueue(process_queued_issue, app.config['WORKERS'], app.config['QUEUE_SIZE'])
+    return work_queue
+
+
+def init_worker():
+    """
+    Prepare the current process to process issues before the first webhook arrives - start the work queue, watching
+    of the rules file and the session to GitHub. Called once in every worker process, see :mod:`gitbot.serving`.
+    :return:
+    """
+    get_work_queue()
+
+
+def init_state(state_file=None, cache_size=1000):
+    """
+    Set up the log of seen deliveries and the cache of GitHub responses. Must be called before worker processes are
+    started.
+    :param state_file: Database shared by all worker processes, see :mod:`gitbot.shared_state`. If not given, every
+        process keeps its own state in memory.
+    :param cache_size: Number of GitHub responses kept for conditional requests. 0 disables the cache.
+    :return:
+    """
+    global delivery_log
+    if state_file:
+        delivery_log = SharedDeliveryLog(state_file)
+        github_issues_bot.response_cache = SharedResponseCache(state_file, cache_size) if cache_size > 0 else None
+    else:
+        delivery_log = DeliveryLog()
+        github_issues_bot.response_cache = ResponseCache(cache_size) if cache_size > 0 else None
+
+
+def is_newer_issue(issue, other):
+    """
+    Check whether an issue payload is newer than another payload of the same issue. Payloads without the time of
+    update are considered newer, as they arrived later.
+    :param issue:
+    :param other:
+    :return:
+    """
+    if issue.updated_at and other.updated_at:
+        return issue.updated_at >= other.updated_at
+    return True
+
+
+def queue_issue(issue):
+    """
+    Queue an issue for processing. Events of the same issue arriving within the coalescing window are folded into
+    a single processing run using the newest payload.
+    :param issue:
+    :return: False if the issue could not be queued because the queue (together with issues waiting in the coalescing
+        window) is full, True otherwise.
+    """
+    global coalescer
+    if not app.config['COALESCE_WINDOW']:
+        return get_work_queue().put(issue)
+
+    if coalescer is None:
+        coalescer = Coalescer(get_work_queue().put, app.config['COALESCE_WINDOW'], is_newer_issue,
+                              app.config['QUEUE_SIZE'])
+
+    # Issues waiting in the coalescer are passed to the work queue later, there has to be room for them as well
+    key = (issue.reponame, issue.number)
+    if key not in coalescer and get_work_queue().stats()['depth'] + coalescer.depth() >= app.config['QUEUE_SIZE']:
+        return False
+
+    try:
+        coalescer.add(key, issue)
+    except queue.Full:
+        return False
+    return True
+
+
+def collect_queue_metrics():
+    """
+    Collect metrics of the work queue and of the coalescer, see :mod:`gitbot.metrics`.
+    :return:
+    """
+    if work_queue is None:
+        return
+
+    stats = work_queue.stats()
+    yield 'gitbot_queue_depth', {}, stats['depth']
+    yield 'gitbot_queue_coalescing', {}, coalescer.depth() if coalescer else 0
+    for outcome in ('enqueued', 'rejected', 'processed', 'failed'):
+        yield 'gitbot_queue_items_total', {'outcome': outcome}, stats[outcome]
+    yield 'gitbot_queue_items_total', {'outcome': 'coalesced'}, coalescer.coalesced if coalescer else 0
+    yield 'gitbot_queue_wait_seconds_total', {}, stats['wait_seconds_total']
+
+
+metrics.registry.add_collector(collect_queue_metrics)
+
+
 @app.template_filter('markdown')
 def convert_markdown(text):
     text = textwrap.dedent(text)
@@ -90,7 +218,8 @@ def handle_root():
 @app.route('/callback', methods=['POST'])
 def handle_callback():
     """
-    Handle GitHub issue callback.
+    Handle GitHub issue callback. The issue is only verified and queued for processing by worker threads, so the
+    response does not wait for GitHub API calls.
     :return:
     """
     try:
@@ -113,6 +242,29 @@ def handle_callback():
             {"code": 2,
              "message": "Secret signature was not sent with request!!! It will not be processed."}), 400
 
+    delivery_id = request.headers.get('X-GitHub-Delivery')
+    if delivery_id and delivery_log.seen(delivery_id):
+        txt = "Delivery {} was already received, ignoring it.".format(delivery_id)
+        github_issues_bot.logger.info(txt)
+        return json.dumps({"code": 7,
+                           "message": txt}), 200
+
+    accepted = False
+    try:
+        response = process_callback()
+        accepted = response[1] == 202
+        return response
+    finally:
+        # GitHub redelivers with the same id, the redelivery must not be dropped if this delivery was not accepted
+        if delivery_id and not accepted:
+            delivery_log.forget(delivery_id)
+
+
+def process_callback():
+    """
+    Parse the issue of a verified callback and queue it for processing.
+    :return: Response to the callback, 202 if the issue was queued.
+    """
     github_issues_bot.logger.debug("Processing callback. Request: {}".format(request.get_json(force=True)))
     data = request.get_json(force=True)
 
@@ -125,10 +277,12 @@ def handle_callback():
                     "message": txt}), 200
 
         issue = github_issues_bot.Issue.parse(data['issue'], parse_repo(data))
-        if not app.config['TESTING']:
-            github_issues_bot.init_session(web_token)
-
-            github_issues_bot.process_issue(issue)
+        if not app.config['TESTING'] and not queue_issue(issue):
+            txt = "Too many issues are waiting for processing ({}). Try again later.".format(
+                get_work_queue().stats()['depth'])
+            github_issues_bot.logger.error(txt)
+            return json.dumps({"code": 6,
+                               "message": txt}), 503
     except KeyError as e:
         github_issues_bot.logger.warn("""Key was not found in request JSON. This may mean that GitHub
         sent a webhook for a non-issue event.""")
@@ -136,10 +290,43 @@ def handle_callback():
                            "message": """Key was not found in request JSON. This may mean that GitHub
         sent a webhook for a non-issue event."""}), 400
 
-    github_issues_bot.logger.info("Callback done.")
+    github_issues_bot.logger.info("Callback accepted, issue queued for processing.")
     return json.dumps({"code": 5,
-                       "message": "Callback done.",
-                       "issue_number": issue.number}), 200
+                       "message": "Callback accepted, issue queued for processing.",
+                       "issue_number": issue.number}), 202
+
+
+@app.route('/queue')
+def handle_queue():
+    """
+    Report the state of the queue of issues waiting for processing - its depth and latencies.
+    :return:
+    """
+    stats = get_work_queue().stats()
+    stats['coalescing'] = coalescer.depth() if coalescer else 0
+    stats['coalesced'] = coalescer.coalesced if coalescer else 0
+    return json.dumps(stats), 200, {'Content-Type': 'application/json'}
+
+
+@app.route('/rules')
+def handle_rules():
+    """
+    Report time spent in every rule since the rules were loaded, slowest rules first (see :mod:`gitbot.profiling`).
+    :return:
+    """
+    from gitbot import profiling
+    rows = profiling.rule_report(github_issues_bot.rule_set)
+    return json.dumps(rows), 200, {'Content-Type': 'application/json'}
+
+
+@app.route('/metrics')
+def handle_metrics():
+    """
+    Report metrics of the listener in the Prometheus text format - GitHub requests, rule evaluation, processed issues,
+    written labels, the queue, the rate limit budget and caches.
+    :return:
+    """
+    return metrics.registry.render(), 200, {'Content-Type': metrics.CONTENT_TYPE}
 
 
 readme_text = """# GitHub issues bot
@@ -0,0 +1,255 @@
+import collections
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__file__)
+
+
+class WorkQueue:
+    """
+    Bounded queue of work items drained by a pool of worker threads.
+
+    Items are handed to ``handler`` one by one. The queue keeps statistics of its depth, of the time items wait in
+    the queue and of the time their processing takes, see :meth:`stats`. Worker threads are started lazily with the
+    first item.
+
+    Args:
+        handler(callable): Function called with every item. Exceptions it raises are logged and counted.
+        workers(int): Number of worker threads.
+        max_size(int): Maximal number of items waiting in the queue. 0 means unbounded.
+    """
+
+    def __init__(self, handler, workers=4, max_size=1000):
+        self.handler = handler
+        self.workers = workers
+        self.max_size = max_size
+        self._queue = queue.Queue(max_size)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._stats = {
+            'enqueued': 0,
+            'rejected': 0,
+            'processed': 0,
+            'failed': 0,
+            'wait_seconds_total': 0.0,
+            'wait_seconds_max': 0.0,
+            'processing_seconds_total': 0.0,
+            'processing_seconds_max': 0.0,
+        }
+
+    def start(self):
+        with self._lock:
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work, name="work-queue-{}".format(len(self._threads)),
+                                          daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def put(self, item):
+        """
+        Add an item to the queue without waiting.
+
+        Args:
+            item: Item to be handed to the handler.
+
+        Returns:
+            bool: True if the item was queued, False if the queue is full.
+        """
+        self.start()
+        try:
+            self._queue.put_nowait((time.monotonic(), item))
+        except queue.Full:
+            with self._lock:
+                self._stats['rejected'] += 1
+            return False
+
+        with self._lock:
+            self._stats['enqueued'] += 1
+        return True
+
+    def join(self):
+        """
+        Block until all queued items are processed.
+        """
+        self._queue.join()
+
+    def _work(self):
+        while True:
+            enqueued_at, item = self._queue.get()
+            started_at = time.monotonic()
+            failed = False
+            try:
+                self.handler(item)
+            except Exception:
+                logger.exception("Processing of a queued item failed.")
+                failed = True
+            finally:
+                finished_at = time.monotonic()
+                self._record(started_at - enqueued_at, finished_at - started_at, failed)
+                self._queue.task_done()
+
+    def _record(self, waited, took, failed):
+        with self._lock:
+            self._stats['processed'] += 1
+            if failed:
+                self._stats['failed'] += 1
+            self._stats['wait_seconds_total'] += waited
+            self._stats['wait_seconds_max'] = max(self._stats['wait_seconds_max'], waited)
+            self._stats['processing_seconds_total'] += took
+            self._stats['processing_seconds_max'] = max(self._stats['processing_seconds_max'], took)
+
+    def stats(self):
+        """
+        Return statistics of the queue.
+
+        Returns:
+            dict: Current ``depth``, configured ``max_size`` and ``workers``, counters of ``enqueued``, ``rejected``,
+            ``processed`` and ``failed`` items, and total, average and maximal wait and processing times in seconds.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+
+        processed = stats['processed']
+        stats['depth'] = self._queue.qsize()
+        stats['max_size'] = self.max_size
+        stats['workers'] = self.workers
+        stats['wait_seconds_avg'] = stats['wait_seconds_total'] / processed if processed else 0.0
+        stats['processing_seconds_avg'] = stats['processing_seconds_total'] / processed if processed else 0.0
+        return stats
+
+
+class Coalescer:
+    """
+    Stage in front of a queue folding items with the same key that arrive within a window into a single item.
+
+    The first item with a given key opens a window of ``window`` seconds. Items with the same key arriving before
+    the window closes replace the waiting item if they are newer, and are dropped otherwise. When the window closes,
+    the waiting item is passed to ``output``. If ``output`` refuses it (returns False, e.g. because the queue is
+    full), the item waits for another window and is passed on again.
+
+    Args:
+        output(callable): Function called with every item whose window closed, e.g. :meth:`WorkQueue.put`.
+        window(float): Length of the window in seconds.
+        is_newer(callable, optional): Function telling whether its first argument is newer than the second one.
+            By default, the item that arrived later is newer.
+        max_size(int): Maximal number of keys waiting for their window to close. 0 means unbounded.
+    """
+
+    def __init__(self, output, window=2.0, is_newer=None, max_size=0):
+        self.output = output
+        self.window = window
+        self.is_newer = is_newer or (lambda item, other: True)
+        self.max_size = max_size
+        self.coalesced = 0
+        self._pending = {}
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def add(self, key, item):
+        """
+        Add an item, folding it with a waiting item of the same key if there is one.
+
+        Args:
+            key: Key of the item, e.g. repository name and issue number.
+            item: The item.
+
+        Returns:
+            bool: True if the item opened a new window, False if it was folded into a waiting item.
+
+        Raises:
+            queue.Full: If the item would open a new window, but ``max_size`` keys are waiting already.
+        """
+        with self._condition:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._flush, name="coalescer", daemon=True)
+                self._thread.start()
+
+            pending = self._pending.get(key)
+            if pending is not None:
+                self.coalesced += 1
+                if self.is_newer(item, pending[1]):
+                    self._pending[key] = (pending[0], item)
+                return False
+
+            if self.max_size and len(self._pending) >= self.max_size:
+                raise queue.Full
+
+            self._pending[key] = (time.monotonic() + self.window, item)
+            self._condition.notify_all()
+            return True
+
+    def __contains__(self, key):
+        with self._condition:
+            return key in self._pending
+
+    def depth(self):
+        with self._condition:
+            return len(self._pending)
+
+    def _flush(self):
+        while True:
+            with self._condition:
+                now = time.monotonic()
+                due = [key for key, (deadline, _) in self._pending.items() if deadline <= now]
+                items = [(key, self._pending.pop(key)[1]) for key in due]
+                if not items:
+                    deadlines = [deadline for deadline, _ in self._pending.values()]
+                    self._condition.wait(min(deadlines) - now if deadlines else None)
+                    continue
+
+            for key, item in items:
+                if self.output(item) is False:
+                    logger.warning("Item {} could not be passed on after coalescing, it waits for another "
+                                   "window.".format(item))
+                    self._retry(key, item)
+
+    def _retry(self, key, item):
+        with self._condition:
+            pending = self._pending.get(key)
+            if pending is None:
+                self._pending[key] = (time.monotonic() + self.window, item)
+            elif not self.is_newer(pending[1], item):
+                self._pending[key] = (pending[0], item)
+
+
+class DeliveryLog:
+    """
+    Log of recently seen delivery ids, used to drop redelivered webhooks. Only the last ``max_size`` ids are kept.
+
+    A delivery which was not accepted (e.g. because the queue was full) has to be removed with :meth:`forget`, so that
+    its redelivery is not dropped.
+    """
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._ids = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def seen(self, delivery_id):
+        """
+        Record a delivery id.
+
+        Args:
+            delivery_id(str): Id of the delivery (``X-GitHub-Delivery`` header).
+
+        Returns:
+            bool: True if the id was seen before.
+        """
+        with self._lock:
+            if delivery_id in self._ids:
+                self._ids.move_to_end(delivery_id)
+                return True
+
+            self._ids[delivery_id] = True
+            while len(self._ids) > self.max_size:
+                self._ids.popitem(last=False)
+            return False
+
+    def forget(self, delivery_id):
+        """
+        Remove a delivery id, so that the delivery is accepted when it arrives again.
+        """
+        with self._lock:
+            self._ids.pop(delivery_id, None)
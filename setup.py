@@ -21,19 +21,29 @@ setup(
         'Natural Language :: English',
         'Programming Language :: Python',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.5',
+        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
         'Topic :: Software Development',
         'Topic :: Software Development :: Bug Tracking'
     ],
     url='https://github.com/melkamar/gitbot',
     include_package_data=True,
     packages=find_packages(),
+    python_requires='>=3.7',
     entry_points={
         'console_scripts': [
             'gitbot = gitbot.github_issues_bot:main'
         ]
     },
     install_requires=['flask', 'click>=6', 'requests', 'appdirs', 'markdown', 'configparser'],
+    extras_require={
+        'async': ['aiohttp'],
+        're2': ['google-re2'],
+        'server': ['waitress', 'gunicorn; platform_system != "Windows"'],
+    },
     setup_requires=['pytest-runner'],
     tests_require=['pytest', 'betamax']
 )
@@ -0,0 +1,153 @@
+"""
+Benchmark of the memory held by parsed issues.
+
+Run from the repository root::
+
+    python tests/benchmarks/bench_memory.py
+    python tests/benchmarks/bench_memory.py --issues 20000 --output memory.json
+
+Issues of synthetic corpora are parsed from JSON (as returned by the GitHub API, with full label objects) and kept,
+the memory they hold is measured with :mod:`tracemalloc`. Every corpus is parsed both into
+:class:`gitbot.github_issues_bot.Issue` and into :class:`LegacyIssue`, the plain representation issues had before
+they were made compact, and the footprint per issue is reported for both.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from gitbot import github_issues_bot  # noqa: E402
+from bench_rules import make_text  # noqa: E402
+
+LABELS = ("bug", "enhancement", "question", "help wanted", "duplicate", "invalid", "wontfix")
+
+CORPORA = {
+    'ascii': {'body_size': 2000, 'labels': 2, 'non_ascii': False},
+    'non_ascii': {'body_size': 2000, 'labels': 2, 'non_ascii': True},
+    'many_labels': {'body_size': 200, 'labels': 6, 'non_ascii': False},
+}
+
+
+class LegacyIssue:
+    """
+    Issue as it was kept before :class:`gitbot.github_issues_bot.Issue` was made compact - attributes in a
+    ``__dict__``, labels as the label objects of the API response and the body as a string.
+    """
+
+    def __init__(self, url, comments_url, labels, state_open, title, body, number, reponame, comments_count=None,
+                 updated_at=None):
+        self.url = url
+        self.comments_url = comments_url
+        self.labels = labels
+        self.state_open = state_open
+        self.title = title
+        self.body = body
+        self.number = number
+        self.reponame = reponame
+        self.comments_count = comments_count
+        self.updated_at = updated_at
+
+    @staticmethod
+    def parse(json_response, repository):
+        return LegacyIssue(json_response.get("url"), json_response.get("comments_url"), json_response.get("labels"),
+                           json_response.get("state") == "open", json_response.get("title"),
+                           json_response.get("body"), json_response.get("number"), repository,
+                           json_response.get("comments"), json_response.get("updated_at"))
+
+
+def make_label(name, generator):
+    return {
+        "id": generator.randrange(10 ** 9),
+        "node_id": "MDU6TGFiZWw{}".format(generator.randrange(10 ** 9)),
+        "url": "https://api.github.com/repos/bench/repo/labels/{}".format(name.replace(" ", "%20")),
+        "name": name,
+        "color": "f29513",
+        "default": True,
+    }
+
+
+def make_lines(count, body_size, labels, non_ascii, seed=0):
+    """
+    Return ``count`` issues encoded as JSON, like lines of an issue export.
+    """
+    generator = random.Random(seed)
+    lines = []
+    for number in range(1, count + 1):
+        body = make_text(body_size, generator)
+        if non_ascii:
+            body = body[:-2] + " \U0001F41B"
+        lines.append(json.dumps({
+            "url": "https://api.github.com/repos/bench/repo/issues/{}".format(number),
+            "comments_url": "https://api.github.com/repos/bench/repo/issues/{}/comments".format(number),
+            "labels": [make_label(name, generator) for name in generator.sample(LABELS, labels)],
+            "state": "open",
+            "title": make_text(60, generator),
+            "body": body,
+            "number": number,
+            "comments": 0,
+            "updated_at": "2016-10-31T17:07:55Z",
+        }))
+    return lines
+
+
+def footprint(parse, lines):
+    """
+    Parse all lines with ``parse`` and return the number of bytes the kept issues hold per issue.
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        issues = [parse(json.loads(line), "bench/repo") for line in lines]
+        gc.collect()
+        held = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    assert len(issues) == len(lines)
+    return held / len(lines)
+
+
+def run(issues=2000):
+    """
+    Measure the footprint of both representations on all corpora.
+
+    Returns:
+        :obj:`list` of :obj:`dict`: One result per corpus with ``legacy_bytes`` and ``compact_bytes`` per issue.
+    """
+    results = []
+    for name, params in CORPORA.items():
+        lines = make_lines(issues, **params)
+        results.append({'corpus': name, 'params': params,
+                        'legacy_bytes': footprint(LegacyIssue.parse, lines),
+                        'compact_bytes': footprint(github_issues_bot.Issue.parse, lines)})
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--issues', type=int, default=2000, help="Number of issues in each corpus.")
+    parser.add_argument('--output', help="File to write the results to as JSON.")
+    args = parser.parse_args(argv)
+
+    results = run(args.issues)
+    print("{:<12} {:>14} {:>14} {:>8}".format("corpus", "before B/issue", "after B/issue", "saved"))
+    for result in results:
+        print("{:<12} {:>14.0f} {:>14.0f} {:>7.0%}".format(
+            result['corpus'], result['legacy_bytes'], result['compact_bytes'],
+            1 - result['compact_bytes'] / result['legacy_bytes']))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({'python': platform.python_version(), 'machine': platform.machine(), 'results': results}, f,
+                      indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,211 @@
+"""
+Benchmarks of rule evaluation on synthetic issue corpora.
+
+Run from the repository root::
+
+    python tests/benchmarks/bench_rules.py --output results.json
+    python tests/benchmarks/bench_rules.py --compare results.json
+
+Corpora vary in body size, number of comments and number of rules. Rules are the ones of the shipped ``rules.cfg``
+followed by generated ones. Every benchmark reports the number of operations per second, results are printed as
+a table and optionally written as JSON. With ``--compare``, results are compared to a previous JSON file and the
+script fails if any benchmark got slower by more than ``--threshold``.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+
+from gitbot import github_issues_bot  # noqa: E402
+
+SHIPPED_RULES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "rules.cfg")
+
+WORDS = ("the app crashes when I click on the button and nothing happens afterwards please have a look at "
+         "this log output from version two of the library running on linux with python three").split()
+
+FULL_MATRIX = {'body_sizes': [200, 2000, 20000], 'comment_counts': [0, 5, 50], 'rule_counts': [10, 200, 2000],
+               'issues': 50}
+QUICK_MATRIX = {'body_sizes': [200], 'comment_counts': [0, 5], 'rule_counts': [10, 200], 'issues': 5}
+
+
+def shipped_rules():
+    with open(SHIPPED_RULES) as f:
+        return github_issues_bot.parse_rules(f)
+
+
+def make_rules(count, seed=0):
+    """
+    Return ``count`` rules - the shipped ones followed by generated keyword, alternation and wildcard rules, most of
+    which do not match the generated texts.
+    """
+    generator = random.Random(seed)
+    rules = shipped_rules()[:count]
+    shapes = [r'\bkeyword{0}\b', r'(term{0}|phrase{0}|word{0})', r'error\s+code\s+{0}\b', r'module{0}.*failed']
+    for index in itertools.count():
+        if len(rules) >= count:
+            break
+        pattern = shapes[index % len(shapes)].format(index)
+        if generator.random() < 0.01:
+            pattern = generator.choice(WORDS)
+        rules.append(github_issues_bot.Rule(pattern, "label{}".format(index)))
+    return rules
+
+
+def make_text(size, generator):
+    words = []
+    length = 0
+    while length < size:
+        word = generator.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    if generator.random() < 0.3:
+        words.insert(generator.randrange(len(words)), "why does it fail?")
+    return " ".join(words)[:size]
+
+
+def make_issue_json(number, body_size, comment_count, generator):
+    return {
+        "url": "https://api.github.com/repos/bench/repo/issues/{}".format(number),
+        "comments_url": "https://api.github.com/repos/bench/repo/issues/{}/comments".format(number),
+        "labels": [],
+        "state": "open",
+        "title": make_text(60, generator),
+        "body": make_text(body_size, generator),
+        "number": number,
+        "comments": comment_count,
+        "updated_at": "2016-10-31T17:07:55Z",
+    }
+
+
+def make_corpus(count, body_size, comment_count, seed=0):
+    """
+    Return ``count`` pairs of issue JSON (as from the GitHub API) and texts of its comments.
+    """
+    generator = random.Random(seed)
+    return [(make_issue_json(number, body_size, comment_count, generator),
+             [make_text(200, generator) for _ in range(comment_count)])
+            for number in range(1, count + 1)]
+
+
+def measure(function, operations, min_time=0.2):
+    """
+    Call ``function`` (doing ``operations`` operations) until ``min_time`` passes, return operations per second.
+    """
+    calls = 0
+    started = time.perf_counter()
+    while True:
+        function()
+        calls += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time:
+            return calls * operations / elapsed
+
+
+def run(matrix, min_time=0.2):
+    """
+    Run all benchmarks over the matrix of corpus parameters.
+
+    Returns:
+        :obj:`list` of :obj:`dict`: One result per benchmark and parameters, with ``ops_per_sec``.
+    """
+    github_issues_bot.logger.setLevel("ERROR")
+    results = []
+
+    def record(name, params, ops_per_sec):
+        results.append({'benchmark': name, 'params': params, 'ops_per_sec': ops_per_sec})
+
+    for body_size, comment_count in itertools.product(matrix['body_sizes'], matrix['comment_counts']):
+        corpus = make_corpus(matrix['issues'], body_size, comment_count)
+        issues = [github_issues_bot.Issue.parse(issue_json, "bench/repo") for issue_json, _ in corpus]
+        encoded = [json.dumps(issue_json) for issue_json, _ in corpus]
+
+        if comment_count == matrix['comment_counts'][0]:
+            params = {'body_size': body_size}
+            record('issue_parse', params, measure(
+                lambda: [github_issues_bot.Issue.parse(issue_json, "bench/repo") for issue_json, _ in corpus],
+                len(corpus), min_time))
+            record('issue_parse_json', params, measure(
+                lambda: [github_issues_bot.Issue.parse(json.loads(line), "bench/repo") for line in encoded],
+                len(encoded), min_time))
+
+        for rule_count in matrix['rule_counts']:
+            rules = make_rules(rule_count)
+            rule_set = github_issues_bot.RuleSet(rules)
+            params = {'body_size': body_size, 'comment_count': comment_count, 'rule_count': rule_count}
+
+            if comment_count == matrix['comment_counts'][0]:
+                bodies = [issue.body for issue in issues]
+                record('rule_check_fits', {'body_size': body_size, 'rule_count': rule_count}, measure(
+                    lambda: [rule.check_fits(body) for body in bodies for rule in rules], len(bodies), min_time))
+                record('rule_set_matching', {'body_size': body_size, 'rule_count': rule_count}, measure(
+                    lambda: [rule_set.matching(body) for body in bodies], len(bodies), min_time))
+
+            def process_corpus():
+                for issue, (_, comments) in zip(issues, corpus):
+                    github_issues_bot.process_issue(issue, predef_comments=comments, predef_rules=rules,
+                                                    dry_run=True)
+
+            record('process_issue', params, measure(process_corpus, len(issues), min_time))
+
+    return results
+
+
+def key(result):
+    return result['benchmark'] + json.dumps(result['params'], sort_keys=True)
+
+
+def compare(results, baseline, threshold):
+    """
+    Compare results to a baseline.
+
+    Returns:
+        :obj:`list` of :obj:`str`: Descriptions of benchmarks slower than the baseline by more than ``threshold``.
+    """
+    previous = {key(result): result['ops_per_sec'] for result in baseline['results']}
+    regressions = []
+    for result in results:
+        before = previous.get(key(result))
+        if before and result['ops_per_sec'] < before * (1 - threshold):
+            regressions.append("{} {}: {:.0f} ops/s, was {:.0f} ops/s".format(
+                result['benchmark'], result['params'], result['ops_per_sec'], before))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--quick', action='store_true', help="Run a small matrix, e.g. to check the benchmarks work.")
+    parser.add_argument('--min-time', type=float, default=0.2, help="Seconds spent measuring each benchmark.")
+    parser.add_argument('--output', help="File to write the results to as JSON.")
+    parser.add_argument('--compare', help="JSON file with previous results to compare to.")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="Relative slowdown reported as a regression. Defaults to 0.2.")
+    args = parser.parse_args(argv)
+
+    results = run(QUICK_MATRIX if args.quick else FULL_MATRIX, args.min_time)
+    for result in results:
+        print("{:<20} {:<70} {:>12.0f} ops/s".format(result['benchmark'], json.dumps(result['params']),
+                                                      result['ops_per_sec']))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({'python': platform.python_version(), 'machine': platform.machine(), 'results': results}, f,
+                      indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for regression in regressions:
+            print("REGRESSION: " + regression)
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
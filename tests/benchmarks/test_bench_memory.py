@@ -0,0 +1,12 @@
+import bench_memory
+
+
+def test_compact_issues_smaller():
+    """
+    Test that the memory benchmark runs and compact issues hold less memory than legacy ones on every corpus.
+    :return:
+    """
+    results = bench_memory.run(issues=50)
+
+    assert {result['corpus'] for result in results} == set(bench_memory.CORPORA)
+    assert all(0 < result['compact_bytes'] < result['legacy_bytes'] for result in results)
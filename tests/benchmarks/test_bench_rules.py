@@ -0,0 +1,30 @@
+import bench_rules
+
+
+def test_benchmarks_run():
+    """
+    Test that the benchmarks run on a small matrix and report every benchmark.
+    :return:
+    """
+    results = bench_rules.run(dict(bench_rules.QUICK_MATRIX, issues=2), min_time=0)
+
+    assert {result['benchmark'] for result in results} == {
+        'issue_parse', 'issue_parse_json', 'rule_check_fits', 'rule_set_matching', 'process_issue'}
+    assert all(result['ops_per_sec'] > 0 for result in results)
+
+
+def test_compare_reports_regressions():
+    """
+    Test that only benchmarks slower than the threshold are reported.
+    :return:
+    """
+    baseline = {'results': [{'benchmark': 'a', 'params': {'n': 1}, 'ops_per_sec': 100},
+                            {'benchmark': 'b', 'params': {'n': 1}, 'ops_per_sec': 100}]}
+    results = [{'benchmark': 'a', 'params': {'n': 1}, 'ops_per_sec': 90},
+               {'benchmark': 'b', 'params': {'n': 1}, 'ops_per_sec': 50},
+               {'benchmark': 'c', 'params': {'n': 1}, 'ops_per_sec': 1}]
+
+    regressions = bench_rules.compare(results, baseline, 0.2)
+
+    assert len(regressions) == 1
+    assert regressions[0].startswith("b ")
@@ -0,0 +1,261 @@
+"""
+Local stand-in for the parts of the GitHub API used by gitbot, for load tests.
+
+It serves paginated issue lists (``state``, ``per_page``, ``page`` and ``since`` parameters), issue comments, issue
+PATCH and adding of labels, keeping the labels of issues in memory. Every response can be delayed, a rate limit can
+be enforced with GitHub's headers and a share of requests can be answered with server errors. All requests are
+counted per kind of endpoint and per issue.
+"""
+import collections
+import json
+import math
+import random
+import re
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = ("the app crashes when I click on the button and nothing happens afterwards please have a look at "
+         "this log output from version two of the library running on linux with python three").split()
+
+ISSUES_PATH = re.compile(r'^/repos/(?P<repository>[^/]+/[^/]+)/issues$')
+ISSUE_PATH = re.compile(r'^/repos/(?P<repository>[^/]+/[^/]+)/issues/(?P<number>\d+)(?P<rest>/comments|/labels)?$')
+
+
+class FakeGitHub:
+    """
+    Fake GitHub API server running in a background thread.
+
+    Args:
+        repositories(:obj:`list` of :obj:`str`): Names of the served repositories.
+        issues(int): Number of open issues in every repository.
+        comments(int): Number of comments of every issue.
+        latency(float): Seconds every response is delayed by.
+        rate_limit(int, optional): Number of requests allowed per ``rate_window`` seconds. Further requests are
+            answered with ``403`` until the window resets. Unlimited by default.
+        rate_window(float): Length of the rate limit window in seconds.
+        error_rate(float): Share of requests answered with ``502 Bad Gateway``.
+        seed(int): Seed of the generated texts and of the injected errors.
+    """
+
+    def __init__(self, repositories, issues=100, comments=2, latency=0.0, rate_limit=None, rate_window=60.0,
+                 error_rate=0.0, seed=0):
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.error_rate = error_rate
+        self.requests = collections.Counter()
+        self.issue_requests = collections.Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._window_reset = time.time() + rate_window
+        self._window_used = 0
+
+        generator = random.Random(seed)
+        self.issues = {repository: {number: self._make_issue(number, generator) for number in range(1, issues + 1)}
+                       for repository in repositories}
+        self.comments = {repository: {number: [{"body": _text(200, generator)} for _ in range(comments)]
+                                      for number in self.issues[repository]}
+                         for repository in repositories}
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @staticmethod
+    def _make_issue(number, generator):
+        return {"title": "Issue {}".format(number),
+                "body": _text(500, generator),
+                "labels": [],
+                "updated_at": "2016-10-31T17:07:55Z"}
+
+    @property
+    def url(self):
+        return "http://{}:{}".format(*self._server.server_address)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-github", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def issue_json(self, repository, number):
+        """
+        Return an issue in the format of the GitHub API.
+        """
+        issue = self.issues[repository][number]
+        base = "{}/repos/{}/issues/{}".format(self.url, repository, number)
+        return {"url": base,
+                "comments_url": base + "/comments",
+                "repository_url": "{}/repos/{}".format(self.url, repository),
+                "labels": [{"name": label} for label in issue["labels"]],
+                "state": "open",
+                "title": issue["title"],
+                "body": issue["body"],
+                "number": number,
+                "comments": len(self.comments[repository][number]),
+                "updated_at": issue["updated_at"]}
+
+    def _limit(self):
+        """
+        Count a request against the rate limit.
+
+        Returns:
+            tuple: Rate limit headers and True if the request is over the limit.
+        """
+        with self._lock:
+            now = time.time()
+            if now >= self._window_reset:
+                self._window_reset = now + self.rate_window
+                self._window_used = 0
+
+            if self.rate_limit is None:
+                return {}, False
+
+            self._window_used += 1
+            remaining = max(self.rate_limit - self._window_used, 0)
+            headers = {'X-RateLimit-Limit': str(self.rate_limit),
+                       'X-RateLimit-Remaining': str(remaining),
+                       'X-RateLimit-Reset': str(math.ceil(self._window_reset))}
+            return headers, self._window_used > self.rate_limit
+
+    def _handler_class(self):
+        github = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                self._handle('GET')
+
+            def do_PATCH(self):
+                self._handle('PATCH')
+
+            def do_POST(self):
+                self._handle('POST')
+
+            def _handle(self, method):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length).decode('utf-8')) if length else None
+                url = urllib.parse.urlsplit(self.path)
+
+                if github.latency:
+                    time.sleep(github.latency)
+
+                headers, limited = github._limit()
+                if limited:
+                    with github._lock:
+                        github.requests['rate_limited'] += 1
+                    return self._send(403, {"message": "API rate limit exceeded"}, headers)
+
+                with github._lock:
+                    failed = github._random.random() < github.error_rate
+                    if failed:
+                        github.requests['errors'] += 1
+                if failed:
+                    return self._send(502, {"message": "Server Error"}, headers)
+
+                status, payload, extra = github.route(method, url.path, urllib.parse.parse_qs(url.query), body)
+                headers.update(extra)
+                self._send(status, payload, headers)
+
+            def _send(self, status, payload, headers):
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+    def route(self, method, path, query, body):
+        """
+        Answer a request that passed the rate limit and error injection.
+
+        Returns:
+            tuple: Status code, JSON payload and extra headers.
+        """
+        match = ISSUES_PATH.match(path)
+        if match and method == 'GET':
+            return self._list_issues(match.group('repository'), query)
+
+        match = ISSUE_PATH.match(path)
+        if not match or match.group('repository') not in self.issues:
+            return 404, {"message": "Not Found"}, {}
+
+        repository, number, rest = match.group('repository'), int(match.group('number')), match.group('rest')
+        if number not in self.issues[repository]:
+            return 404, {"message": "Not Found"}, {}
+
+        with self._lock:
+            self.issue_requests[(repository, number)] += 1
+            issue = self.issues[repository][number]
+
+            if method == 'GET' and rest == '/comments':
+                self.requests['comments'] += 1
+                return 200, self.comments[repository][number], {}
+
+            if method == 'PATCH' and rest is None:
+                self.requests['patch'] += 1
+                issue['labels'] = list(body.get('labels', issue['labels']))
+            elif method == 'POST' and rest == '/labels':
+                self.requests['add_labels'] += 1
+                issue['labels'] += [label for label in body['labels'] if label not in issue['labels']]
+            else:
+                return 404, {"message": "Not Found"}, {}
+
+            issue['updated_at'] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+        return 200, self.issue_json(repository, number), {}
+
+    def _list_issues(self, repository, query):
+        if repository not in self.issues:
+            return 404, {"message": "Not Found"}, {}
+
+        per_page = int(query.get('per_page', ['30'])[0])
+        page = int(query.get('page', ['1'])[0])
+        since = query.get('since', [None])[0]
+
+        with self._lock:
+            self.requests['issues'] += 1
+            numbers = sorted(number for number, issue in self.issues[repository].items()
+                             if not since or issue['updated_at'] >= since)
+
+        payload = [self.issue_json(repository, number) for number in numbers[(page - 1) * per_page:page * per_page]]
+        headers = {}
+        if page * per_page < len(numbers):
+            params = dict((name, values[0]) for name, values in query.items())
+            params['page'] = page + 1
+            headers['Link'] = '<{}/repos/{}/issues?{}>; rel="next"'.format(self.url, repository,
+                                                                          urllib.parse.urlencode(params))
+        return 200, payload, headers
+
+
+def _text(size, generator):
+    words = []
+    length = 0
+    while length < size:
+        words.append(generator.choice(WORDS))
+        length += len(words[-1]) + 1
+    if generator.random() < 0.3:
+        words.insert(generator.randrange(len(words)), "bug in the parser")
+    if generator.random() < 0.2:
+        words.append("why does it fail?")
+    return " ".join(words)
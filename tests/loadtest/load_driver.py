@@ -0,0 +1,246 @@
+"""
+Load test of gitbot against a local fake GitHub API (see :mod:`fake_github`).
+
+Run from the repository root::
+
+    python tests/loadtest/load_driver.py --repositories 4 --issues 500 --latency 0.02 --workers 8
+
+Two scenarios are run against the same fake server:
+
+- ``sweep`` - the console mode sweep, :func:`gitbot.github_issues_bot.process_repositories`, over all repositories.
+- ``webhooks`` - signed ``issues`` webhooks posted to ``web_listener.app``, processed by its work queue.
+
+For each scenario, the report holds the throughput, p50 and p99 latency of processing an issue (for the sweep, the
+time spent in ``process_issue``, for webhooks, from posting the webhook until the issue is labelled) and the number of GitHub requests, in total and per issue. The report
+is printed as JSON. With ``--max-requests-per-issue``, the driver fails if any issue caused more requests, which
+catches N+1 request regressions such as fetching comments once per rule.
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import math
+import os
+import sys
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from gitbot import github_issues_bot  # noqa: E402
+from gitbot.scheduler import RateLimitScheduler  # noqa: E402
+from gitbot.sessions import SessionManager  # noqa: E402
+from fake_github import FakeGitHub  # noqa: E402
+
+SHIPPED_RULES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "rules.cfg")
+
+# module globals pointed at the fake server for the duration of a run
+PATCHED = ('fetch_issues_url', 'edit_issue_url', 'add_labels_url', 'comment_store', 'request_scheduler', 'sessions')
+
+
+def percentile(values, fraction):
+    """
+    Return the nearest-rank percentile of the values, or None if there are none.
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+class Recorder:
+    """
+    Wraps :func:`gitbot.github_issues_bot.process_issue` to record when each issue finished processing and how long
+    the processing took.
+    """
+
+    def __init__(self):
+        self.finished = {}
+        self.durations = {}
+        self._lock = threading.Lock()
+        self._original = github_issues_bot.process_issue
+
+    def __enter__(self):
+        def process_issue(issue, *args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return self._original(issue, *args, **kwargs)
+            finally:
+                finished = time.perf_counter()
+                with self._lock:
+                    self.finished[(issue.reponame, issue.number)] = finished
+                    self.durations[(issue.reponame, issue.number)] = finished - started
+
+        github_issues_bot.process_issue = process_issue
+        return self
+
+    def __exit__(self, *exc_info):
+        github_issues_bot.process_issue = self._original
+
+    def wait_for(self, count, timeout):
+        deadline = time.perf_counter() + timeout
+        while len(self.finished) < count and time.perf_counter() < deadline:
+            time.sleep(0.01)
+        return len(self.finished) >= count
+
+
+def snapshot(github):
+    return dict(github.requests), dict(github.issue_requests)
+
+
+def report(name, github, before, started, finished_at, latencies, issues):
+    """
+    Summarize a scenario from request counters of the fake server and latencies of processed issues.
+    """
+    requests_before, issue_requests_before = before
+    requests = {kind: count - requests_before.get(kind, 0) for kind, count in github.requests.items()}
+    per_issue = [count - issue_requests_before.get(key, 0) for key, count in github.issue_requests.items()]
+    elapsed = max(finished_at - started, 1e-9)
+
+    return {
+        'scenario': name,
+        'issues': issues,
+        'processed': len(latencies),
+        'seconds': elapsed,
+        'issues_per_sec': len(latencies) / elapsed,
+        'latency_ms': {'p50': _ms(percentile(latencies, 0.5)), 'p99': _ms(percentile(latencies, 0.99))},
+        'requests': requests,
+        'requests_total': sum(count for kind, count in requests.items()),
+        'requests_per_issue': {'avg': sum(requests.values()) / issues if issues else 0,
+                               'max_on_one_issue': max(per_issue) if per_issue else 0},
+    }
+
+
+def _ms(seconds):
+    return None if seconds is None else seconds * 1000
+
+
+def run_sweep(github, repositories, workers):
+    """
+    Run the console mode sweep over all repositories.
+    """
+    before = snapshot(github)
+    with Recorder() as recorder:
+        started = time.perf_counter()
+        github_issues_bot.process_repositories("load-test-token", repositories, workers, skip_labelled=False)
+        finished_at = time.perf_counter()
+
+    latencies = list(recorder.durations.values())
+    issues = sum(len(github.issues[repository]) for repository in repositories)
+    return report('sweep', github, before, started, finished_at, latencies, issues)
+
+
+def run_webhooks(github, repositories, workers, secret, timeout=60.0):
+    """
+    Post a signed ``edited`` webhook for every issue to ``web_listener.app`` and wait until all are processed.
+    """
+    from gitbot import web_listener
+
+    saved_secret, saved_config = web_listener.HOOK_SECRET_KEY, dict(web_listener.app.config)
+    web_listener.HOOK_SECRET_KEY = secret
+    web_listener.app.config.update(TESTING=False, WORKERS=workers, COALESCE_WINDOW=0, RULES_RELOAD_INTERVAL=0)
+    try:
+        return _post_webhooks(github, repositories, web_listener.app.test_client(), secret, timeout)
+    finally:
+        web_listener.HOOK_SECRET_KEY = saved_secret
+        web_listener.app.config.update(saved_config)
+
+
+def _post_webhooks(github, repositories, client, secret, timeout):
+    before = snapshot(github)
+    posted = {}
+    rejected = 0
+    with Recorder() as recorder:
+        started = time.perf_counter()
+        for repository in repositories:
+            for number in sorted(github.issues[repository]):
+                body = json.dumps({'action': 'edited',
+                                   'issue': github.issue_json(repository, number),
+                                   'repository': {'full_name': repository}}).encode('utf-8')
+                signature = hmac.new(secret.encode('utf-8'), body, hashlib.sha1).hexdigest()
+                posted[(repository, number)] = time.perf_counter()
+                response = client.post('/callback', data=body,
+                                       headers={'X-Hub-Signature': 'sha1=' + signature,
+                                                'X-GitHub-Delivery': str(uuid.uuid4()),
+                                                'Content-Type': 'application/json'})
+                if response.status_code != 202:
+                    rejected += 1
+                    del posted[(repository, number)]
+
+        recorder.wait_for(len(posted), timeout)
+        finished_at = time.perf_counter()
+
+    latencies = [recorder.finished[key] - posted[key] for key in posted if key in recorder.finished]
+    result = report('webhooks', github, before, started, finished_at, latencies, len(posted) + rejected)
+    result['rejected'] = rejected
+    return result
+
+
+def run(repositories=2, issues=100, comments=2, latency=0.0, rate_limit=None, rate_window=60.0, error_rate=0.0,
+        workers=4, scenarios=('sweep', 'webhooks'), rules_file=SHIPPED_RULES):
+    """
+    Start a fake GitHub, point gitbot to it and run the scenarios.
+
+    Returns:
+        :obj:`list` of :obj:`dict`: Report of every scenario.
+    """
+    github_issues_bot.logger.setLevel("ERROR")
+    github_issues_bot.init_rules_logic(rules_file)
+    names = ["load/repo{}".format(index) for index in range(repositories)]
+
+    with FakeGitHub(names, issues, comments, latency, rate_limit, rate_window, error_rate) as github:
+        saved = {name: getattr(github_issues_bot, name) for name in PATCHED}
+        github_issues_bot.fetch_issues_url = github.url + '/repos/{}/issues?state={}'
+        github_issues_bot.edit_issue_url = github.url + '/repos/{}/issues/{}'
+        github_issues_bot.add_labels_url = github.url + '/repos/{}/issues/{}/labels'
+        github_issues_bot.comment_store = github_issues_bot.CommentStore()
+        github_issues_bot.request_scheduler = RateLimitScheduler()
+        github_issues_bot.sessions = SessionManager(github_issues_bot.create_session)
+        try:
+            results = []
+            if 'sweep' in scenarios:
+                results.append(run_sweep(github, names, workers))
+            if 'webhooks' in scenarios:
+                github_issues_bot.comment_store.clear()
+                results.append(run_webhooks(github, names, workers, "load-test-secret"))
+            return results
+        finally:
+            github_issues_bot.sessions.close()
+            for name, value in saved.items():
+                setattr(github_issues_bot, name, value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repositories', type=int, default=2, help="Number of repositories.")
+    parser.add_argument('--issues', type=int, default=100, help="Number of issues in every repository.")
+    parser.add_argument('--comments', type=int, default=2, help="Number of comments of every issue.")
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds every GitHub response is delayed by.")
+    parser.add_argument('--rate-limit', type=int, help="Requests allowed per rate limit window.")
+    parser.add_argument('--rate-window', type=float, default=60.0, help="Length of the rate limit window in seconds.")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Share of requests answered with an error.")
+    parser.add_argument('--workers', type=int, default=4, help="Workers of the sweep and of the web listener.")
+    parser.add_argument('--scenario', action='append', choices=['sweep', 'webhooks'],
+                        help="Scenario to run, may be repeated. Defaults to all.")
+    parser.add_argument('--rules-file', default=SHIPPED_RULES, help="Rules file. Defaults to the shipped rules.cfg.")
+    parser.add_argument('--max-requests-per-issue', type=int,
+                        help="Fail if any issue caused more GitHub requests than this in a scenario.")
+    args = parser.parse_args(argv)
+
+    results = run(args.repositories, args.issues, args.comments, args.latency, args.rate_limit, args.rate_window,
+                  args.error_rate, args.workers, args.scenario or ('sweep', 'webhooks'), args.rules_file)
+    print(json.dumps(results, indent=2))
+
+    if args.max_requests_per_issue is not None:
+        over = [result['scenario'] for result in results
+                if result['requests_per_issue']['max_on_one_issue'] > args.max_requests_per_issue]
+        if over:
+            print("Too many requests per issue in: {}".format(", ".join(over)), file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
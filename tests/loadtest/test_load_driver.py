@@ -0,0 +1,45 @@
+import requests
+
+import load_driver
+from gitbot import github_issues_bot
+
+
+def test_load_driver(monkeypatch):
+    """
+    Test that a small load test labels all issues with at most one comment fetch and one write per issue.
+    :param monkeypatch:
+    :return:
+    """
+    monkeypatch.setattr(github_issues_bot, "rules", [])
+    monkeypatch.setattr(github_issues_bot, "rule_set", github_issues_bot.RuleSet([]))
+    monkeypatch.setattr(github_issues_bot.logger, "level", github_issues_bot.logger.level)
+
+    sweep, webhooks = load_driver.run(repositories=2, issues=15, comments=1, workers=2)
+
+    assert sweep['processed'] == 30
+    assert sweep['requests']['issues'] == 2
+    assert sweep['requests']['comments'] == 30
+    assert sweep['requests_per_issue']['max_on_one_issue'] <= 2
+    assert webhooks['processed'] == 30
+    assert webhooks['rejected'] == 0
+    assert webhooks['requests'].get('add_labels', 0) == 0
+    assert webhooks['requests'].get('patch', 0) == 0
+
+
+def test_fake_github_limits_and_errors():
+    """
+    Test that the fake server enforces its rate limit and injects errors.
+    :return:
+    """
+    with load_driver.FakeGitHub(["load/repo"], issues=3, rate_limit=2) as github:
+        url = github.url + '/repos/load/repo/issues?state=open&per_page=2'
+        first = requests.get(url)
+        assert first.status_code == 200
+        assert first.headers['X-RateLimit-Remaining'] == '1'
+        assert 'rel="next"' in first.headers['Link']
+        assert requests.get(url).status_code == 200
+        assert requests.get(url).status_code == 403
+
+    with load_driver.FakeGitHub(["load/repo"], issues=1, error_rate=1.0) as github:
+        assert requests.get(github.url + '/repos/load/repo/issues/1/comments').status_code == 502
+        assert github.requests['errors'] == 1
@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+from gitbot import github_issues_bot
+
+aiohttp = pytest.importorskip("aiohttp")
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from gitbot import async_client
+
+repository = "melkamar/test"
+
+
+def make_stub_app(issue_count, per_page):
+    """
+    Stub of GitHub API with a paginated issue list, comments, issue PATCH and adding of labels.
+    """
+    requests_log = []
+    patches = {}
+
+    def issue_json(request, number):
+        base = str(request.url.origin())
+        return {"url": "{}/repos/{}/issues/{}".format(base, repository, number),
+                "comments_url": "{}/repos/{}/issues/{}/comments".format(base, repository, number),
+                "labels": [],
+                "state": "open",
+                "title": "Issue {}".format(number),
+                "body": "bug in here" if number % 2 else "all good",
+                "number": number,
+                "comments": 1,
+                "updated_at": "2016-10-31T17:07:{:02d}Z".format(number)}
+
+    async def list_issues(request):
+        requests_log.append(('GET', request.path))
+        page = int(request.query.get('page', 1))
+        numbers = range((page - 1) * per_page + 1, min(page * per_page, issue_count) + 1)
+        headers = {}
+        if page * per_page < issue_count:
+            headers['Link'] = '<{}/repos/{}/issues?state=open&page={}>; rel="next"'.format(
+                request.url.origin(), repository, page + 1)
+        return web.json_response([issue_json(request, number) for number in numbers], headers=headers)
+
+    async def comments(request):
+        requests_log.append(('GET', request.path))
+        number = int(request.match_info['number'])
+        return web.json_response([{"body": "Why does it crash?" if number == 4 else "me too"}])
+
+    async def patch_issue(request):
+        requests_log.append(('PATCH', request.path))
+        patches[int(request.match_info['number'])] = ('PATCH', (await request.json())['labels'])
+        return web.json_response({})
+
+    async def add_labels(request):
+        requests_log.append(('POST', request.path))
+        patches[int(request.match_info['number'])] = ('POST', (await request.json())['labels'])
+        return web.json_response([])
+
+    app = web.Application()
+    app.router.add_get('/repos/{owner}/{name}/issues', list_issues)
+    app.router.add_get('/repos/{owner}/{name}/issues/{number}/comments', comments)
+    app.router.add_patch('/repos/{owner}/{name}/issues/{number}', patch_issue)
+    app.router.add_post('/repos/{owner}/{name}/issues/{number}/labels', add_labels)
+    return app, requests_log, patches
+
+
+def test_process_repositories_async(monkeypatch):
+    """
+    Test that the async engine fetches all pages, fetches comments only when needed and applies labels.
+    :param monkeypatch:
+    :return:
+    """
+    monkeypatch.setattr(github_issues_bot, "rule_set", github_issues_bot.RuleSet([
+        github_issues_bot.Rule("bug", "bug"),
+        github_issues_bot.Rule(r"why.*\?", "question"),
+    ]))
+    monkeypatch.setattr(github_issues_bot, "comment_store", github_issues_bot.CommentStore())
+    monkeypatch.setattr(github_issues_bot, "response_cache", None)
+
+    app, requests_log, patches = make_stub_app(issue_count=5, per_page=2)
+
+    async def run():
+        server = TestServer(app)
+        await server.start_server()
+        try:
+            base = str(server.make_url(''))
+            monkeypatch.setattr(github_issues_bot, "fetch_issues_url", base + '/repos/{}/issues?state={}')
+            monkeypatch.setattr(github_issues_bot, "edit_issue_url", base + '/repos/{}/issues/{}')
+            monkeypatch.setattr(github_issues_bot, "add_labels_url", base + '/repos/{}/issues/{}/labels')
+            return await async_client.process_repositories("token", [repository], concurrency=3)
+        finally:
+            await server.close()
+
+    results = asyncio.run(run())
+
+    assert results == {repository: {'processed': 5, 'skipped': 0, 'writes': 4}}
+    assert len([r for r in requests_log if r[1].endswith('/issues')]) == 3
+    assert len([r for r in requests_log if r[1].endswith('/comments')]) == 5
+    assert patches == {1: ('POST', ['bug']), 3: ('POST', ['bug']), 4: ('POST', ['question']), 5: ('POST', ['bug'])}
@@ -0,0 +1,49 @@
+import io
+import json
+
+import pytest
+from gitbot import batch, github_issues_bot
+
+
+def issue_line(number, body, comments=None, labels=()):
+    issue = {"url": "https://api.github.com/repos/melkamar/test/issues/{}".format(number),
+             "comments_url": "https://api.github.com/repos/melkamar/test/issues/{}/comments".format(number),
+             "repository_url": "https://api.github.com/repos/melkamar/test",
+             "labels": [{"name": label} for label in labels],
+             "state": "open",
+             "title": "Issue {}".format(number),
+             "body": body,
+             "number": number,
+             "comments": comments if comments is not None else 0}
+    return json.dumps(issue) + "\n"
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_label_file(tmpdir, monkeypatch, processes):
+    """
+    Test that exported issues get the same labels as from a dry run of process_issue, in the order of the input.
+    :param tmpdir:
+    :param monkeypatch:
+    :param processes:
+    :return:
+    """
+    monkeypatch.setattr(github_issues_bot, "rules", [])
+    monkeypatch.setattr(github_issues_bot, "rule_set", github_issues_bot.RuleSet([]))
+    rules_file = tmpdir.join("rules.cfg")
+    rules_file.write("bug=>bug\nwhy.*\\?=>question\n")
+    input_file = io.StringIO(issue_line(1, "a bug") +
+                             "\n" +
+                             issue_line(2, "all good", [{"body": "but why?"}]) +
+                             "not json\n" +
+                             issue_line(3, "nothing", labels=["wontfix"]))
+    output_file = io.StringIO()
+
+    count = batch.label_file(input_file, output_file, str(rules_file), processes, chunk_size=1,
+                             default_label="triage")
+
+    assert count == 3
+    assert [json.loads(line) for line in output_file.getvalue().splitlines()] == [
+        {"repository": "melkamar/test", "number": 1, "labels": ["bug"]},
+        {"repository": "melkamar/test", "number": 2, "labels": ["question"]},
+        {"repository": "melkamar/test", "number": 3, "labels": ["triage", "wontfix"]},
+    ]
@@ -0,0 +1,122 @@
+import threading
+
+from gitbot import github_issues_bot
+
+
+def make_issue(comments_count=1, updated_at="2016-10-31T17:07:55Z"):
+    return github_issues_bot.Issue("http://test.org",
+                                   "http://test.org/comments",
+                                   [],
+                                   True,
+                                   "Issue title",
+                                   "Issue body.",
+                                   1,
+                                   "melkamar/test",
+                                   comments_count,
+                                   updated_at)
+
+
+def count_fetches(monkeypatch):
+    fetched = []
+
+    def fake_fetch_comments(issue, session=None):
+        fetched.append(issue.comments_url)
+        return ["some comment"]
+
+    monkeypatch.setattr(github_issues_bot, "fetch_comments", fake_fetch_comments)
+    monkeypatch.setattr(github_issues_bot, "comment_store", github_issues_bot.CommentStore())
+    return fetched
+
+
+def test_comments_fetched_once_per_issue(monkeypatch):
+    """
+    Test that comments are fetched only once even if no rule matches the issue.
+    :param monkeypatch:
+    :return:
+    """
+    fetched = count_fetches(monkeypatch)
+    rules = [github_issues_bot.Rule("nothing{}".format(i), "label{}".format(i)) for i in range(10)]
+
+    github_issues_bot.process_issue(make_issue(), predef_rules=rules, dry_run=True)
+
+    assert len(fetched) == 1
+
+
+def test_comments_reused_while_issue_unchanged(monkeypatch):
+    """
+    Test that stored comments are reused across iterations until the issue changes.
+    :param monkeypatch:
+    :return:
+    """
+    fetched = count_fetches(monkeypatch)
+    rules = [github_issues_bot.Rule("nothing", "label")]
+
+    github_issues_bot.process_issue(make_issue(), predef_rules=rules, dry_run=True)
+    github_issues_bot.process_issue(make_issue(), predef_rules=rules, dry_run=True)
+    assert len(fetched) == 1
+
+    github_issues_bot.process_issue(make_issue(comments_count=2), predef_rules=rules, dry_run=True)
+    assert len(fetched) == 2
+
+    github_issues_bot.process_issue(make_issue(comments_count=2, updated_at="2016-11-01T10:00:00Z"),
+                                    predef_rules=rules, dry_run=True)
+    assert len(fetched) == 3
+
+
+def test_comments_not_fetched_when_all_rules_matched(monkeypatch):
+    """
+    Test that comments are not fetched at all when all rules fit the title or the body.
+    :param monkeypatch:
+    :return:
+    """
+    fetched = count_fetches(monkeypatch)
+    rules = [github_issues_bot.Rule("title", "title"), github_issues_bot.Rule("body", "body")]
+
+    labels = github_issues_bot.process_issue(make_issue(), predef_rules=rules, dry_run=True)
+
+    assert sorted(labels) == ["body", "title"]
+    assert fetched == []
+
+
+def test_least_recently_used_evicted():
+    """
+    Test that the store keeps comments of at most max_entries issues, evicting those least recently used.
+    :return:
+    """
+    store = github_issues_bot.CommentStore(max_entries=2)
+    issues = [make_issue() for _ in range(3)]
+    for number, issue in enumerate(issues):
+        issue.comments_url = "http://test.org/{}/comments".format(number)
+
+    store.store(issues[0], ["first"])
+    store.store(issues[1], ["second"])
+    assert store.lookup(issues[0]) == ["first"]
+    store.store(issues[2], ["third"])
+
+    assert len(store) == 2
+    assert store.lookup(issues[1]) is None
+    assert store.lookup(issues[0]) == ["first"]
+    assert store.lookup(issues[2]) == ["third"]
+
+
+def test_counters_shared_by_threads():
+    """
+    Test that lookups from many threads at once are all counted.
+    :return:
+    """
+    store = github_issues_bot.CommentStore(max_entries=10)
+    issue = make_issue()
+    store.store(issue, ["comment"])
+
+    def look_up():
+        for _ in range(1000):
+            store.lookup(issue)
+
+    threads = [threading.Thread(target=look_up) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert store.hits == 8000
+    assert store.misses == 0
@@ -0,0 +1,68 @@
+import random
+
+from gitbot import github_issues_bot
+from gitbot.github_issues_bot import Issue, Rule, RuleSet
+
+WORDS = ["bug", "help", "crash", "why", "how", "feature", "docs", "error", "fail", "please", "thanks", "?"]
+
+rules = [Rule(r"bug", "bug"), Rule(r"help", "help wanted"), Rule(r"(how|why).*\?", "question"),
+         Rule(r"crash(es|ed)?", "crash"), Rule(r"feature\s+request", "enhancement"), Rule(r"^docs", "docs"),
+         Rule(r"error.*fail", "error"), Rule(r"thanks$", "thanks")]
+
+
+def make_text(generator, length):
+    return " ".join(generator.choice(WORDS) for _ in range(length))
+
+
+def file_order_labels(issue, comments):
+    texts = [issue.body, issue.title] + comments
+    return sorted(index for index, rule in enumerate(rules) if any(text and rule.check_fits(text) for text in texts))
+
+
+def test_results_same_as_file_order():
+    """
+    Test that rules found by planned evaluation are the ones found by matching every text with every rule in file
+    order, both before and after the plan is based on statistics.
+    :return:
+    """
+    generator = random.Random(0)
+    rule_set = RuleSet(rules)
+    rule_set.min_plan_tests = 5
+
+    for number in range(200):
+        issue = Issue("url", "url/comments", [], True, make_text(generator, 3), make_text(generator, 30), number,
+                      "foo/bar")
+        comments = [make_text(generator, generator.randrange(1, 20)) for _ in range(generator.randrange(3))]
+
+        matched = github_issues_bot.match_issue(issue, rule_set)
+        matched = github_issues_bot.match_comments(comments, rule_set, matched)
+
+        assert sorted(matched) == file_order_labels(issue, comments)
+
+    assert len(rule_set.plan({'title': "a", 'body': "ab"})) > 1
+
+
+def test_shorter_texts_first_without_statistics():
+    """
+    Test that all rules search the shorter text first until enough texts were matched.
+    :return:
+    """
+    rule_set = RuleSet(rules)
+
+    assert rule_set.plan({'body': "a long body", 'title': "title"}) == [(('title', 'body'), None)]
+    assert rule_set.plan({'body': "body", 'title': "a long title"}) == [(('body', 'title'), None)]
+
+
+def test_rules_ordered_by_cost_per_hit():
+    """
+    Test that a rule that fit only bodies searches them first, even though titles are shorter.
+    :return:
+    """
+    rule_set = RuleSet([Rule("bug", "bug"), Rule("help", "help wanted")])
+    for _ in range(rule_set.min_plan_tests):
+        rule_set.matching("a bug", kind='body')
+        rule_set.matching("help", kind='title')
+
+    plan = dict(rule_set.plan({'title': "short", 'body': "a much longer body"}))
+
+    assert plan == {('body', 'title'): {0}, ('title', 'body'): {1}}
@@ -1,3 +1,5 @@
+import json
+
 from gitbot import github_issues_bot
 
 fetch_issues_url = 'https://api.github.com/repos/{}/issues?state={}'
@@ -14,4 +16,107 @@ def test_fetch_issues(auth_session):
     response = auth_session.get(fetch_issues_url.format(repository, 'all'))
     issues = github_issues_bot.fetch_issues(repository, 'all', auth_session)
 
-    assert len(issues) == len(response.json())
+    assert len(list(issues)) == len(response.json())
+
+
+class PagedResponse:
+    def __init__(self, numbers, next_url=None):
+        self.numbers = numbers
+        self.links = {'next': {'url': next_url}} if next_url else {}
+        self.status_code = 200
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        encoded = json.dumps(self.json()).encode("utf-8")
+        for start in range(0, len(encoded), 7):
+            yield encoded[start:start + 7]
+
+    def json(self):
+        return [{"url": "http://test.org/{}".format(number),
+                 "comments_url": "http://test.org/{}/comments".format(number),
+                 "title": "Issue {}".format(number),
+                 "number": number} for number in self.numbers]
+
+
+class PagedSession:
+    def __init__(self, pages):
+        self.pages = pages
+        self.requested = []
+
+    def get(self, url, stream=False):
+        self.requested.append(url)
+        return self.pages[url]
+
+
+def test_fetch_issues_follows_pages():
+    """
+    Test that all pages are fetched and that a page is requested only when the previous one was consumed.
+    :return:
+    """
+    first_url = fetch_issues_url.format(repository, 'open') + '&per_page=100'
+    session = PagedSession({
+        first_url: PagedResponse([1, 2], 'page2'),
+        'page2': PagedResponse([3], 'page3'),
+        'page3': PagedResponse([4]),
+    })
+
+    issues = github_issues_bot.fetch_issues(repository, 'open', session)
+
+    assert next(issues).number == 1
+    assert session.requested == [first_url]
+
+    assert [issue.number for issue in issues] == [2, 3, 4]
+    assert session.requested == [first_url, 'page2', 'page3']
+
+
+def test_fetch_issues_since_mark(tmpdir):
+    """
+    Test that only issues updated since the saved mark are requested and that the mark moves forward
+    once all issues were consumed.
+    :param tmpdir:
+    :return:
+    """
+    state_file = str(tmpdir.join("polling_state.json"))
+    polling_state = github_issues_bot.PollingState(state_file)
+    polling_state.update(repository, 'open', '2016-10-31T17:07:55Z')
+
+    url = fetch_issues_url.format(repository, 'open') + '&per_page=100&since=2016-10-31T17:07:55Z'
+    response = PagedResponse([1, 2])
+    response.json = lambda: [{"url": "http://test.org/1", "comments_url": "http://test.org/1/comments",
+                              "title": "Issue 1", "number": 1, "updated_at": "2016-11-02T10:00:00Z"},
+                             {"url": "http://test.org/2", "comments_url": "http://test.org/2/comments",
+                              "title": "Issue 2", "number": 2, "updated_at": "2016-11-01T10:00:00Z"}]
+    session = PagedSession({url: response})
+
+    issues = github_issues_bot.fetch_issues(repository, 'open', session, polling_state)
+    next(issues)
+    assert polling_state.get(repository, 'open') == '2016-10-31T17:07:55Z'
+
+    list(issues)
+    assert session.requested == [url]
+    assert github_issues_bot.PollingState(state_file).get(repository, 'open') == '2016-11-02T10:00:00Z'
+    assert github_issues_bot.PollingState(state_file).get(repository, 'all') is None
+
+
+def test_fetch_comments_streamed():
+    """
+    Test that texts of comments are read from the streamed response.
+    :return:
+    """
+    response = PagedResponse([])
+    response.json = lambda: [{"id": 1, "user": {"login": "someone"}, "body": "First \U0001F41B, [quoted] \"text\""},
+                             {"id": 2, "user": {"login": "other"}, "body": "Second"}]
+    issue = github_issues_bot.Issue("http://test.org/1", "http://test.org/1/comments", [], True, "Title", "", 1,
+                                    repository)
+
+    comments = github_issues_bot.fetch_comments(issue, PagedSession({issue.comments_url: response}))
+
+    assert comments == ["First \U0001F41B, [quoted] \"text\"", "Second"]
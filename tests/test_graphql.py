@@ -0,0 +1,119 @@
+import json
+
+import requests
+
+from gitbot import github_issues_bot, graphql
+
+repository = "melkamar/mi-pyt-test-issues"
+
+
+def test_fetch_issues(auth_session, monkeypatch):
+    """
+    Test that all pages of issues are fetched with their labels, and that comments are stored only for issues whose
+    comments were all returned.
+    :param auth_session:
+    :param monkeypatch:
+    :return:
+    """
+    monkeypatch.setattr(github_issues_bot, "issues_per_page", 15)
+    monkeypatch.setattr(github_issues_bot, "comment_store", github_issues_bot.CommentStore())
+
+    issues = {issue.number: issue for issue in graphql.fetch_issues(repository, 'all', auth_session, comments=1)}
+
+    assert len(issues) == 27
+    issue = issues[24]
+    assert issue.url == "https://api.github.com/repos/melkamar/mi-pyt-test-issues/issues/24"
+    assert issue.comments_url == issue.url + "/comments"
+    assert issue.label_names() == ["bug", "help wanted", "question"]
+    assert issue.state_open
+    assert not issues[1].state_open
+    assert issue.updated_at == "2016-10-20T08:59:19Z"
+
+    assert github_issues_bot.comment_store.lookup(issue) == ["Same here, any help?"]
+    assert github_issues_bot.comment_store.lookup(issues[27]) == []
+    assert github_issues_bot.comment_store.lookup(issues[1]) is None
+
+
+class RecordingSession:
+    def __init__(self, payloads):
+        self.payloads = payloads
+        self.sent = []
+
+    def post(self, url, **kwargs):
+        self.sent.append(kwargs['json'])
+        response = requests.Response()
+        response.status_code = 200
+        response._content = json.dumps(self.payloads.pop(0)).encode("utf-8")
+        return response
+
+
+def page(nodes, end_cursor=None):
+    return {"data": {"repository": {"issues": {"pageInfo": {"hasNextPage": end_cursor is not None,
+                                                             "endCursor": end_cursor},
+                                               "nodes": nodes}}}}
+
+
+def node(number, updated_at, comments=()):
+    return {"number": number, "title": "Issue {}".format(number), "body": "Body", "state": "OPEN",
+            "updatedAt": updated_at, "labels": {"nodes": []},
+            "comments": {"totalCount": len(comments), "nodes": [{"body": body} for body in comments]}}
+
+
+def test_pages_follow_cursor_since_mark(tmpdir):
+    """
+    Test that pages are requested after the cursor of the previous one, that only issues updated since the saved
+    mark are requested, and that the mark moves forward once all issues were consumed.
+    :param tmpdir:
+    :return:
+    """
+    polling_state = github_issues_bot.PollingState(str(tmpdir.join("polling_state.json")))
+    polling_state.update(repository, 'open', '2016-10-31T17:07:55Z')
+    session = RecordingSession([page([node(1, "2016-11-01T10:00:00Z")], "cursor1"),
+                                page([node(2, "2016-11-02T10:00:00Z")])])
+
+    issues = graphql.fetch_issues(repository, 'open', session, polling_state)
+
+    assert next(issues).number == 1
+    assert len(session.sent) == 1
+    assert [issue.number for issue in issues] == [2]
+
+    assert [sent['variables']['after'] for sent in session.sent] == [None, "cursor1"]
+    assert session.sent[0]['variables']['since'] == '2016-10-31T17:07:55Z'
+    assert session.sent[0]['variables']['states'] == ['OPEN']
+    assert polling_state.get(repository, 'open') == '2016-11-02T10:00:00Z'
+
+
+def test_query_errors_stop_fetching(tmpdir):
+    """
+    Test that errors reported by GitHub stop fetching and leave the mark where it was.
+    :param tmpdir:
+    :return:
+    """
+    polling_state = github_issues_bot.PollingState(str(tmpdir.join("polling_state.json")))
+    session = RecordingSession([page([node(1, "2016-11-01T10:00:00Z")], "cursor1"),
+                                {"data": None, "errors": [{"message": "Something went wrong"}]}])
+
+    assert [issue.number for issue in graphql.fetch_issues(repository, 'all', session, polling_state)] == [1]
+    assert polling_state.get(repository, 'all') is None
+
+
+def test_process_issues_without_comment_requests(monkeypatch):
+    """
+    Test that issues fetched with the graphql backend are labelled using the comments fetched with them.
+    :param monkeypatch:
+    :return:
+    """
+    session = RecordingSession([page([node(1, "2016-11-01T10:00:00Z", ["I found a bug"])])])
+    monkeypatch.setattr(github_issues_bot, "current_session", lambda: session)
+    monkeypatch.setattr(github_issues_bot, "init_session", lambda *args, **kwargs: None)
+    monkeypatch.setattr(github_issues_bot, "comment_store", github_issues_bot.CommentStore())
+    monkeypatch.setattr(github_issues_bot, "fetch_comments", None)
+    monkeypatch.setattr(github_issues_bot, "rule_set", github_issues_bot.RuleSet([github_issues_bot.Rule("bug", "bug")]))
+    written = []
+    monkeypatch.setattr(github_issues_bot, "apply_labels",
+                        lambda issue, labels, session=None: written.append((issue.number, labels)) or True)
+
+    summary = github_issues_bot.process_issues("token", repository, backend='graphql')
+
+    assert summary == {'processed': 1, 'skipped': 0, 'writes': 1}
+    assert written == [(1, ["bug"])]
@@ -0,0 +1,214 @@
+import io
+import json
+
+import requests
+from requests.adapters import BaseAdapter
+
+from gitbot import github_issues_bot, streaming
+from gitbot.http_cache import ResponseCache, CachingSession
+
+url = 'https://api.github.com/repos/melkamar/mi-pyt-test-issues/issues?state=all'
+
+
+class ConditionalAdapter(BaseAdapter):
+    """
+    Adapter answering like GitHub: 304 if the sent ETag matches the current one, full payload otherwise.
+    """
+
+    def __init__(self, payload, etag='"abc"', link='<https://api.github.com/next>; rel="next"'):
+        super().__init__()
+        self.payload = payload
+        self.etag = etag
+        self.link = link
+        self.sent = []
+
+    def send(self, request, **kwargs):
+        self.sent.append(request)
+
+        response = requests.Response()
+        response.request = request
+        response.url = request.url
+        response.headers['ETag'] = self.etag
+        if self.link:
+            response.headers['Link'] = self.link
+        if request.headers.get('If-None-Match') == self.etag:
+            response.status_code = 304
+            response.raw = io.BytesIO()
+            response._content = b''
+        else:
+            response.status_code = 200
+            response.raw = io.BytesIO(json.dumps(self.payload).encode('utf-8'))
+            response._content = False
+            if not kwargs.get('stream'):
+                response.content
+        return response
+
+    def close(self):
+        pass
+
+
+def make_session(cache, adapter):
+    session = CachingSession(cache)
+    session.mount('https://', adapter)
+    return session
+
+
+def test_not_modified_served_from_cache():
+    """
+    Test that the second request is conditional and its 304 response is served from the cache.
+    :return:
+    """
+    cache = ResponseCache()
+    adapter = ConditionalAdapter([{'number': 1}])
+    session = make_session(cache, adapter)
+
+    assert session.get(url).json() == [{'number': 1}]
+    response = session.get(url)
+
+    assert adapter.sent[1].headers['If-None-Match'] == '"abc"'
+    assert response.from_cache
+    assert response.status_code == 200
+    assert response.json() == [{'number': 1}]
+    assert response.links['next']['url'] == 'https://api.github.com/next'
+    assert cache.hits == 1 and cache.misses == 1
+
+
+def test_changed_resource_refreshed():
+    """
+    Test that a changed resource replaces the cached payload.
+    :return:
+    """
+    cache = ResponseCache()
+    adapter = ConditionalAdapter([{'number': 1}])
+    session = make_session(cache, adapter)
+    session.get(url)
+
+    adapter.payload = [{'number': 2}]
+    adapter.etag = '"def"'
+
+    assert session.get(url).json() == [{'number': 2}]
+    assert session.get(url).json() == [{'number': 2}]
+    assert cache.hits == 1
+
+
+def test_least_recently_used_evicted():
+    """
+    Test that the cache keeps only the most recently used entries.
+    :return:
+    """
+    cache = ResponseCache(max_entries=2)
+    session = make_session(cache, ConditionalAdapter([]))
+
+    session.get(url + '&page=1')
+    session.get(url + '&page=2')
+    session.get(url + '&page=1')
+    session.get(url + '&page=3')
+
+    assert len(cache) == 2
+    assert cache.get(cache.key(url + '&page=2', None)) is None
+    assert cache.get(cache.key(url + '&page=1', None)) is not None
+
+
+def test_cache_persisted(tmpdir):
+    """
+    Test that a saved cache is used by a new cache instance.
+    :param tmpdir:
+    :return:
+    """
+    filename = str(tmpdir.join("cache.json"))
+    cache = ResponseCache(filename=filename)
+    make_session(cache, ConditionalAdapter([{'number': 1}])).get(url)
+    cache.save()
+
+    adapter = ConditionalAdapter([{'number': 1}])
+    response = make_session(ResponseCache(filename=filename), adapter).get(url)
+
+    assert response.from_cache
+    assert response.json() == [{'number': 1}]
+
+
+def test_streamed_requests_cached():
+    """
+    Test that requests with stream=True are conditional too and their payload is parsed from the cache.
+    :return:
+    """
+    cache = ResponseCache()
+    adapter = ConditionalAdapter([{'number': 1}, {'number': 2}])
+    session = make_session(cache, adapter)
+
+    assert list(streaming.iter_response(session.get(url, stream=True))) == [{'number': 1}, {'number': 2}]
+    response = session.get(url, stream=True)
+
+    assert adapter.sent[1].headers['If-None-Match'] == '"abc"'
+    assert list(streaming.iter_response(response)) == [{'number': 1}, {'number': 2}]
+
+
+def test_streamed_response_parsed_while_downloaded():
+    """
+    Test that with the cache enabled, a fresh streamed response is not read whole, but parsed while it is downloaded,
+    and cached only once it was parsed completely.
+    :return:
+    """
+    cache = ResponseCache()
+    adapter = ConditionalAdapter([{'number': number} for number in range(100)])
+    session = make_session(cache, adapter)
+
+    response = session.get(url, stream=True)
+    elements = streaming.iter_response(response, chunk_size=16)
+    assert next(elements) == {'number': 0}
+    assert response.raw.tell() < len(response.raw.getvalue())
+    assert len(cache) == 0
+
+    assert len(list(elements)) == 99
+    assert len(cache) == 1
+
+    response = session.get(url, stream=True)
+    assert response.from_cache
+    assert list(streaming.iter_response(response)) == [{'number': number} for number in range(100)]
+
+
+def test_abandoned_streamed_response_not_cached():
+    """
+    Test that a streamed response which was not parsed completely is not cached.
+    :return:
+    """
+    cache = ResponseCache()
+    session = make_session(cache, ConditionalAdapter([{'number': 1}, {'number': 2}]))
+
+    elements = streaming.iter_response(session.get(url, stream=True))
+    assert next(elements) == {'number': 1}
+    elements.close()
+
+    assert len(cache) == 0
+
+
+def test_streamed_issues_cached_compact():
+    """
+    Test that a page of issues is cached with only the fields the issues are parsed from, and that issues served from
+    the cache are the same.
+    :return:
+    """
+    user = {'login': 'melkamar', 'id': 1, 'avatar_url': 'https://avatars.githubusercontent.com/u/1', 'type': 'User',
+            'url': 'https://api.github.com/users/melkamar', 'html_url': 'https://github.com/melkamar'}
+    label = {'id': 208045946, 'url': 'https://api.github.com/repos/melkamar/test/labels/bug', 'name': 'bug',
+             'color': 'f29513', 'default': True, 'description': "Something isn't working"}
+    payload = [{'url': 'https://api.github.com/repos/melkamar/test/issues/{}'.format(number),
+                'comments_url': 'https://api.github.com/repos/melkamar/test/issues/{}/comments'.format(number),
+                'html_url': 'https://github.com/melkamar/test/issues/{}'.format(number),
+                'number': number, 'title': 'Issue {}'.format(number), 'body': 'Body of the issue.', 'state': 'open',
+                'comments': 0, 'updated_at': '2016-10-31T17:07:55Z', 'user': user, 'assignee': user,
+                'labels': [label]} for number in range(1, 101)]
+    cache = ResponseCache()
+    session = make_session(cache, ConditionalAdapter(payload, link=None))
+    get_url = github_issues_bot.fetch_issues_url.format('melkamar/test', 'all') + '&per_page={}'.format(
+        github_issues_bot.issues_per_page)
+
+    fetched = [(issue.number, issue.label_names()) for issue in github_issues_bot.fetch_issues(
+        'melkamar/test', 'all', session=session)]
+
+    cached = cache.get(ResponseCache.key(get_url, None))['payload']
+    assert len(json.dumps(cached)) < len(json.dumps(payload)) / 3
+    assert cached[0]['labels'] == [{'name': 'bug'}]
+    assert [(issue.number, issue.label_names()) for issue in github_issues_bot.fetch_issues(
+        'melkamar/test', 'all', session=session)] == fetched
+    assert fetched[0] == (1, ['bug'])
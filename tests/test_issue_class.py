@@ -1,3 +1,5 @@
+import sys
+
 from gitbot import github_issues_bot
 
 fetch_issues_url = 'https://api.github.com/repos/{}/issues?state={}'
@@ -17,7 +19,7 @@ def test_parse_correct(auth_session):
         issue = github_issues_bot.Issue.parse(issue_json, repository)
         assert issue
         assert issue.url == issue_json.get("url")
-        assert issue.labels == issue_json.get("labels")
+        assert issue.label_names() == [label["name"] for label in issue_json.get("labels")]
         assert issue.comments_url == issue_json.get("comments_url")
         assert issue.body == issue_json.get("body")
         assert issue.title == issue_json.get("title")
@@ -36,3 +38,23 @@ def test_parse_fail(not_auth_session):
     print("JSON: {}".format(json))
     issue = github_issues_bot.Issue.parse(json, repository)
     assert not issue
+
+
+def test_compact_issue():
+    """
+    Test that label names are kept interned, non-ASCII bodies read back unchanged and labels can be set as names.
+    :return:
+    """
+    issue = github_issues_bot.Issue("url", "url/comments", [{"id": 1, "name": "".join(["b", "ug"]), "color": "f"}],
+                                    True, "Title", "Crash \U0001F41B ž\ud83d", 1, "foo/bar")
+
+    assert not hasattr(issue, "__dict__")
+    assert issue.label_names()[0] is sys.intern("bug")
+    assert issue.labels == [{"name": "bug"}]
+    assert issue.body == "Crash \U0001F41B ž\ud83d"
+
+    issue.labels = ["question", "bug"]
+    assert issue.label_names() == ["question", "bug"]
+    assert issue.has_labels()
+    issue.labels = None
+    assert not issue.has_labels()
@@ -0,0 +1,75 @@
+import pytest
+from gitbot import github_issues_bot
+
+
+def make_issue(labels, number=42):
+    return github_issues_bot.Issue("<url>", "<url>", [{'name': label} for label in labels], True, "Title", "Body",
+                                   number, "melkamar/test")
+
+
+class RecordingSession:
+    def __init__(self):
+        self.requests = []
+
+    def request(self, method, url, json=None):
+        self.requests.append((method, url, json))
+        response = github_issues_bot.requests.Response()
+        response.status_code = 200
+        return response
+
+
+@pytest.mark.parametrize('current, desired, expected', [
+    (['bug'], ['bug'], None),
+    (['bug', 'ui'], ['ui', 'bug', 'bug'], None),
+    ([], ['bug'], ('POST', ['bug'])),
+    (['ui'], ['bug', 'ui'], ('POST', ['bug'])),
+    (['ui', 'wontfix'], ['bug'], ('PATCH', ['bug'])),
+    (['ui'], [], ('PATCH', [])),
+])
+def test_plan_labels(current, desired, expected):
+    """
+    Test that the smallest write is planned for the labels of an issue.
+    :param current:
+    :param desired:
+    :param expected:
+    :return:
+    """
+    assert github_issues_bot.plan_labels(make_issue(current), desired) == expected
+
+
+def test_apply_labels_sends_only_changes():
+    """
+    Test that unchanged labels are not written and added labels use the add labels endpoint.
+    :return:
+    """
+    session = RecordingSession()
+    issue = make_issue(['ui'])
+
+    assert github_issues_bot.apply_labels(issue, ['bug', 'ui'], session)
+    assert not github_issues_bot.apply_labels(issue, ['ui', 'bug'], session)
+
+    assert session.requests == [('POST', github_issues_bot.add_labels_url.format("melkamar/test", 42),
+                                 {'labels': ['bug']})]
+    assert issue.label_names() == ['bug', 'ui']
+
+
+def test_label_batch():
+    """
+    Test that a batch leaves out unchanged issues, keeps the last write of each issue and sends writes on flush.
+    :return:
+    """
+    session = RecordingSession()
+    batch = github_issues_bot.LabelBatch("melkamar/test")
+    unchanged = make_issue(['bug'], number=1)
+    changed = make_issue(['ui'], number=2)
+
+    assert not batch.add(unchanged, ['bug'])
+    assert batch.add(changed, ['bug'])
+    assert batch.add(changed, ['question'])
+    assert len(batch) == 1
+    assert not session.requests
+
+    assert batch.flush(session) == 1
+    assert session.requests == [('PATCH', github_issues_bot.edit_issue_url.format("melkamar/test", 2),
+                                 {'labels': ['question']})]
+    assert len(batch) == 0
@@ -0,0 +1,96 @@
+import time
+
+import click
+import pytest
+
+from gitbot import github_issues_bot, metrics
+from gitbot.github_issues_bot import MatchGuard, Rule, RuleSet
+
+BACKTRACKING_RULE = r"(how|what|why).*\?"
+
+
+def test_text_length_limited():
+    """
+    Test that only the first characters of a text are matched.
+    :return:
+    """
+    rule_set = RuleSet([Rule("bug", "bug"), Rule("help", "help wanted")], MatchGuard(max_text_length=20))
+    assert rule_set.labels("a bug" + " " * 20 + "please help") == ["bug"]
+
+
+def test_rule_over_budget_skipped():
+    """
+    Test that a rule searched with re as a fallback of re2, whose search takes longer than the budget, is skipped
+    from then on, other rules keep working.
+    :return:
+    """
+    pytest.importorskip("re2")
+    # re2 does not support lookarounds
+    pattern = "(?=.)" + BACKTRACKING_RULE
+    rule_set = RuleSet([Rule(pattern, "question"), Rule("why", "why")], MatchGuard(budget=0.0005, engine='re2'))
+    skipped = metrics.registry.value('gitbot_rule_budget_exceeded_total', label="question", pattern=pattern)
+
+    assert rule_set.labels("why " * 5000) == ["why"]
+    assert rule_set.skipped() == [0]
+    assert metrics.registry.value('gitbot_rule_budget_exceeded_total', label="question",
+                                  pattern=pattern) == skipped + 1
+
+    assert rule_set.labels("why?") == ["why"]
+    assert rule_set.searches == [1, 2]
+
+
+def test_re2_engine():
+    """
+    Test that the re2 engine searches case-insensitively in linear time and falls back to re for patterns it cannot
+    compile.
+    :return:
+    """
+    pytest.importorskip("re2")
+    rule_set = RuleSet([Rule(BACKTRACKING_RULE, "question"), Rule(r"(bug)\s+\1", "double bug")],
+                       MatchGuard(engine='re2'))
+
+    assert rule_set.labels("WHY does it fail?") == ["question"]
+    assert rule_set.labels("Bug bug") == ["double bug"]
+
+    started = time.perf_counter()
+    assert rule_set.labels("why " * 20000) == []
+    assert time.perf_counter() - started < 0.5
+
+
+def test_budget_needs_re2_engine():
+    """
+    Test that a budget cannot be given for the re engine, whose searches cannot be stopped when they exceed it.
+    :return:
+    """
+    with pytest.raises(ValueError):
+        MatchGuard(budget=0.5)
+    with pytest.raises(click.UsageError):
+        github_issues_bot.init_match_guard(budget=0.5)
+
+
+def test_re2_engine_needs_re2(monkeypatch):
+    """
+    Test that the re2 engine cannot be used without google-re2.
+    :return:
+    """
+    monkeypatch.setattr(github_issues_bot, "re2", None)
+    with pytest.raises(RuntimeError):
+        MatchGuard(engine='re2')
+
+
+def test_loaded_rules_guarded(tmpdir, monkeypatch):
+    """
+    Test that rules loaded from a file use the guard set up for the command, and that no guard is used without limits.
+    :return:
+    """
+    monkeypatch.setattr(github_issues_bot, "rules", [])
+    monkeypatch.setattr(github_issues_bot, "rule_set", RuleSet([]))
+    monkeypatch.setattr(github_issues_bot, "match_guard", None)
+    rules_file = tmpdir.join("rules.cfg")
+    rules_file.write("bug=>bug\n")
+
+    assert github_issues_bot.init_match_guard() is None
+    guard = github_issues_bot.init_match_guard(max_text_length=100)
+    github_issues_bot.init_rules_logic(str(rules_file))
+
+    assert github_issues_bot.rule_set.guard is guard
@@ -0,0 +1,105 @@
+import requests
+
+from gitbot import github_issues_bot, metrics
+from gitbot.github_issues_bot import Issue, Rule, RuleSet
+from gitbot.metrics import Registry, endpoint_of
+from gitbot.scheduler import RateLimitScheduler, ScheduledAdapter
+
+
+def test_render_counters_and_histograms():
+    """
+    Test that counters, histograms and collected samples are rendered in the Prometheus text format.
+    :return:
+    """
+    registry = Registry()
+    registry.describe('test_requests_total', 'counter', "Requests.")
+    registry.describe('test_seconds', 'histogram', "Durations.", buckets=(0.1, 1.0))
+    registry.describe('test_depth', 'gauge', "Depth.")
+    registry.inc('test_requests_total', endpoint='/a "quoted"')
+    registry.inc('test_requests_total', 2, endpoint='/a "quoted"')
+    registry.observe('test_seconds', 0.05)
+    registry.observe('test_seconds', 0.5)
+    registry.observe('test_seconds', 5.0)
+    registry.add_collector(lambda: [('test_depth', {}, 7)])
+
+    lines = registry.render().splitlines()
+
+    assert '# TYPE test_requests_total counter' in lines
+    assert 'test_requests_total{endpoint="/a \\"quoted\\""} 3' in lines
+    assert 'test_seconds_bucket{le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{le="1.0"} 2' in lines
+    assert 'test_seconds_bucket{le="+Inf"} 3' in lines
+    assert 'test_seconds_sum 5.55' in lines
+    assert 'test_seconds_count 3' in lines
+    assert '# HELP test_depth Depth.' in lines
+    assert 'test_depth 7' in lines
+    assert registry.value('test_seconds') == 3
+
+
+def test_endpoint_of():
+    """
+    Test that repository names and numbers are left out of endpoints.
+    :return:
+    """
+    assert endpoint_of("https://api.github.com/repos/foo/bar/issues/42/labels") == '/repos/:repo/issues/:number/labels'
+    assert endpoint_of("https://api.github.com/repos/foo/bar/issues?page=3") == '/repos/:repo/issues'
+
+
+def test_rule_set_counts_searches():
+    """
+    Test that the rule set counts searches and matches of each rule, but not rules excluded by their literals.
+    :return:
+    """
+    rule_set = RuleSet([Rule("hello", "welcoming"), Rule("bye", "leaving")])
+    rule_set.matching("hello there")
+    rule_set.matching("Hello, and bye")
+
+    assert rule_set.searches == [2, 1]
+    assert rule_set.matches == [2, 1]
+    assert all(seconds > 0 for seconds in rule_set.seconds)
+
+
+def test_processing_recorded(monkeypatch):
+    """
+    Test that processed issues, rule statistics and comment store hits are exported.
+    :return:
+    """
+    monkeypatch.setattr(github_issues_bot, "rule_set", RuleSet([Rule("cool", "cool label")]))
+    monkeypatch.setattr(github_issues_bot, "comment_store", github_issues_bot.CommentStore())
+    processed = metrics.registry.value('gitbot_issues_processed_total')
+
+    issue = Issue("<url>", "<comments-url>", [], True, "Title", "Not much here.", 1, "foo/bar", 1, "2016-10-31")
+    github_issues_bot.comment_store.store(issue, ["cool comment"])
+    github_issues_bot.process_issue(issue, dry_run=True)
+
+    assert metrics.registry.value('gitbot_issues_processed_total') == processed + 1
+    text = metrics.registry.render()
+    assert 'gitbot_rule_matches_total{label="cool label",pattern="cool",rule="0"} 1' in text
+    assert 'gitbot_comment_store_hits_total 1' in text
+
+
+def test_exporter_and_request_metrics():
+    """
+    Test that the exporter serves the metrics and that requests sent through the scheduler are recorded.
+    :return:
+    """
+    server = metrics.start_http_server(0, '127.0.0.1')
+    session = requests.Session()
+    session.mount('http://', ScheduledAdapter(RateLimitScheduler()))
+    try:
+        url = "http://127.0.0.1:{}/metrics".format(server.server_address[1])
+        assert session.get(url + "/other").status_code == 404
+
+        # the request is recorded once it is answered, so the first one is rendered only in the next response
+        response = session.get(url)
+        assert response.status_code == 200
+        assert response.headers['Content-Type'] == metrics.CONTENT_TYPE
+        assert '# TYPE gitbot_github_requests_total counter' in response.text
+
+        assert metrics.registry.value('gitbot_github_requests_total', method='GET', endpoint='/metrics/other',
+                                      status='404') == 1
+        assert metrics.registry.value('gitbot_github_request_seconds', method='GET', endpoint='/metrics') >= 1
+    finally:
+        session.close()
+        server.shutdown()
+        server.server_close()
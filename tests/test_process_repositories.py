@@ -0,0 +1,87 @@
+import concurrent.futures
+import threading
+
+import pytest
+from gitbot import github_issues_bot
+
+
+def make_issues(repository, count):
+    return [github_issues_bot.Issue("http://test.org/{}".format(number),
+                                    "http://test.org/{}/comments".format(number),
+                                    [{'name': 'bug'}] if number % 2 else [],
+                                    True,
+                                    "Issue {}".format(number),
+                                    "Body",
+                                    number,
+                                    repository) for number in range(count)]
+
+
+@pytest.fixture
+def fake_github(monkeypatch):
+    processed = []
+    threads = set()
+
+    def fake_fetch_issues(repository, state, session=None, polling_state=None):
+        return iter(make_issues(repository, 10))
+
+    def fake_process_issue(issue, *args, **kwargs):
+        threads.add(threading.current_thread().name)
+        processed.append((issue.reponame, issue.number))
+
+    monkeypatch.setattr(github_issues_bot, "fetch_issues", fake_fetch_issues)
+    monkeypatch.setattr(github_issues_bot, "process_issue", fake_process_issue)
+    return processed, threads
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_process_repositories(fake_github, workers):
+    """
+    Test that all issues of all repositories are processed and summarized per repository, serially and concurrently.
+    :param fake_github:
+    :param workers:
+    :return:
+    """
+    processed, threads = fake_github
+    repositories = ["melkamar/test{}".format(i) for i in range(5)]
+
+    results = github_issues_bot.process_repositories("token", repositories, workers)
+
+    assert sorted(processed) == sorted((repository, number)
+                                       for repository in repositories for number in range(0, 10, 2))
+    assert results == {repository: {'processed': 5, 'skipped': 5, 'writes': 0} for repository in repositories}
+    if workers > 1:
+        assert all(name.startswith("issues") for name in threads)
+
+
+@pytest.mark.parametrize('failing', [{3}, set(), {9}])
+def test_polling_mark_not_moved_past_failed_issue(monkeypatch, failing):
+    """
+    Test that with concurrent processing, the polling mark is moved forward only up to the oldest issue whose
+    processing failed, so that it is fetched again in the next poll.
+    :param monkeypatch:
+    :param failing:
+    :return:
+    """
+    repository = "melkamar/test"
+    issues = make_issues(repository, 10)
+    for issue in issues:
+        issue.labels = None
+        issue.updated_at = "2016-10-31T17:07:{:02}Z".format(issue.number)
+
+    def fake_fetch_issues(repository, state, session=None, polling_state=None):
+        yield from issues
+        polling_state.update(repository, state, issues[-1].updated_at)
+
+    def fake_process_issue(issue, *args, **kwargs):
+        if issue.number in failing:
+            raise RuntimeError("Labelling failed")
+
+    monkeypatch.setattr(github_issues_bot, "fetch_issues", fake_fetch_issues)
+    monkeypatch.setattr(github_issues_bot, "process_issue", fake_process_issue)
+    polling_state = github_issues_bot.PollingState()
+
+    with concurrent.futures.ThreadPoolExecutor(4) as executor:
+        github_issues_bot.process_issues("token", repository, polling_state=polling_state, executor=executor)
+
+    expected = issues[min(failing)] if failing else issues[-1]
+    assert polling_state.get(repository, 'open') == expected.updated_at
@@ -0,0 +1,59 @@
+import io
+import json
+
+from gitbot import profiling
+from gitbot.github_issues_bot import Rule, RuleSet
+
+
+def test_rule_report_sorted_and_flagged():
+    """
+    Test that the report holds statistics of every rule, slowest first, and flags rules over the threshold.
+    :return:
+    """
+    rule_set = RuleSet([Rule("help", "help wanted"), Rule(r"(how|what|why).*\?", "question")])
+    for _ in range(20):
+        rule_set.matching("why " * 2000)
+
+    rows = profiling.rule_report(rule_set, threshold=0.0)
+
+    assert [row['label'] for row in rows] == ['question', 'help wanted']
+    assert rows[0]['searches'] == 20
+    assert rows[0]['matches'] == 0
+    assert rows[0]['max_seconds'] > 0
+    assert rows[0]['slow'] is True
+    assert rows[1]['searches'] == 0
+    assert rows[1]['slow'] is False
+
+
+def test_probe_backtracking():
+    """
+    Test that a rule scanning the rest of the line from every match of a word is flagged, a plain word is not.
+    :return:
+    """
+    assert profiling.probe_backtracking(Rule(r"(how|what|why).*\?", "question"), sizes=(2000, 16000))['backtracking']
+    assert not profiling.probe_backtracking(Rule("help", "help wanted"), ["please help me"],
+                                            sizes=(2000, 16000))['backtracking']
+
+
+def test_profile_corpus_report():
+    """
+    Test that texts of exported issues are profiled and the report is written both as a table and as JSON.
+    :return:
+    """
+    corpus = io.StringIO(json.dumps({"title": "Help", "body": "why does it fail?",
+                                     "comments": [{"body": "how come?"}]}) + "\nnot json\n")
+    texts = list(profiling.corpus_texts(corpus))
+    assert texts == ["Help", "why does it fail?", "how come?"]
+
+    rows = profiling.profile_corpus([Rule("help", "help wanted"), Rule(r"(how|what|why).*\?", "question")], texts,
+                                    probe=False)
+    assert {row['label']: row['matches'] for row in rows} == {'help wanted': 1, 'question': 2}
+
+    table = io.StringIO()
+    profiling.write_report(rows, table)
+    assert table.getvalue().splitlines()[0].split()[:2] == ["total", "ms"]
+    assert len(table.getvalue().splitlines()) == 3
+
+    as_json = io.StringIO()
+    profiling.write_report(rows, as_json, as_json=True)
+    assert json.loads(as_json.getvalue()) == rows
@@ -0,0 +1,139 @@
+import pytest
+from gitbot import github_issues_bot
+
+rules = [
+    github_issues_bot.Rule(r"bug\s+[^?]*", "bug"),
+    github_issues_bot.Rule(r"help", "help wanted"),
+    github_issues_bot.Rule(r"(how|what|why).*\?", "question"),
+    github_issues_bot.Rule(r"hel", "overlapping"),
+    github_issues_bot.Rule(r"(a)\1", "backreference"),
+    github_issues_bot.Rule(r"(?P<word>crash)", "named group"),
+    github_issues_bot.Rule(r"^$", "empty"),
+    github_issues_bot.Rule(r".*", "everything"),
+]
+
+texts = [
+    "",
+    "help",
+    "Found a bug in the parser. Why does it crash? Help!",
+    "aa bug report",
+    "nothing special",
+    "HELP, what is this?",
+]
+
+
+@pytest.mark.parametrize('text', texts)
+def test_matches_like_single_rules(text):
+    """
+    Test that the combined rule set finds exactly the rules that match one by one.
+    :param text:
+    :return:
+    """
+    rule_set = github_issues_bot.RuleSet(rules)
+
+    expected = {index for index, rule in enumerate(rules) if rule.check_fits(text)}
+
+    assert rule_set.matching(text) == expected
+
+
+def test_candidates_limit_rules():
+    """
+    Test that only candidate rules are reported.
+    :return:
+    """
+    rule_set = github_issues_bot.RuleSet(rules)
+
+    assert rule_set.matching("help crash", candidates={1, 5}) == {1, 5}
+    assert rule_set.matching("help crash", candidates={0}) == set()
+
+
+class CountingRegex:
+    def __init__(self, regex, searches):
+        self.regex = regex
+        self.pattern = regex.pattern
+        self.flags = regex.flags
+        self.searches = searches
+
+    def search(self, text):
+        self.searches.append(self.regex.pattern)
+        return self.regex.search(text)
+
+
+def test_only_rules_with_present_literals_searched():
+    """
+    Test that rules whose required literals do not occur in the text are not searched at all.
+    :return:
+    """
+    many_rules = [github_issues_bot.Rule("word{}x".format(i), "label{}".format(i)) for i in range(200)]
+    many_rules.append(github_issues_bot.Rule(r"(how|what|why).*\?", "question"))
+
+    searches = []
+    for rule in many_rules:
+        rule.regex = CountingRegex(rule.regex, searches)
+    rule_set = github_issues_bot.RuleSet(many_rules)
+
+    assert rule_set.matching("lorem ipsum " * 100) == set()
+    assert searches == []
+
+    assert rule_set.matching("WORD7X, but WHY?") == {7, 200}
+    assert searches == ["word7x", r"(how|what|why).*\?"]
+
+
+@pytest.mark.parametrize('pattern, literals', [
+    (r"help", ("help",)),
+    (r"bug\s+[^?]*", ("bug",)),
+    (r"(how|what|why).*\?", ("how", "what", "why")),
+    (r"(?:crash)+ed", ("crash",)),
+    (r"error\s+code\s+42\b", ("error",)),
+    (r"(bug)?fix", ("fix",)),
+    (r"a*", None),
+    (r"(foo|.*)bar", ("bar",)),
+    (r"(foo|.*)", None),
+    (r"crash \u03c3\u03bf\u03c6\u03af\u03b1", None),
+])
+def test_required_literals(pattern, literals):
+    """
+    Test that literals every match must contain are found in patterns.
+    :param pattern:
+    :param literals:
+    :return:
+    """
+    assert github_issues_bot.RuleSet._required_literals(github_issues_bot.Rule(pattern, "label")) == literals
+
+
+def test_case_insensitive_unicode_matches():
+    """
+    Test that texts matching only through Unicode case folding are not filtered out.
+    :return:
+    """
+    rule_set = github_issues_bot.RuleSet([github_issues_bot.Rule("kiss", "kiss")])
+
+    assert rule_set.matching("\u212a\u0130\u017fs") == {0}
+    assert rule_set.matching("KISS") == {0}
+
+
+# pairs of characters matching each other case-insensitively, although they differ after str.lower()
+case_folds = [("\u03c3", "\u03c2"), ("\u03a3", "\u03c2"), ("\u00b5", "\u03bc"), ("\u03b8", "\u03d1"),
+              ("\u03b2", "\u03d0"), ("\u03b5", "\u03f5"), ("\u03ba", "\u03f0"), ("\u03c0", "\u03d6"),
+              ("\u03c1", "\u03f1"), ("\u03c6", "\u03d5"), ("\u1e61", "\u1e9b"), ("\ufb05", "\ufb06"),
+              ("\u03b9", "\u0345"), ("k", "\u212a"), ("s", "\u017f"), ("i", "\u0130"), ("I", "\u0131")]
+
+
+@pytest.mark.parametrize('pattern_char, text_char', case_folds + [(b, a) for a, b in case_folds])
+def test_matches_like_regex_with_case_folds(pattern_char, text_char):
+    """
+    Test that rules with non-ASCII literals find the same texts as their regular expressions, also when the text
+    differs from the pattern only by case folding.
+    :param pattern_char:
+    :param text_char:
+    :return:
+    """
+    fold_rules = [github_issues_bot.Rule("x{}y".format(pattern_char), "inner"),
+                  github_issues_bot.Rule(pattern_char, "single"),
+                  github_issues_bot.Rule("(a|{}b)".format(pattern_char), "branch")]
+    rule_set = github_issues_bot.RuleSet(fold_rules)
+
+    for text in ["x{}y".format(text_char), text_char, "{}b".format(text_char), "\u0394 {} \u00e9".format(text_char),
+                 "X{}Y".format(text_char.upper()), "nothing"]:
+        expected = {index for index, rule in enumerate(fold_rules) if rule.regex.search(text)}
+        assert rule_set.matching(text) == expected, text
@@ -0,0 +1,81 @@
+import os
+
+from gitbot import github_issues_bot
+
+
+def write_rules(path, text, mtime):
+    path.write(text)
+    os.utime(str(path), ns=(mtime, mtime))
+
+
+def test_rules_reloaded_on_change(tmpdir, monkeypatch):
+    """
+    Test that rules are swapped in when the file changes and unchanged files are not parsed again.
+    :param tmpdir:
+    :param monkeypatch:
+    :return:
+    """
+    monkeypatch.setattr(github_issues_bot, "rules", [])
+    monkeypatch.setattr(github_issues_bot, "rule_set", github_issues_bot.RuleSet([]))
+    path = tmpdir.join("rules.cfg")
+    write_rules(path, "bug=>bug\n", 1000)
+    manager = github_issues_bot.RulesManager(str(path))
+
+    assert manager.check()
+    first = github_issues_bot.rule_set
+    assert first.labels("a bug") == ["bug"]
+
+    assert not manager.check()
+    write_rules(path, "bug=>bug\n", 2000)
+    assert not manager.check()
+    assert github_issues_bot.rule_set is first
+
+    write_rules(path, "bug=>bug\nhelp=>help wanted\n", 3000)
+    assert manager.check()
+    assert github_issues_bot.rule_set.labels("bug, help!") == ["bug", "help wanted"]
+    assert len(github_issues_bot.rules) == 2
+    assert manager.reloads == 2
+
+
+def test_loaded_rules_not_parsed_again(tmpdir, monkeypatch):
+    """
+    Test that rules loaded by init_rules are not reloaded by the first check, only once the file changes.
+    :param tmpdir:
+    :param monkeypatch:
+    :return:
+    """
+    monkeypatch.setattr(github_issues_bot, "rules", [])
+    monkeypatch.setattr(github_issues_bot, "rule_set", github_issues_bot.RuleSet([]))
+    path = tmpdir.join("rules.cfg")
+    write_rules(path, "bug=>bug\n", 1000)
+    manager = github_issues_bot.RulesManager(github_issues_bot.init_rules(str(path)), loaded=True)
+    loaded = github_issues_bot.rule_set
+
+    assert not manager.check()
+    assert github_issues_bot.rule_set is loaded
+    assert manager.reloads == 0
+
+    write_rules(path, "help=>help wanted\n", 2000)
+    assert manager.check()
+    assert github_issues_bot.rule_set.labels("help!") == ["help wanted"]
+
+
+def test_invalid_rules_keep_current(tmpdir, monkeypatch):
+    """
+    Test that a rules file with an invalid regular expression does not replace the current rules.
+    :param tmpdir:
+    :param monkeypatch:
+    :return:
+    """
+    monkeypatch.setattr(github_issues_bot, "rules", [])
+    monkeypatch.setattr(github_issues_bot, "rule_set", github_issues_bot.RuleSet([]))
+    path = tmpdir.join("rules.cfg")
+    write_rules(path, "bug=>bug\n", 1000)
+    manager = github_issues_bot.RulesManager(str(path))
+    manager.check()
+    current = github_issues_bot.rule_set
+
+    write_rules(path, "bug(=>bug\n", 2000)
+
+    assert not manager.check()
+    assert github_issues_bot.rule_set is current
@@ -0,0 +1,158 @@
+import threading
+
+from gitbot.scheduler import GRAPHQL, RateLimitScheduler, READ, WRITE, priority_of, resource_of
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def rate_headers(remaining, reset, limit=5000):
+    return {'X-RateLimit-Limit': str(limit), 'X-RateLimit-Remaining': str(remaining), 'X-RateLimit-Reset': str(reset)}
+
+
+def test_unknown_budget_not_limited():
+    """
+    Test that requests are sent right away before GitHub told us anything about the budget.
+    :return:
+    """
+    scheduler = RateLimitScheduler(clock=FakeClock())
+    assert scheduler.try_acquire(READ) == 0
+    assert scheduler.try_acquire(WRITE) == 0
+
+
+def test_reserve_kept_for_writes():
+    """
+    Test that reads wait for the reset when only the reserved budget is left, while writes still go.
+    :return:
+    """
+    clock = FakeClock()
+    scheduler = RateLimitScheduler(reserve=10, clock=clock)
+    scheduler.update(200, rate_headers(10, 1100))
+
+    assert scheduler.try_acquire(READ) == 100
+    assert scheduler.try_acquire(WRITE) == 0
+    assert scheduler.remaining == 9
+
+    clock.now = 1100
+    assert scheduler.try_acquire(READ) == 0
+
+
+def test_requests_paced_when_budget_low():
+    """
+    Test that a low budget is spread over the time until reset.
+    :return:
+    """
+    clock = FakeClock()
+    scheduler = RateLimitScheduler(reserve=0, pace_below=0.5, clock=clock)
+    scheduler.update(200, rate_headers(101, 1100, limit=1000))
+
+    assert scheduler.try_acquire(READ) == 0
+    assert scheduler.try_acquire(READ) == 1.0
+
+    clock.now = 1001
+    assert scheduler.try_acquire(READ) == 0
+
+
+def test_retry_after_pauses_requests():
+    """
+    Test that a secondary rate limit response pauses requests for the time GitHub asks for.
+    :return:
+    """
+    clock = FakeClock()
+    scheduler = RateLimitScheduler(clock=clock)
+
+    assert scheduler.update(403, {'Retry-After': '30'}, "You have exceeded a secondary rate limit.")
+    assert scheduler.try_acquire(WRITE) == 30
+
+    clock.now = 1030
+    assert not scheduler.update(200, rate_headers(4000, 2000))
+    assert scheduler.try_acquire(READ) == 0
+
+
+def test_exhausted_budget_pauses_requests():
+    """
+    Test that a 403 response reporting no remaining requests pauses requests until the known reset, even when it does
+    not repeat the time of the reset.
+    :return:
+    """
+    clock = FakeClock()
+    scheduler = RateLimitScheduler(clock=clock)
+    scheduler.update(200, rate_headers(1, 1100))
+
+    assert scheduler.update(403, {'X-RateLimit-Remaining': '0'}, "API rate limit exceeded.")
+    assert scheduler.remaining == 0
+    assert scheduler.try_acquire(WRITE) == 100
+
+
+def test_budgets_kept_per_resource():
+    """
+    Test that responses to GraphQL queries update the graphql budget only, and an exhausted graphql budget does not
+    hold back other requests.
+    :return:
+    """
+    clock = FakeClock()
+    scheduler = RateLimitScheduler(clock=clock)
+    scheduler.update(200, rate_headers(4000, 2000))
+
+    headers = dict(rate_headers(0, 1100), **{'X-RateLimit-Resource': GRAPHQL})
+    assert scheduler.update(403, headers, "API rate limit exceeded.")
+
+    assert scheduler.remaining == 4000
+    assert scheduler.rate_limits()[GRAPHQL].remaining == 0
+    assert scheduler.try_acquire(READ, GRAPHQL) == 100
+    assert scheduler.try_acquire(READ) == 0
+
+
+def test_graphql_queries_are_reads():
+    """
+    Test that GraphQL queries, sent with POST, are scheduled as reads against the graphql budget.
+    :return:
+    """
+    assert priority_of('POST', 'https://api.github.com/graphql') == READ
+    assert resource_of('https://api.github.com/graphql') == GRAPHQL
+    assert priority_of('POST', 'https://api.github.com/repos/melkamar/test/issues/1/labels') == WRITE
+    assert resource_of('https://api.github.com/repos/melkamar/test/issues') == 'core'
+
+
+def test_secondary_limit_backoff_grows():
+    """
+    Test that secondary rate limits without Retry-After back off exponentially.
+    :return:
+    """
+    clock = FakeClock()
+    scheduler = RateLimitScheduler(clock=clock)
+
+    assert scheduler.update(403, {}, "You have exceeded a secondary rate limit.")
+    assert scheduler.paused_until == 1060
+    clock.now = 1060
+    assert scheduler.update(403, {}, "You have exceeded a secondary rate limit.")
+    assert scheduler.paused_until == 1180
+
+
+def test_waiting_writes_hold_back_reads():
+    """
+    Test that reads are not sent while a write waits for its slot.
+    :return:
+    """
+    clock = FakeClock()
+    scheduler = RateLimitScheduler(clock=clock)
+    scheduler.paused_until = 1010
+
+    writer = threading.Thread(target=scheduler.acquire, args=(WRITE,))
+    writer.start()
+    while not scheduler._waiting[WRITE]:
+        pass
+
+    clock.now = 1010
+    assert scheduler.try_acquire(READ) is None
+
+    with scheduler._condition:
+        scheduler._condition.notify_all()
+    writer.join(5)
+    assert not writer.is_alive()
+    assert scheduler.try_acquire(READ) == 0
@@ -0,0 +1,48 @@
+import pytest
+
+from gitbot import serving
+
+
+def test_gunicorn_options():
+    """
+    Test that gunicorn runs threaded workers, each initialized after it is forked.
+    :return:
+    """
+    initialized = []
+    options = serving.gunicorn_options("127.0.0.1", 8000, 4, 16, lambda: initialized.append(True))
+
+    assert options['bind'] == "127.0.0.1:8000"
+    assert options['workers'] == 4
+    assert options['threads'] == 16
+    assert options['worker_class'] == 'gthread'
+    assert not options['preload_app']
+
+    options['post_worker_init'](object())
+    assert initialized == [True]
+
+
+@pytest.mark.parametrize('server', ['flask', 'waitress'])
+def test_single_process_servers(server):
+    """
+    Test that servers other than gunicorn refuse to run more processes.
+    :param server:
+    :return:
+    """
+    with pytest.raises(ValueError):
+        serving.serve(None, server, processes=2)
+
+
+def test_unknown_server():
+    with pytest.raises(ValueError):
+        serving.serve(None, 'apache')
+
+
+def test_missing_server(monkeypatch):
+    """
+    Test that a server which is not installed is reported with a hint how to install it.
+    :param monkeypatch:
+    :return:
+    """
+    monkeypatch.setattr(serving, 'waitress', None)
+    with pytest.raises(RuntimeError, match=r"gitbot\[server\]"):
+        serving.serve(None, 'waitress')
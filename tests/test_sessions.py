@@ -0,0 +1,125 @@
+import threading
+
+from gitbot import github_issues_bot
+from gitbot.sessions import SessionManager
+
+
+class FakeSession:
+    def __init__(self, token, pool_size):
+        self.token = token
+        self.pool_size = pool_size
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_one_session_per_token():
+    """
+    Test that a session is created once per token and then reused, also from other threads.
+    :return:
+    """
+    manager = SessionManager(FakeSession)
+    seen = []
+
+    def get():
+        seen.append(manager.get('token-a'))
+
+    threads = [threading.Thread(target=get) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len({id(session) for session in seen}) == 1
+    assert manager.get('token-b') is not manager.get('token-a')
+    assert len(manager) == 2
+
+
+def test_larger_pool_replaces_session():
+    """
+    Test that asking for a larger connection pool replaces the session.
+    :return:
+    """
+    manager = SessionManager(FakeSession, pool_size=10)
+    session = manager.get('token')
+
+    assert manager.get('token', 5) is session
+    bigger = manager.get('token', 20)
+    assert bigger is not session
+    assert session.closed
+    assert bigger.pool_size == 20
+
+
+def test_default_pool_keeps_session():
+    """
+    Test that asking for a session without a pool size keeps an existing session with any pool, even a smaller one
+    than the default.
+    :return:
+    """
+    manager = SessionManager(FakeSession, pool_size=10)
+    session = manager.get('token', 4)
+
+    assert manager.get('token') is session
+    assert not session.closed
+    assert manager.get('other').pool_size == 10
+
+
+def test_idle_sessions_evicted():
+    """
+    Test that sessions not used for the idle timeout are closed.
+    :return:
+    """
+    clock = FakeClock()
+    manager = SessionManager(FakeSession, idle_timeout=60, clock=clock)
+    old = manager.get('old')
+    clock.now = 30
+    manager.get('new')
+    clock.now = 70
+
+    manager.get('new')
+
+    assert old.closed
+    assert len(manager) == 1
+
+
+def test_init_session_reuses_connections(monkeypatch):
+    """
+    Test that repeated init_session calls with the same token share one session.
+    :param monkeypatch:
+    :return:
+    """
+    monkeypatch.setattr(github_issues_bot, "sessions", SessionManager(github_issues_bot.create_session))
+
+    github_issues_bot.init_session("token")
+    first = github_issues_bot.current_session()
+    github_issues_bot.init_session("token")
+
+    assert github_issues_bot.current_session() is first
+    assert first.headers['Authorization'] == 'token token'
+
+
+def test_init_session_keeps_pool_size(monkeypatch):
+    """
+    Test that init_session without a pool size (as called by process_issues) keeps the session created with a pool
+    for all workers by process_repositories.
+    :param monkeypatch:
+    :return:
+    """
+    monkeypatch.setattr(github_issues_bot, "sessions", SessionManager(FakeSession))
+
+    github_issues_bot.init_session("token", pool_size=4)
+    pooled = github_issues_bot.current_session()
+    github_issues_bot.init_session("token")
+
+    assert github_issues_bot.current_session() is pooled
+    assert not pooled.closed
+    assert pooled.pool_size == 4
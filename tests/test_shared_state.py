@@ -0,0 +1,112 @@
+import multiprocessing
+
+import pytest
+
+from gitbot.shared_state import SharedDeliveryLog, SharedResponseCache
+
+
+def record_deliveries(filename, ids):
+    delivery_log = SharedDeliveryLog(filename)
+    return [delivery_id for delivery_id in ids if not delivery_log.seen(delivery_id)]
+
+
+def test_delivery_seen_by_other_instance(tmpdir):
+    """
+    Test that a delivery id recorded by one log is seen by another log of the same file, as by another process.
+    :param tmpdir:
+    :return:
+    """
+    filename = str(tmpdir.join("state.sqlite"))
+    first, second = SharedDeliveryLog(filename), SharedDeliveryLog(filename)
+
+    assert not first.seen('a')
+    assert second.seen('a')
+    assert not second.seen('b')
+    assert first.seen('b')
+    assert len(first) == 2
+
+
+def test_forgotten_delivery_accepted_again(tmpdir):
+    """
+    Test that a forgotten delivery id is not seen by other instances any more.
+    :param tmpdir:
+    :return:
+    """
+    filename = str(tmpdir.join("state.sqlite"))
+    first, second = SharedDeliveryLog(filename), SharedDeliveryLog(filename)
+
+    assert not first.seen('a')
+    first.forget('a')
+    assert not second.seen('a')
+    assert first.seen('a')
+
+
+def test_delivery_log_trimmed(tmpdir):
+    """
+    Test that only the last max_size ids are kept.
+    :param tmpdir:
+    :return:
+    """
+    delivery_log = SharedDeliveryLog(str(tmpdir.join("state.sqlite")), max_size=50)
+
+    for number in range(300):
+        assert not delivery_log.seen(str(number))
+
+    assert len(delivery_log) < 150
+    assert delivery_log.seen('299')
+    assert not delivery_log.seen('0')
+
+
+@pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason="Needs fork()")
+def test_delivery_recorded_once_by_processes(tmpdir):
+    """
+    Test that every delivery id received by several processes at once is reported as new by exactly one of them,
+    also when the log was used by the parent process before the fork.
+    :param tmpdir:
+    :return:
+    """
+    filename = str(tmpdir.join("state.sqlite"))
+    assert not SharedDeliveryLog(filename).seen('parent')
+
+    ids = [str(number) for number in range(200)] + ['parent']
+    with multiprocessing.get_context('fork').Pool(4) as pool:
+        results = pool.starmap(record_deliveries, [(filename, ids)] * 4)
+
+    new_ids = [delivery_id for result in results for delivery_id in result]
+    assert sorted(new_ids) == sorted(ids[:-1])
+
+
+def test_response_cache_shared(tmpdir):
+    """
+    Test that a response put into one cache is served by another cache of the same file.
+    :param tmpdir:
+    :return:
+    """
+    filename = str(tmpdir.join("state.sqlite"))
+    first, second = SharedResponseCache(filename), SharedResponseCache(filename)
+    key = SharedResponseCache.key("https://api.github.com/repos/melkamar/test/issues", "token abc")
+    entry = {'etag': '"abc"', 'last_modified': None, 'link': None, 'status': 200, 'payload': [{'number': 1}]}
+
+    assert second.get(key) is None
+    first.put(key, entry)
+    assert second.get(key) == entry
+    assert len(second) == 1
+
+
+def test_response_cache_evicts_least_recently_used(tmpdir):
+    """
+    Test that the cache keeps max_entries URLs, evicting those least recently used.
+    :param tmpdir:
+    :return:
+    """
+    cache = SharedResponseCache(str(tmpdir.join("state.sqlite")), max_entries=2)
+
+    cache.put('a', {'payload': 'a'})
+    cache.put('b', {'payload': 'b'})
+    assert cache.get('a') == {'payload': 'a'}
+    cache.put('c', {'payload': 'c'})
+
+    assert len(cache) == 2
+    assert cache.get('b') is None
+    assert cache.get('a') == {'payload': 'a'}
+    assert cache.get('c') == {'payload': 'c'}
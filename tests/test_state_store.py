@@ -0,0 +1,102 @@
+from gitbot import github_issues_bot
+from gitbot.state_store import IssueStateStore, state_digest
+
+
+def make_issue(number, updated_at="2016-10-31T17:07:55Z"):
+    return github_issues_bot.Issue("<url>", "<url>", [], True, "Title", "Body", number, "melkamar/test",
+                                   updated_at=updated_at)
+
+
+def test_issue_state(tmpdir):
+    """
+    Test that an issue is current only with the same updated_at and digest, and that the state survives a restart.
+    :param tmpdir:
+    :return:
+    """
+    filename = str(tmpdir.join("state.sqlite"))
+    store = IssueStateStore(filename)
+    issue = make_issue(1)
+
+    assert not store.is_current(issue, "digest")
+    store.record(issue, "digest", ["bug"])
+    store.close()
+
+    store = IssueStateStore(filename)
+    assert store.is_current(issue, "digest")
+    assert store.get(issue)['labels'] == ["bug"]
+    assert not store.is_current(issue, "other digest")
+    assert not store.is_current(make_issue(1, "2016-11-01T10:00:00Z"), "digest")
+
+    store.forget(issue)
+    assert not store.is_current(issue, "digest")
+
+
+def test_state_digest():
+    """
+    Test that the digest changes with rules and options.
+    :return:
+    """
+    rules = [github_issues_bot.Rule("bug", "bug")]
+
+    assert state_digest(rules, default_label="") == state_digest([github_issues_bot.Rule("bug", "bug")],
+                                                                 default_label="")
+    assert state_digest(rules, default_label="") != state_digest(rules, default_label="triage")
+    assert state_digest(rules) != state_digest([github_issues_bot.Rule("bug", "defect")])
+
+
+def test_rule_set_digest_includes_match_guard():
+    """
+    Test that the digest of a rule set changes with the limits of its match guard, and that no guard and a guard
+    without limits give the same digest.
+    :return:
+    """
+    rules = [github_issues_bot.Rule("bug", "bug")]
+    digest = github_issues_bot.RuleSet(rules).digest(default_label="")
+
+    assert github_issues_bot.RuleSet(rules, github_issues_bot.MatchGuard()).digest(default_label="") == digest
+    assert github_issues_bot.RuleSet(rules, github_issues_bot.MatchGuard(100)).digest(default_label="") != digest
+
+
+def test_rules_changed():
+    """
+    Test that a change of the digest is reported once.
+    :return:
+    """
+    store = IssueStateStore()
+
+    assert not store.rules_changed("a")
+    assert not store.rules_changed("a")
+    assert store.rules_changed("b")
+    assert not store.rules_changed("b")
+
+
+def test_process_issues_skips_unchanged(monkeypatch):
+    """
+    Test that process_issues processes only new or updated issues and all of them after the options change.
+    :param monkeypatch:
+    :return:
+    """
+    issues = [make_issue(number) for number in range(3)]
+    processed = []
+
+    def fake_process_issue(issue, *args, **kwargs):
+        processed.append(issue.number)
+        return []
+
+    monkeypatch.setattr(github_issues_bot, "fetch_issues", lambda *args, **kwargs: iter(issues))
+    monkeypatch.setattr(github_issues_bot, "process_issue", fake_process_issue)
+    store = IssueStateStore()
+
+    github_issues_bot.process_issues("token", "melkamar/test", state_store=store)
+    assert processed == [0, 1, 2]
+
+    summary = github_issues_bot.process_issues("token", "melkamar/test", state_store=store)
+    assert processed == [0, 1, 2]
+    assert summary['skipped'] == 3
+
+    issues[1] = make_issue(1, "2016-11-01T10:00:00Z")
+    github_issues_bot.process_issues("token", "melkamar/test", state_store=store)
+    assert processed == [0, 1, 2, 1]
+
+    github_issues_bot.process_issues("token", "melkamar/test", default_label="triage", state_store=store)
+    assert processed == [0, 1, 2, 1, 0, 1, 2]
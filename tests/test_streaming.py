@@ -0,0 +1,76 @@
+import json
+
+import pytest
+import requests
+
+from gitbot import streaming
+from gitbot.http_cache import CachedResponse
+
+payload = [{"title": "Crash, [again] {sigh}", "body": "quote \" and backslash \\ and \U0001F41B", "labels": []},
+           {"title": "Second", "body": None, "comments": [1, {"x": [2, 3]}]},
+           42, "text", None, [], {}]
+
+
+def chunked(data, size):
+    return [data[start:start + size] for start in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 7, 64, 100000])
+def test_iter_array_chunked(size):
+    """
+    Test that an array is parsed the same as with json.loads no matter where chunks (even within UTF-8 sequences
+    and escapes) are split.
+    :param size:
+    :return:
+    """
+    encoded = json.dumps(payload, indent=1).encode("utf-8")
+    assert list(streaming.iter_array(chunked(encoded, size))) == payload
+
+    encoded = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    assert list(streaming.iter_array(chunked(encoded, size))) == payload
+
+
+def test_elements_yielded_as_they_complete():
+    """
+    Test that an element is returned as soon as its text is complete, before the array ends, and that a number is
+    returned only once the text following it shows it is complete.
+    :return:
+    """
+    parser = streaming.ArrayParser()
+
+    assert parser.feed(' [ {"number": 1}') == [{"number": 1}]
+    assert parser.feed(', {"number"') == []
+    assert parser.feed(': 2}, 3') == [{"number": 2}]
+    assert parser.feed('4 ]') == [34]
+    assert parser.close() == []
+
+
+@pytest.mark.parametrize('text', ['[]', ' [ ] '])
+def test_empty_array(text):
+    """
+    Test that an empty array has no elements.
+    :param text:
+    :return:
+    """
+    assert list(streaming.iter_array([text.encode()])) == []
+
+
+@pytest.mark.parametrize('text', ['{"message": "Not Found"}', 'null', '', '[{"a": 1}', '[1,]', '[1,,2]', 'x[1]'])
+def test_invalid_array(text):
+    """
+    Test that texts that are not complete JSON arrays are refused.
+    :param text:
+    :return:
+    """
+    with pytest.raises(ValueError):
+        list(streaming.iter_array([text.encode()]))
+
+
+def test_cached_response_payload_used():
+    """
+    Test that the payload of a cached response is used without reading its content again.
+    :return:
+    """
+    response = CachedResponse(requests.Response(), payload, from_cache=True)
+
+    assert list(streaming.iter_response(response)) == payload
@@ -99,6 +99,118 @@ def test_callback_right_secret(test_flask_app):
     data = response.data.decode('utf-8')
     print(response.status_code)
     print(data)
-    assert response.status_code == 200
+    assert response.status_code == 202
     assert json.loads(data)['code'] == 5
     assert json.loads(data)['issue_number'] == 27
+
+
+def test_queue_route(test_flask_app):
+    """
+    Test that the state of the work queue is reported.
+    :param test_flask_app:
+    :return:
+    """
+    response = test_flask_app.get('/queue')
+    data = json.loads(response.data.decode('utf-8'))
+    assert response.status_code == 200
+    assert data['depth'] == 0
+    assert 'wait_seconds_avg' in data
+
+
+def test_callback_redelivery_ignored(test_flask_app):
+    """
+    Test that a webhook delivered again with the same delivery id is not processed twice.
+    :param test_flask_app:
+    :return:
+    """
+    headers = {'X-Hub-Signature': 'sha1=a23236860fd3bd42091bf4a249683ef20aed4cbf',
+               'X-GitHub-Delivery': '72d3162e-cc78-11e3-81ab-4c9367dc0958'}
+
+    response = test_flask_app.post('/callback', headers=headers, data=contents_new_issue)
+    assert response.status_code == 202
+    assert json.loads(response.data.decode('utf-8'))['code'] == 5
+
+    response = test_flask_app.post('/callback', headers=headers, data=contents_new_issue)
+    assert response.status_code == 200
+    assert json.loads(response.data.decode('utf-8'))['code'] == 7
+
+
+def test_callback_redelivery_after_full_queue(test_flask_app, monkeypatch):
+    """
+    Test that a delivery refused because the queue was full is accepted when GitHub redelivers it.
+    :param test_flask_app:
+    :param monkeypatch:
+    :return:
+    """
+    from gitbot import web_listener
+    from gitbot.work_queue import WorkQueue
+    headers = {'X-Hub-Signature': 'sha1=a23236860fd3bd42091bf4a249683ef20aed4cbf',
+               'X-GitHub-Delivery': '9e3b1a64-cc79-11e3-81ab-4c9367dc0958'}
+    queued = []
+    monkeypatch.setitem(web_listener.app.config, 'TESTING', False)
+    monkeypatch.setattr(web_listener, 'get_work_queue', lambda: WorkQueue(None))
+    monkeypatch.setattr(web_listener, 'queue_issue', lambda issue: False)
+
+    response = test_flask_app.post('/callback', headers=headers, data=contents_new_issue)
+    assert response.status_code == 503
+
+    def queue_issue(issue):
+        queued.append(issue)
+        return True
+
+    monkeypatch.setattr(web_listener, 'queue_issue', queue_issue)
+    response = test_flask_app.post('/callback', headers=headers, data=contents_new_issue)
+    assert response.status_code == 202
+    assert [issue.number for issue in queued] == [27]
+
+
+def test_callback_redelivery_shared(test_flask_app, tmpdir):
+    """
+    Test that with a state file, a delivery received by one worker process is seen by the others.
+    :param test_flask_app:
+    :param tmpdir:
+    :return:
+    """
+    from gitbot import github_issues_bot, web_listener
+    from gitbot.shared_state import SharedDeliveryLog, SharedResponseCache
+    filename = str(tmpdir.join("web_state.sqlite"))
+    headers = {'X-Hub-Signature': 'sha1=a23236860fd3bd42091bf4a249683ef20aed4cbf',
+               'X-GitHub-Delivery': '0b6f1d5c-cc79-11e3-81ab-4c9367dc0958'}
+
+    web_listener.init_state(filename)
+    try:
+        assert isinstance(github_issues_bot.response_cache, SharedResponseCache)
+        response = test_flask_app.post('/callback', headers=headers, data=contents_new_issue)
+        assert json.loads(response.data.decode('utf-8'))['code'] == 5
+    finally:
+        web_listener.init_state(cache_size=0)
+
+    assert github_issues_bot.response_cache is None
+    assert SharedDeliveryLog(filename).seen(headers['X-GitHub-Delivery'])
+
+
+def test_metrics_route(test_flask_app):
+    """
+    Test that the metrics route reports metrics in the Prometheus text format.
+    :param test_flask_app:
+    :return:
+    """
+    response = test_flask_app.get('/metrics')
+    data = response.data.decode('utf-8')
+    assert response.status_code == 200
+    assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+    assert '# TYPE gitbot_comment_store_hit_ratio gauge' in data
+
+
+def test_rules_route(test_flask_app):
+    """
+    Test that the rules route reports statistics of every rule as JSON.
+    :param test_flask_app:
+    :return:
+    """
+    from gitbot import github_issues_bot
+    response = test_flask_app.get('/rules')
+    rows = json.loads(response.data.decode('utf-8'))
+    assert response.status_code == 200
+    assert len(rows) == len(github_issues_bot.rule_set)
+    assert all('max_seconds' in row for row in rows)
@@ -0,0 +1,152 @@
+import queue
+import threading
+
+import pytest
+
+from gitbot.work_queue import WorkQueue, Coalescer, DeliveryLog
+
+
+def test_items_processed_by_workers():
+    """
+    Test that all queued items are handed to the handler and counted.
+    :return:
+    """
+    handled = []
+    work_queue = WorkQueue(handled.append, workers=3, max_size=10)
+
+    for item in range(10):
+        assert work_queue.put(item)
+    work_queue.join()
+
+    stats = work_queue.stats()
+    assert sorted(handled) == list(range(10))
+    assert stats['processed'] == 10
+    assert stats['depth'] == 0
+    assert stats['failed'] == 0
+
+
+def test_full_queue_rejects():
+    """
+    Test that items are rejected, not blocked on, when the queue is full.
+    :return:
+    """
+    release = threading.Event()
+    work_queue = WorkQueue(lambda item: release.wait(5), workers=1, max_size=1)
+
+    assert work_queue.put(1)
+    results = [work_queue.put(item) for item in range(2, 5)]
+    release.set()
+    work_queue.join()
+
+    assert False in results
+    assert work_queue.stats()['rejected'] == results.count(False)
+
+
+def test_failures_counted():
+    """
+    Test that a failing handler does not stop the worker.
+    :return:
+    """
+    def handler(item):
+        if item == 1:
+            raise ValueError("failure")
+
+    work_queue = WorkQueue(handler, workers=1)
+    work_queue.put(1)
+    work_queue.put(2)
+    work_queue.join()
+
+    assert work_queue.stats()['processed'] == 2
+    assert work_queue.stats()['failed'] == 1
+
+
+def test_coalescer_folds_items_in_window():
+    """
+    Test that items with the same key arriving within the window are folded into the newest one.
+    :return:
+    """
+    output = []
+    flushed = threading.Event()
+
+    def collect(item):
+        output.append(item)
+        if len(output) == 2:
+            flushed.set()
+
+    coalescer = Coalescer(collect, window=0.2, is_newer=lambda item, other: item[1] > other[1])
+
+    assert coalescer.add(('repo', 1), ('repo', 1))
+    assert not coalescer.add(('repo', 1), ('repo', 3))
+    assert not coalescer.add(('repo', 1), ('repo', 2))
+    assert coalescer.add(('repo', 2), ('other', 1))
+
+    assert flushed.wait(5)
+    assert sorted(output) == [('other', 1), ('repo', 3)]
+    assert coalescer.coalesced == 2
+    assert coalescer.depth() == 0
+
+
+def test_coalescer_bounded():
+    """
+    Test that no more than max_size keys wait in the coalescer, while items of waiting keys are still folded.
+    :return:
+    """
+    coalescer = Coalescer(lambda item: True, window=60, max_size=2)
+
+    assert coalescer.add(('repo', 1), 1)
+    assert coalescer.add(('repo', 2), 2)
+    with pytest.raises(queue.Full):
+        coalescer.add(('repo', 3), 3)
+    assert not coalescer.add(('repo', 1), 4)
+    assert ('repo', 1) in coalescer
+    assert coalescer.depth() == 2
+
+
+def test_coalescer_retries_refused_items():
+    """
+    Test that an item refused by the output is passed on again after another window instead of being dropped.
+    :return:
+    """
+    attempts = []
+    passed = threading.Event()
+
+    def output(item):
+        attempts.append(item)
+        if len(attempts) < 3:
+            return False
+        passed.set()
+        return True
+
+    coalescer = Coalescer(output, window=0.05)
+    coalescer.add(('repo', 1), 'item')
+
+    assert passed.wait(5)
+    assert attempts == ['item'] * 3
+    assert coalescer.depth() == 0
+
+
+def test_delivery_log_detects_redelivery():
+    """
+    Test that a delivery id is reported as seen the second time, and that old ids are forgotten.
+    :return:
+    """
+    delivery_log = DeliveryLog(max_size=2)
+
+    assert not delivery_log.seen('a')
+    assert delivery_log.seen('a')
+    assert not delivery_log.seen('b')
+    assert not delivery_log.seen('c')
+    assert not delivery_log.seen('a')
+
+
+def test_delivery_log_forget():
+    """
+    Test that a forgotten delivery id is not reported as seen.
+    :return:
+    """
+    delivery_log = DeliveryLog()
+
+    assert not delivery_log.seen('a')
+    delivery_log.forget('a')
+    assert not delivery_log.seen('a')
+    assert delivery_log.seen('a')